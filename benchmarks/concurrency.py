@@ -0,0 +1,53 @@
+"""
+Бенчмарк конкурентности /chat: показывает, что пропускная способность растёт
+с числом одновременных запросов, если пайплайн не блокирует event loop.
+
+Запуск:
+    uv run python -m benchmarks.concurrency --requests 64 --llm-latency 0.2
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from unittest.mock import patch
+
+from benchmarks.fakes import FakeChatModel, FakeRetriever
+from src.core.agent import SupportAgent
+
+
+async def run_level(agent: SupportAgent, total: int, concurrency: int) -> float:
+    """Прогоняет total первых сообщений с заданной конкурентностью и возвращает RPS."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            await agent.handle_message(str(uuid.uuid4()), "Как восстановить аннулированный чек?")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--retrieval-latency", type=float, default=0.05)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    llm = FakeChatModel(latency=args.llm_latency)
+    with patch("src.scenario.nodes.get_llm", return_value=llm):
+        agent = SupportAgent(FakeRetriever(latency=args.retrieval_latency))
+        agent.llm = llm
+
+        baseline = None
+        print(f"{'in-flight':>10} {'rps':>10} {'speedup':>10}")
+        for level in args.levels:
+            rps = await run_level(agent, args.requests, level)
+            baseline = baseline or rps
+            print(f"{level:>10} {rps:>10.2f} {rps / baseline:>9.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
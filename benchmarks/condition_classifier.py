@@ -0,0 +1,150 @@
+"""
+Калибровка локального классификатора условий сценария на размеченных сообщениях.
+
+Для if-ноды сценария (по умолчанию - первой, условие которой зависит только от сообщения)
+сообщения прогоняются через ConditionClassifier с моделью эмбеддингов из настроек при
+разных значениях margin (с примерами "нет") или порогов yes/no (без них). Для каждого
+значения - доля решённых локально сообщений (coverage), точность локальных решений и
+число ложных "да" и ложных "нет"; неуверенные сообщения ушли бы в LLM и в ошибки не входят.
+В конце печатается наименьший margin, при котором ложных "да" нет, а точность не ниже
+--target-accuracy. Включать ONLINESHOPRAG__CONDITION_CLASSIFIER_ENABLED стоит только
+с порогами, подобранными этим отчётом на той модели эмбеддингов, что работает в проде.
+
+Встроенная разметка - сообщения про день рождения, которых нет среди examples сценария.
+Свою можно передать JSONL-файлом со строками {"message": ..., "label": true/false}.
+
+Запуск:
+    uv run python -m benchmarks.condition_classifier --margins 0.05 0.1 0.15 0.2 0.25
+"""
+import argparse
+import asyncio
+import json
+
+import numpy as np
+
+from benchmarks import fakes  # noqa: F401  (задаёт LLM API key по умолчанию)
+from src.rag.embeddings import create_embedding_model
+from src.scenario.classifier import ConditionClassifier
+from src.scenario.runner import ScenarioRunner
+from src.settings import settings
+
+# (сообщение, выполнено ли условие "Пользователь написал в чат что у него сегодня день рождения")
+LABELED_MESSAGES = [
+    ("Здравствуйте, сегодня у меня день рождения, есть ли подарок?", True),
+    ("Сегодня мой ДР, хочу узнать про бонусы", True),
+    ("У меня сегодня праздник - день рождения!", True),
+    ("Мне сегодня 25, поздравьте меня)", True),
+    ("Добрый день. Сегодня я родился 40 лет назад. Подскажите, как вывести деньги?", True),
+    ("днюха у меня сегодня", True),
+    ("Сегодня отмечаю свой день рождения", True),
+    ("Привет! Я сегодня именинница. Не могу привязать карту", True),
+    ("У меня сегодня день рождения, а акт так и не пришёл", True),
+    ("Сегодня мне исполняется 18", True),
+    ("Всем привет, у меня сегодня ДР", True),
+    ("Сегодня 12 мая, это мой день рождения", True),
+    ("Как вывести деньги из копилки?", False),
+    ("Пришёл акт с неверной суммой", False),
+    ("Какие бонусы положены на день рождения?", False),
+    ("День рождения у меня был вчера, бонусы начислите?", False),
+    ("У меня день рождения через неделю", False),
+    ("Сегодня день рождения у жены, что подарить?", False),
+    ("У мамы сегодня юбилей", False),
+    ("Когда начисляются бонусы за день рождения?", False),
+    ("Мой день рождения 5 июня, запишите пожалуйста", False),
+    ("В прошлом месяце был мой день рождения, а бонусов не было", False),
+    ("Сегодня не могу зайти в приложение", False),
+    ("Хочу расторгнуть договор", False),
+    ("Сегодня пришла выплата не полностью", False),
+    ("Будет ли подарок, если день рождения в выходные?", False),
+    ("Завтра мне исполнится 30, начислите бонусы заранее", False),
+    ("Поздравляю вас с днём рождения компании!", False),
+    ("Сегодня у сына день рождения. Как добавить аватарку?", False),
+    ("Как поменять номер телефона в Мой налог?", False),
+]
+
+DEFAULT_MARGINS = [0.05, 0.1, 0.15, 0.2, 0.25, 0.3]
+DEFAULT_THRESHOLDS = [(0.7, 0.3), (0.75, 0.35), (0.8, 0.3), (0.85, 0.25)]
+
+
+def load_messages(path: str | None) -> list[tuple[str, bool]]:
+    if path is None:
+        return LABELED_MESSAGES
+    with open(path, encoding="utf-8") as f:
+        return [(row["message"], bool(row["label"])) for row in map(json.loads, f) if row]
+
+
+def evaluate(decisions: list[bool | None], labels: list[bool]) -> dict[str, float]:
+    """Coverage, точность локальных решений, ложные "да" и "нет"."""
+    decided = [(decision, label) for decision, label in zip(decisions, labels) if decision is not None]
+    correct = sum(decision == label for decision, label in decided)
+    return {
+        "coverage": len(decided) / len(labels),
+        "accuracy": correct / len(decided) if decided else 1.0,
+        "false_yes": sum(decision and not label for decision, label in decided),
+        "false_no": sum(label and not decision for decision, label in decided),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--node", default=None, help="id if-ноды сценария (по умолчанию первая)")
+    parser.add_argument("--messages", default=None, help="JSONL с полями message и label")
+    parser.add_argument("--margins", nargs="+", type=float, default=DEFAULT_MARGINS)
+    parser.add_argument("--target-accuracy", type=float, default=0.99)
+    parser.add_argument("--model", default=settings.embedding_model_name)
+    args = parser.parse_args()
+
+    embeddings = create_embedding_model(
+        args.model, settings.embedding_backend, settings.embedding_threads, settings.embedding_onnx_file
+    )
+    classifier = ConditionClassifier(embeddings)
+    runner = ScenarioRunner(classifier=classifier)
+    conditions = runner.plan.message_conditions
+    node_id = args.node or next(iter(conditions))
+    condition = conditions[node_id]
+    messages = load_messages(args.messages)
+    labels = [label for _, label in messages]
+
+    positive, negative = await classifier._get_prototypes(condition)
+    segments = [await classifier._embed_message(message) for message, _ in messages]
+    print(f"Модель {args.model}, нода {node_id}: {condition!r}")
+    print(f"{len(messages)} сообщений, из них {sum(labels)} с выполненным условием")
+
+    if negative is not None:
+        print(f"{'margin':>8} {'coverage':>9} {'accuracy':>9} {'false_yes':>10} {'false_no':>9}")
+        recommended = None
+        for margin in args.margins:
+            classifier.margin = margin
+            result = evaluate([classifier._decide(s, positive, negative) for s in segments], labels)
+            print(
+                f"{margin:>8.2f} {result['coverage']:>9.2f} {result['accuracy']:>9.3f} "
+                f"{result['false_yes']:>10} {result['false_no']:>9}"
+            )
+            if recommended is None and result["false_yes"] == 0 and result["accuracy"] >= args.target_accuracy:
+                recommended = margin
+        # Разброс разницы косинусов по классам помогает понять, насколько разделимы сообщения
+        for label in (True, False):
+            margins = [
+                float(((s @ positive.T).max(axis=1) - (s @ negative.T).max(axis=1)).max())
+                for s, message_label in zip(segments, labels)
+                if message_label == label
+            ]
+            if margins:
+                print(f"label={label}: margin min {min(margins):.3f}, median {np.median(margins):.3f}, max {max(margins):.3f}")
+        if recommended is None:
+            print("Ни один margin не даёт нужной точности без ложных \"да\": оставьте классификатор выключенным")
+        else:
+            print(f"ONLINESHOPRAG__CONDITION_CLASSIFIER_MARGIN={recommended}")
+    else:
+        print(f"{'yes':>6} {'no':>6} {'coverage':>9} {'accuracy':>9} {'false_yes':>10} {'false_no':>9}")
+        for yes_threshold, no_threshold in DEFAULT_THRESHOLDS:
+            classifier.yes_threshold, classifier.no_threshold = yes_threshold, no_threshold
+            result = evaluate([classifier._decide(s, positive, None) for s in segments], labels)
+            print(
+                f"{yes_threshold:>6.2f} {no_threshold:>6.2f} {result['coverage']:>9.2f} {result['accuracy']:>9.3f} "
+                f"{result['false_yes']:>10} {result['false_no']:>9}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
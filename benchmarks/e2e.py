@@ -0,0 +1,341 @@
+"""
+Сквозной нагрузочный бенчмарк /chat и /chat/stream офлайн на CPU.
+
+Приложение src.main запускается в этом же процессе под uvicorn на 127.0.0.1, запросы
+идут настоящим HTTP-клиентом. Внешние сервисы заменены:
+    - LLM - детерминированная модель с задержкой --llm-latency и стримингом по токенам
+      (--token-latency) за настоящим шлюзом LLMGateway;
+    - Qdrant - локальный QdrantClient(":memory:") или путь --qdrant-path, либо NumPy-индекс
+      (--vector-backend numpy);
+    - эмбеддинги - детерминированные фейковые (--embeddings fake) или модель из настроек
+      (--embeddings model, нужна в кэше HuggingFace);
+    - MLflow - файловое хранилище во временной папке.
+При старте индексируется Context.html, замер начинается после /ready.
+
+Трафик - диалоги из нескольких сообщений, сообщения одного диалога идут последовательно,
+--concurrency диалогов одновременно. По умолчанию диалоги синтетические: вопросы - заголовки
+статей Context.html плюс уточняющие реплики. --replay воспроизводит JSONL со строками
+{"conversation_id": ..., "message": ...} (conversation_id необязателен) в порядке файла.
+
+Отчёт по каждому уровню конкурентности: RPS, ошибки, p50/p95/p99 задержки запроса
+на клиенте (и первого токена для --endpoint stream) и этапов агента из turn.timings.
+--output сохраняет результаты в JSON, --baseline сравнивает с сохранённым прогоном.
+
+Запуск:
+    uv run python -m benchmarks.e2e --concurrency 1 8 32 --conversations 64 --output e2e.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import tempfile
+import time
+import uuid
+from typing import Any
+from unittest.mock import patch
+
+import numpy as np
+
+from benchmarks.fakes import FakeChatModel, LocalAsyncQdrant, fake_llm_gateway
+
+FOLLOW_UPS = [
+    "А подробнее?",
+    "Сколько это займёт времени?",
+    "Спасибо, а если не получится?",
+    "Куда написать, если проблема останется?",
+]
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_conversations(count: int, turns: int, seed: int) -> list[list[str]]:
+    """
+    Диалоги из вопросов по базе знаний: первое сообщение - заголовок статьи, дальше
+    вопросы по другим статьям вперемешку с уточнениями.
+
+    Args:
+        count: Число диалогов
+        turns: Сообщений в диалоге
+        seed: Seed генератора
+
+    Returns:
+        list: Сообщения каждого диалога по порядку
+    """
+    from src.rag.chunking import parse_html
+    from src.settings import settings
+
+    questions = [article["source"] for article in parse_html(settings.context_html_file)]
+    rng = random.Random(seed)
+    conversations = []
+    for _ in range(count):
+        messages = [rng.choice(questions)]
+        for _ in range(turns - 1):
+            messages.append(rng.choice(FOLLOW_UPS) if rng.random() < 0.5 else rng.choice(questions))
+        conversations.append(messages)
+    return conversations
+
+
+def replay_conversations(path: str) -> list[list[str]]:
+    """Читает JSONL с трафиком и группирует сообщения по conversation_id в порядке файла."""
+    conversations: dict[str, list[str]] = {}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            conversations.setdefault(str(row.get("conversation_id") or number), []).append(row["message"])
+    return list(conversations.values())
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """p50/p95/p99 в миллисекундах."""
+    if not values:
+        return {}
+    points = np.percentile(np.asarray(values) * 1000, PERCENTILES)
+    return {f"p{q}": round(float(value), 2) for q, value in zip(PERCENTILES, points)}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def send_chat(client, endpoint: str, conversation_id: str, message: str) -> tuple[float, float | None]:
+    """
+    Отправляет одно сообщение.
+
+    Returns:
+        tuple: Задержка ответа и (для стриминга) первого токена в секундах
+    """
+    payload = {"conversation_id": conversation_id, "message": message}
+    started = time.perf_counter()
+    if endpoint == "chat":
+        response = await client.post("/chat", json=payload)
+        response.raise_for_status()
+        return time.perf_counter() - started, None
+
+    first_token = None
+    async with client.stream("POST", "/chat/stream", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line == "event: token" and first_token is None:
+                first_token = time.perf_counter() - started
+            elif line == "event: error":
+                raise RuntimeError("Сервер вернул событие error")
+    return time.perf_counter() - started, first_token
+
+
+async def run_level(
+    client, endpoint: str, conversations: list[list[str]], concurrency: int, stages: list[dict[str, float]]
+) -> dict[str, Any]:
+    """Прогоняет все диалоги с заданным числом одновременных диалогов и собирает метрики."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    first_tokens: list[float] = []
+    errors = 0
+    stages.clear()
+    run_id = uuid.uuid4().hex[:8]
+
+    async def conversation(index: int, messages: list[str]) -> None:
+        nonlocal errors
+        async with semaphore:
+            for message in messages:
+                try:
+                    latency, first_token = await send_chat(client, endpoint, f"e2e-{run_id}-{index}", message)
+                except Exception as e:
+                    errors += 1
+                    logging.getLogger(__name__).warning(f"Запрос завершился ошибкой: {type(e).__name__}: {e}")
+                    continue
+                latencies.append(latency)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(index, messages) for index, messages in enumerate(conversations)))
+    elapsed = time.perf_counter() - started
+
+    stage_values: dict[str, list[float]] = {}
+    for timings in stages:
+        for stage, seconds in timings.items():
+            stage_values.setdefault(stage, []).append(seconds)
+    result = {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {stage: percentiles(values) for stage, values in sorted(stage_values.items())},
+    }
+    if first_tokens:
+        result["first_token_ms"] = percentiles(first_tokens)
+    return result
+
+
+def print_level(result: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    latency = result["latency_ms"]
+    line = (
+        f"concurrency={result['concurrency']}: {result['requests']} запросов, ошибок {result['errors']}, "
+        f"{result['rps']:.1f} RPS, задержка p50/p95/p99 {latency.get('p50', 0):.0f}/{latency.get('p95', 0):.0f}/"
+        f"{latency.get('p99', 0):.0f} мс"
+    )
+    if baseline is not None and baseline.get("rps"):
+        line += (
+            f" (RPS {result['rps'] / baseline['rps'] - 1:+.1%}, "
+            f"p95 {latency.get('p95', 0) - baseline['latency_ms'].get('p95', 0):+.0f} мс к baseline)"
+        )
+    print(line)
+    if "first_token_ms" in result:
+        first_token = result["first_token_ms"]
+        print(f"{'first_token':>26} {first_token['p50']:>9.1f} {first_token['p95']:>9.1f} {first_token['p99']:>9.1f}")
+    for stage, values in result["stages_ms"].items():
+        print(f"{stage:>26} {values['p50']:>9.1f} {values['p95']:>9.1f} {values['p99']:>9.1f}")
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    import httpx
+    import uvicorn
+    from qdrant_client import QdrantClient
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    import src.llm.client
+    from src.settings import settings
+
+    workdir = tempfile.mkdtemp(prefix="e2e-")
+    settings.vector_backend = args.vector_backend
+    settings.numpy_index_path = os.path.join(workdir, "vector_index")
+    settings.bm25_index_path = os.path.join(workdir, "bm25")
+    settings.mlflow_tracking_uri = f"file:{os.path.join(workdir, 'mlruns')}"
+    settings.embedding_server_socket = ""
+    settings.index_on_startup = True
+    if args.embeddings == "fake":
+        # Фейковые векторы случайны относительно смысла: порог dense-поиска снимается, чтобы
+        # dense-ветка и fusion работали как с настоящей моделью
+        settings.min_score = -1.0
+
+    # Все модули получают шлюз LLM при импорте, поэтому подмена - до импорта приложения
+    answer = " ".join(["нет"] + [f"слово{i}" for i in range(args.answer_tokens - 1)])
+    gateway = fake_llm_gateway(FakeChatModel(answer=answer, latency=args.llm_latency, token_latency=args.token_latency))
+    src.llm.client.get_llm = lambda: gateway
+
+    import src.main
+    import src.rag.retriever
+
+    if args.replay:
+        conversations = replay_conversations(args.replay)
+    else:
+        conversations = synthetic_conversations(args.conversations, args.turns, args.seed)
+
+    qdrant = QdrantClient(location=":memory:") if args.qdrant_path is None else QdrantClient(path=args.qdrant_path)
+    patches = [
+        patch("src.rag.vector_store.QdrantClient", lambda **kwargs: qdrant),
+        patch("src.rag.vector_store.AsyncQdrantClient", lambda **kwargs: LocalAsyncQdrant(qdrant)),
+    ]
+    if args.embeddings == "fake":
+        patches.append(
+            patch("src.rag.retriever.create_embedding_model", lambda *a, **kwargs: DeterministicFakeEmbedding(size=384))
+        )
+    for active in patches:
+        active.start()
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(src.main.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120.0, limits=limits) as client:
+            deadline = time.monotonic() + args.startup_timeout
+            while True:
+                try:
+                    response = await client.get("/ready")
+                    if response.status_code == 200:
+                        break
+                    if response.json().get("error"):
+                        raise RuntimeError(f"Приложение не запустилось: {response.json()['error']}")
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Приложение не стало готовым за {args.startup_timeout} с")
+                await asyncio.sleep(0.1)
+            startup = response.json()
+
+            # Тайминги этапов берутся из хода диалога, как в логе агента
+            stages: list[dict[str, float]] = []
+            agent = src.main.agent
+            finish_turn = agent._finish_turn
+
+            async def recording_finish_turn(turn, answer_text):
+                response = await finish_turn(turn, answer_text)
+                stages.append(dict(turn.timings))
+                return response
+
+            agent._finish_turn = recording_finish_turn
+
+            requests_total = sum(map(len, conversations))
+            print(
+                f"Готово за {startup['time_to_ready_seconds']:.2f} с; {len(conversations)} диалогов, {requests_total} "
+                f"сообщений, endpoint={args.endpoint}, embeddings={args.embeddings}, vector_backend={args.vector_backend}"
+            )
+            baseline_levels = {}
+            if args.baseline:
+                with open(args.baseline, encoding="utf-8") as f:
+                    baseline_levels = {level["concurrency"]: level for level in json.load(f)["levels"]}
+
+            print(f"{'этап, мс':>26} {'p50':>9} {'p95':>9} {'p99':>9}")
+            levels = []
+            for concurrency in args.concurrency:
+                result = await run_level(client, args.endpoint, conversations, concurrency, stages)
+                result["llm_gateway"] = gateway.metrics.stats()
+                print_level(result, baseline_levels.get(concurrency))
+                levels.append(result)
+    finally:
+        server.should_exit = True
+        await server_task
+        for active in patches:
+            active.stop()
+
+    return {
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "baseline")
+        },
+        "startup": startup,
+        "levels": levels,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--conversations", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--replay", default=None, help="JSONL с полями conversation_id и message")
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--embeddings", choices=["fake", "model"], default="fake")
+    parser.add_argument("--vector-backend", choices=["qdrant", "numpy"], default="qdrant")
+    parser.add_argument("--qdrant-path", default=None, help="Папка локального Qdrant (по умолчанию в памяти)")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логов приложения")
+    parser.add_argument("--output", default=None, help="Куда сохранить результаты в JSON")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    from src.core.logging_config import setup_logging
+
+    setup_logging()
+    logging.getLogger().setLevel(args.log_level)
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
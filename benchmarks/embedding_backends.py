@@ -0,0 +1,118 @@
+"""
+Бенчмарк бэкендов эмбеддингов на CPU: проверка паритета с эталонной моделью
+PyTorch float32 и замер задержки запроса и пропускной способности индексации.
+
+Паритет: косинус между векторами эталона и бэкенда на чанках Context.html и
+запросах, а также совпадение top-k выдачи по чанкам. Если минимальный косинус
+ниже --min-cosine, скрипт завершается с кодом 1.
+
+Запуск:
+    uv run python -m benchmarks.embedding_backends --backends torch_int8 onnx onnx_int8 --threads 4
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import fakes  # noqa: F401  (задаёт LLM API key по умолчанию)
+from src.rag.chunking import parse_html, split_chunks
+from src.rag.embeddings import create_embedding_model
+from src.settings import settings
+
+QUERIES = [
+    "Как снять деньги с карты?",
+    "Как проверить аннулированные чеки?",
+    "Выплата за приведи друга",
+    "Как восстановить аннулированный чек?",
+    "Где посмотреть реквизиты для платежа?",
+    "Не приходит смс с кодом подтверждения",
+    "Как изменить номер телефона в профиле?",
+    "Сколько идёт возврат денег за товар?",
+]
+
+
+def normalize(vectors: list[list[float]]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def measure(model, texts: list[str], queries: list[str], repeats: int) -> dict:
+    """Считает векторы, задержку одиночного запроса и пропускную способность батча."""
+    model.embed_query("warmup")
+
+    started = time.perf_counter()
+    doc_vectors = model.embed_documents(texts)
+    docs_per_second = len(texts) / (time.perf_counter() - started)
+
+    latencies = []
+    query_vectors = []
+    for _ in range(repeats):
+        query_vectors = []
+        for query in queries:
+            started = time.perf_counter()
+            query_vectors.append(model.embed_query(query))
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "docs": normalize(doc_vectors),
+        "queries": normalize(query_vectors),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "docs_per_second": docs_per_second,
+    }
+
+
+def top_k_overlap(reference: dict, candidate: dict, k: int) -> float:
+    """Доля совпадения top-k чанков по запросам между эталоном и бэкендом."""
+    ref_top = np.argsort(-(reference["queries"] @ reference["docs"].T), axis=1)[:, :k]
+    cand_top = np.argsort(-(candidate["queries"] @ candidate["docs"].T), axis=1)[:, :k]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch_int8", "onnx", "onnx_int8"])
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    args = parser.parse_args()
+
+    texts = [chunk["text"] for chunk in split_chunks(parse_html(settings.context_html_file))]
+    print(f"Модель {settings.embedding_model_name}, {len(texts)} чанков, {len(QUERIES)} запросов, потоков: {args.threads or 'по умолчанию'}")
+
+    reference = measure(
+        create_embedding_model(settings.embedding_model_name, "torch", args.threads), texts, QUERIES, args.repeats
+    )
+    print(f"{'backend':>12} {'p50 ms':>8} {'p95 ms':>8} {'docs/s':>8} {'min cos':>8} {'mean cos':>9} {'top-k':>6}")
+    print(
+        f"{'torch':>12} {reference['p50_ms']:>8.2f} {reference['p95_ms']:>8.2f} "
+        f"{reference['docs_per_second']:>8.1f} {1.0:>8.4f} {1.0:>9.4f} {1.0:>6.2f}"
+    )
+
+    failed = []
+    for backend in args.backends:
+        model = create_embedding_model(settings.embedding_model_name, backend, args.threads)
+        result = measure(model, texts, QUERIES, args.repeats)
+        cosines = np.concatenate(
+            [
+                np.sum(reference["docs"] * result["docs"], axis=1),
+                np.sum(reference["queries"] * result["queries"], axis=1),
+            ]
+        )
+        print(
+            f"{backend:>12} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['docs_per_second']:>8.1f} "
+            f"{cosines.min():>8.4f} {cosines.mean():>9.4f} {top_k_overlap(reference, result, args.k):>6.2f}"
+        )
+        if cosines.min() < args.min_cosine:
+            failed.append(backend)
+
+    if failed:
+        print(f"Паритет не пройден (min cos < {args.min_cosine}): {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+os.environ.setdefault("ONLINESHOPRAG__LLM_API_KEY", "benchmark")
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeChatModel(BaseChatModel):
+    """Детерминированная LLM для бенчмарков: отвечает фиксированным текстом с заданной задержкой.
+
+    latency - задержка до первого токена, token_latency - задержка между токенами при стриминге.
+    """
+
+    answer: str = "нет"
+    latency: float = 0.2
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(
+        self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    async def _astream(
+        self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(self.answer.split(" ")):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token if i == 0 else f" {token}"))
+
+
+class FakeRetriever:
+    """Ретривер-заглушка с задержкой, имитирующей эмбеддинг и поход в Qdrant."""
+
+    def __init__(self, latency: float = 0.05) -> None:
+        self.latency = latency
+        self.kb_version = 0
+        self.embedding_model = DeterministicFakeEmbedding(size=384)
+
+    async def retrieve(
+        self, query: str, timings: dict[str, float] | None = None, query_vector: list[float] | None = None
+    ) -> tuple[str, list[dict[str, Any]]]:
+        await asyncio.sleep(self.latency)
+        if timings is not None:
+            timings["total"] = self.latency
+        return "", []
+
+
+class LocalAsyncQdrant:
+    """Асинхронный интерфейс поверх локального QdrantClient (":memory:" или путь на диске).
+
+    Локальный режим Qdrant не открывает одно хранилище из двух клиентов, поэтому поиск
+    идёт через тот же синхронный клиент, что и индексация. Вызовы выполняются прямо
+    в event loop: на корпусе базы знаний это доли миллисекунды.
+    """
+
+    def __init__(self, client: Any) -> None:
+        self._client = client
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            return attr(*args, **kwargs)
+
+        return call
+
+
+def fake_llm_gateway(model: BaseChatModel):
+    """Шлюз LLM с настройками из settings поверх детерминированной модели (лимиты и метрики как в проде)."""
+    from src.llm.gateway import LLMGateway
+    from src.settings import settings
+
+    return LLMGateway(
+        llm=model,
+        max_in_flight=settings.llm_max_in_flight,
+        max_retries=settings.llm_max_retries,
+        timeout=settings.llm_timeout_seconds,
+        backoff_base=settings.llm_retry_backoff_seconds,
+        backoff_max=settings.llm_retry_backoff_max_seconds,
+    )
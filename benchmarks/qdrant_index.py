@@ -0,0 +1,148 @@
+"""
+Отчёт recall / задержка / память для параметров хранения векторов в Qdrant:
+квантизация (none, scalar, binary), исходные векторы на диске, HNSW m/ef_construct
+и параметры запроса ef/oversampling/rescore.
+
+Recall@k считается относительно точного поиска (exact=True) в той же коллекции.
+Память - оценка RAM под векторы и граф HNSW: float32-векторы (если не on_disk),
+квантованные векторы (int8 - 1 байт, binary - 1 бит на измерение) и связи графа.
+
+Нужен запущенный сервер Qdrant: локальный режим клиента ищет перебором
+и игнорирует квантизацию и HNSW.
+
+Запуск:
+    uv run python -m benchmarks.qdrant_index --qdrant-host localhost --size 100000 --dim 384
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+import uuid
+
+import numpy as np
+from langchain.schema import Document
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.models import CollectionStatus, OptimizersConfigDiff, SearchParams
+
+from benchmarks import fakes  # noqa: F401  (задаёт LLM API key по умолчанию)
+from src.rag.vector_store import QdrantBackend, QdrantIndexConfig
+
+UPSERT_BATCH = 512
+
+STORAGE_CONFIGS = [
+    ("none", False),
+    ("none", True),
+    ("scalar", False),
+    ("scalar", True),
+    ("binary", True),
+]
+
+
+def make_corpus(size: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Кластеризованные векторы: ближе к реальным эмбеддингам, чем равномерный шум."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size)
+    return centers[labels] + 0.5 * rng.standard_normal((size, dim), dtype=np.float32)
+
+
+def estimate_ram_mb(config: QdrantIndexConfig, size: int, dim: int) -> float:
+    """Оценка RAM под векторы и HNSW-граф."""
+    total = 0 if config.on_disk else size * dim * 4
+    if config.quantization == "scalar" and config.quantization_always_ram:
+        total += size * dim
+    elif config.quantization == "binary" and config.quantization_always_ram:
+        total += size * dim / 8
+    # Нулевой слой хранит до 2*m связей по 4 байта, верхние слои дают небольшую добавку
+    total += size * config.hnsw_m * 2 * 4 * 1.1
+    return total / 2**20
+
+
+def wait_indexed(client: QdrantClient, collection_name: str, timeout: float = 600.0) -> None:
+    """Ждёт, пока оптимизатор построит индекс и квантованные векторы."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = client.get_collection(collection_name)
+        if info.status == CollectionStatus.GREEN:
+            return
+        time.sleep(1)
+
+
+async def run_queries(client: AsyncQdrantClient, collection_name: str, queries: np.ndarray, k: int, params) -> tuple[list[float], list[set]]:
+    latencies, results = [], []
+    for query in queries.tolist():
+        started = time.perf_counter()
+        response = await client.query_points(collection_name=collection_name, query=query, limit=k, search_params=params)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append({point.id for point in response.points})
+    return latencies, results
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qdrant-host", default="localhost")
+    parser.add_argument("--qdrant-port", type=int, default=6333)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--hnsw-m", type=int, default=16)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=100)
+    parser.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[1.0, 2.0, 4.0])
+    args = parser.parse_args()
+
+    client = QdrantClient(host=args.qdrant_host, port=args.qdrant_port)
+    async_client = AsyncQdrantClient(host=args.qdrant_host, port=args.qdrant_port)
+    vectors = make_corpus(args.size, args.dim, args.clusters)
+    queries = make_corpus(args.queries, args.dim, args.clusters, seed=1)
+    ids = [str(uuid.uuid4()) for _ in range(args.size)]
+    documents = [Document(page_content="", metadata={}) for _ in range(args.size)]
+
+    print(
+        f"{'quant':>7} {'on_disk':>7} {'ef':>5} {'overs':>6} {'rescore':>7} "
+        f"{'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'RAM MB':>8}"
+    )
+    for quantization, on_disk in STORAGE_CONFIGS:
+        collection_name = f"bench_{quantization}_{'disk' if on_disk else 'ram'}"
+        if client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+        base_config = QdrantIndexConfig(
+            quantization=quantization, on_disk=on_disk, hnsw_m=args.hnsw_m, hnsw_ef_construct=args.hnsw_ef_construct
+        )
+        backend = QdrantBackend(client, async_client, collection_name, with_sparse=False, index_config=base_config)
+        backend.ensure_collection(lambda: args.dim, "synthetic")
+        # Строим HNSW сразу, а не после порога indexing_threshold
+        client.update_collection(collection_name, optimizers_config=OptimizersConfigDiff(indexing_threshold=1000))
+        for start in range(0, args.size, UPSERT_BATCH):
+            end = start + UPSERT_BATCH
+            backend.upsert(ids[start:end], documents[start:end], vectors[start:end].tolist())
+        wait_indexed(client, collection_name)
+
+        _, exact = await run_queries(async_client, collection_name, queries, args.k, SearchParams(exact=True))
+        oversampling_values = args.oversampling if quantization != "none" else [None]
+        rescore_values = [True, False] if quantization != "none" else [True]
+        for ef, oversampling, rescore in itertools.product(args.ef, oversampling_values, rescore_values):
+            config = QdrantIndexConfig(
+                quantization=quantization,
+                on_disk=on_disk,
+                hnsw_m=args.hnsw_m,
+                hnsw_ef_construct=args.hnsw_ef_construct,
+                search_ef=ef,
+                oversampling=oversampling,
+                rescore=rescore,
+            )
+            latencies, results = await run_queries(async_client, collection_name, queries, args.k, config.search_params())
+            recall = statistics.mean(len(got & expected) / args.k for got, expected in zip(results, exact))
+            print(
+                f"{quantization:>7} {str(on_disk):>7} {ef:>5} {oversampling or '-':>6} {str(rescore):>7} "
+                f"{recall:>7.3f} {statistics.median(latencies):>8.2f} {np.percentile(latencies, 95):>8.2f} "
+                f"{estimate_ram_mb(config, args.size, args.dim):>8.1f}"
+            )
+        client.delete_collection(collection_name)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+"""
+Бенчмарк переранжирования cross-encoder'ом: прирост качества против добавленной задержки.
+
+Чанки Context.html индексируются в памяти (dense-эмбеддинги + BM25), кандидаты
+выбираются так же, как в RAGRetriever (min_score для dense, взвешенный RRF), и
+переранжируются одним батчем. Качество - hit@k и MRR@k по размеченным запросам
+(запрос -> source статьи базы знаний), задержка - время одного батча для
+разного числа кандидатов.
+
+Свои размеченные запросы можно передать JSONL-файлом со строками {"query": ..., "source": ...}.
+
+Запуск:
+    uv run python -m benchmarks.rerank --candidates 10 20 40 --k 5
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+from langchain.schema import Document
+
+from benchmarks import fakes  # noqa: F401  (задаёт LLM API key по умолчанию)
+from src.rag.chunking import parse_html, split_chunks
+from src.rag.embeddings import create_embedding_model
+from src.rag.lexical import LexicalIndex
+from src.rag.reranker import CrossEncoderReranker
+from src.rag.retriever import BM25_WEIGHT, DENSE_WEIGHT, weighted_rrf
+from src.settings import settings
+
+# Перефразированные вопросы пользователей и source статьи, которая на них отвечает
+LABELED_QUERIES = [
+    ("Как проверить, аннулирован ли мой чек?", "Подскажите пожалуйста, есть ли у меня аннулированные чеки?"),
+    ("Я поменял реквизиты, отправьте деньги ещё раз", "Указал новые реквизиты, повторите на них платеж"),
+    ("Не получается дать разрешение в Мой налог", 'Не могу выдать права к приложению "Мой налог"'),
+    ("Сколько ждать регистрацию самозанятого в налоговой?", "Налоговая долго не регистрирует СМЗ"),
+    ("Какой телефон указан в приложении налоговой?", 'Какой номер используется в приложении "Мой налог"'),
+    ("Нужна выгрузка актов за прошлый месяц", "Выгрузка выплат/актов за определенный период времени"),
+    ("Где мои 1000 рублей за карту Альфы?", "Если спрашивают про 1000 рублей за оформление карты АльфаБанка"),
+    ("Я ИП на упрощёнке, могу у вас работать?", "ИП на УСН"),
+    ("Можно получить деньги заранее?", "Хочу аванс / не пришел аванс / хочу больше дене"),
+    ("Как поставить фото в профиль?", "Как добавить аватарку"),
+    ("Как забрать деньги из копилки?", "Вывод средств из копилки"),
+    ("Пишет, что карта привязана к другому аккаунту", 'Ошибка "Карта уже привязана к другому аккаунту"'),
+    ("В акте неправильная сумма", "Если пользователь говорит, что у него неверная сумма в акте или несколько актов"),
+    ("Заказчик не прислал акт, денег нет", "Нет акта / не пришел акт / заказчик не отправил акт / нет выплаты"),
+    ("Задание висит в статусе принято", 'Задание в статусе "Принято"'),
+    ("Когда заплатят за приглашённого друга?", 'Выплата за "приведи друга"'),
+    ("Как подключить Тинькофф налоговым партнёром?", "Подключение Т-банка в качестве налогового партнера"),
+    ("Я мигрант, нужно ли уведомлять о работе?", "Уведомление о трудовой деятельности для мигранта"),
+    ("Хочу расторгнуть договор с вами", "Как расторгнуть договор?"),
+]
+
+
+def load_queries(path: str | None) -> list[tuple[str, str]]:
+    if path is None:
+        return LABELED_QUERIES
+    with open(path, encoding="utf-8") as f:
+        return [(row["query"], row["source"]) for row in map(json.loads, f) if row]
+
+
+def rank_metrics(ranked_sources: list[list[str]], targets: list[str], k: int) -> tuple[float, float]:
+    """hit@k и MRR@k."""
+    hits, reciprocal = [], []
+    for sources, target in zip(ranked_sources, targets):
+        top = sources[:k]
+        hits.append(target in top)
+        reciprocal.append(1 / (top.index(target) + 1) if target in top else 0.0)
+    return float(np.mean(hits)), float(np.mean(reciprocal))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", nargs="+", type=int, default=[10, 20, 40])
+    parser.add_argument("--k", type=int, default=settings.top_k)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--queries", default=None, help="JSONL с полями query и source")
+    parser.add_argument("--model", default=settings.rerank_model_name)
+    args = parser.parse_args()
+
+    chunks = split_chunks(parse_html(settings.context_html_file))
+    documents = [Document(page_content=chunk["text"], metadata=chunk) for chunk in chunks]
+    labeled = load_queries(args.queries)
+    queries = [query for query, _ in labeled]
+    targets = [source for _, source in labeled]
+
+    embeddings = create_embedding_model(settings.embedding_model_name, settings.embedding_backend, settings.embedding_threads)
+    doc_vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+    doc_vectors /= np.linalg.norm(doc_vectors, axis=1, keepdims=True)
+    query_vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    lexical = LexicalIndex.from_documents(documents)
+    # Бюджет не ограничен: замеряется чистое время батча
+    reranker = CrossEncoderReranker(args.model, max_length=settings.rerank_max_length, budget_seconds=float("inf"))
+    reranker.score("прогрев", ["прогрев"])
+
+    print(f"Модель {args.model}, {len(documents)} чанков, {len(queries)} запросов, k={args.k}")
+    print(f"{'candidates':>10} {'hit@k':>7} {'+rerank':>8} {'MRR@k':>7} {'+rerank':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for candidates in args.candidates:
+        fused_sources, reranked_sources, latencies = [], [], []
+        for query, query_vector in zip(queries, query_vectors):
+            scores = doc_vectors @ query_vector
+            order = np.argsort(-scores)[: max(candidates, args.k * 2)]
+            dense = [documents[i] for i in order if scores[i] >= settings.min_score][:candidates]
+            bm25 = lexical.search(query, candidates)
+            fused = weighted_rrf([bm25, dense], [BM25_WEIGHT, DENSE_WEIGHT])[:candidates] if bm25 else dense
+            fused_sources.append([doc.metadata["source"] for doc in fused])
+
+            texts = [doc.page_content for doc in fused]
+            rerank_scores = None
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                rerank_scores = reranker.score(query, texts) if texts else np.zeros(0)
+                latencies.append((time.perf_counter() - started) * 1000)
+            reranked_sources.append([fused[i].metadata["source"] for i in np.argsort(-rerank_scores, kind="stable")])
+
+        hit, mrr = rank_metrics(fused_sources, targets, args.k)
+        hit_rr, mrr_rr = rank_metrics(reranked_sources, targets, args.k)
+        print(
+            f"{candidates:>10} {hit:>7.3f} {hit_rr:>8.3f} {mrr:>7.3f} {mrr_rr:>8.3f} "
+            f"{statistics.median(latencies):>8.1f} {float(np.percentile(latencies, 95)):>8.1f}"
+        )
+    print("Бюджет ONLINESHOPRAG__RERANK_BUDGET_MS должен быть выше p95 для выбранного числа кандидатов с запасом на нагрузку")
+
+
+if __name__ == "__main__":
+    main()
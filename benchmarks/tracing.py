@@ -0,0 +1,112 @@
+"""
+Бенчмарк накладных расходов трассировки на обработку сообщения агентом.
+
+Агент работает с LLM-заглушкой и ретривером-заглушкой, трассы пишутся в файловое
+хранилище MLflow во временной папке (или на --tracking-uri). Режимы:
+    off       - без трассировки;
+    sampled   - RequestTracer с --sample-rate;
+    all       - RequestTracer, записывается каждый запрос;
+    slow      - RequestTracer, каждый запрос, экспорт с задержкой --slow-export (медленный сервер MLflow)
+                и очередь --slow-queue-size: задержка запросов не растёт, лишние трассы отбрасываются;
+    autolog   - прежнее поведение: mlflow.langchain.autolog() на каждом вызове цепочки.
+
+Для каждого режима - p50/p95 задержки сообщения, RPS и число отправленных/отброшенных трасс.
+
+Запуск:
+    uv run python -m benchmarks.tracing --requests 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from unittest.mock import patch
+
+import numpy as np
+
+from benchmarks.fakes import FakeChatModel, FakeRetriever
+from src.core.agent import SupportAgent
+from src.core.metrics import TRACES
+from src.core.tracing import MlflowTraceExporter, RequestTracer
+from src.settings import settings
+
+MODES = ["off", "sampled", "all", "slow", "autolog"]
+
+
+async def run_mode(agent: SupportAgent, requests: int, concurrency: int) -> dict[str, float]:
+    """Прогоняет requests сообщений (первые сообщения новых диалогов) и возвращает задержки и RPS."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await agent.handle_message(str(uuid.uuid4()), "Как восстановить аннулированный чек?")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "rps": requests / elapsed,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--sample-rate", type=float, default=settings.tracing_sample_rate)
+    parser.add_argument("--slow-export", type=float, default=0.5, help="Задержка экспорта одной трассы в режиме slow, с")
+    parser.add_argument("--queue-size", type=int, default=settings.tracing_queue_size)
+    parser.add_argument("--slow-queue-size", type=int, default=20, help="Размер очереди в режиме slow")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--tracking-uri", default=None, help="Сервер MLflow (по умолчанию файловое хранилище во временной папке)")
+    args = parser.parse_args()
+
+    tracking_uri = args.tracking_uri or f"file:{os.path.join(tempfile.mkdtemp(prefix='mlruns-'), 'mlruns')}"
+    exporter = MlflowTraceExporter(tracking_uri, settings.mlflow_experiment_name)
+
+    def slow_export(record) -> None:
+        time.sleep(args.slow_export)
+        exporter.export(record)
+
+    llm = FakeChatModel(latency=args.llm_latency)
+    print(f"MLflow {tracking_uri}, {args.requests} запросов, конкурентность {args.concurrency}")
+    print(f"{'mode':>8} {'p50 ms':>8} {'p95 ms':>8} {'rps':>8} {'exported':>9} {'dropped':>8}")
+    with patch("src.scenario.nodes.get_llm", return_value=llm):
+        for mode in args.modes:
+            tracer = None
+            if mode in ("sampled", "all", "slow"):
+                tracer = RequestTracer(
+                    slow_export if mode == "slow" else exporter.export,
+                    sample_rate=args.sample_rate if mode == "sampled" else 1.0,
+                    slow_seconds=settings.tracing_slow_ms / 1000,
+                    queue_size=args.slow_queue_size if mode == "slow" else args.queue_size,
+                )
+            elif mode == "autolog":
+                import mlflow
+
+                mlflow.langchain.autolog()
+
+            agent = SupportAgent(FakeRetriever(), tracer=tracer)
+            agent.llm = llm
+            exported, dropped = TRACES.value("exported"), TRACES.value("dropped")
+            result = await run_mode(agent, args.requests, args.concurrency)
+            if tracer is not None:
+                # Экспорт в фоне не входит в задержку запросов; в режиме slow очередь не дожидаемся
+                tracer.close(timeout=0.0 if mode == "slow" else 30.0)
+            if tracer is None:
+                counts = f"{'-':>9} {'-':>8}"
+            else:
+                counts = f"{TRACES.value('exported') - exported:>9.0f} {TRACES.value('dropped') - dropped:>8.0f}"
+            print(f"{mode:>8} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['rps']:>8.1f} {counts}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""
+Бенчмарк хранилищ векторов: встроенный NumPy-индекс (float32 и int8) против Qdrant
+на синтетических корпусах разного размера. Считает задержку поиска top-k,
+совпадение выдачи int8 с точным float32 и объём матрицы.
+
+По умолчанию Qdrant запускается в локальном режиме (без сервера); для сравнения
+с настоящим сервером укажите --qdrant-host.
+
+Запуск:
+    uv run python -m benchmarks.vector_backends --sizes 1000 10000 100000 --dim 384
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from langchain.schema import Document
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from benchmarks import fakes  # noqa: F401  (задаёт LLM API key по умолчанию)
+from src.rag.vector_store import NumpyBackend, QdrantBackend, VectorBackend
+
+UPSERT_BATCH = 1024
+
+
+def make_corpus(size: int, dim: int, seed: int = 0) -> tuple[list[str], list[Document], np.ndarray]:
+    """Генерирует id, документы и векторы корпуса."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    ids = [str(uuid.uuid4()) for _ in range(size)]
+    documents = [Document(page_content=f"chunk {i}", metadata={"chunk_id": f"{i}_0"}) for i in range(size)]
+    return ids, documents, vectors
+
+
+def fill(backend: VectorBackend, ids: list[str], documents: list[Document], vectors: np.ndarray) -> float:
+    """Загружает корпус в хранилище и возвращает длительность."""
+    started = time.perf_counter()
+    backend.ensure_collection(lambda: vectors.shape[1], "synthetic")
+    for start in range(0, len(ids), UPSERT_BATCH):
+        end = start + UPSERT_BATCH
+        backend.upsert(ids[start:end], documents[start:end], vectors[start:end].tolist())
+    backend.flush()
+    return time.perf_counter() - started
+
+
+async def measure(backend: VectorBackend, queries: np.ndarray, k: int) -> tuple[list[float], list[list[str]]]:
+    """Выполняет запросы последовательно, возвращает задержки (мс) и chunk_id выдачи."""
+    latencies = []
+    results = []
+    for query in queries.tolist():
+        started = time.perf_counter()
+        docs = await backend.search(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([doc.metadata["chunk_id"] for doc in docs])
+    return latencies, results
+
+
+def recall(results: list[list[str]], reference: list[list[str]]) -> float:
+    """Доля совпавших результатов относительно эталонной выдачи."""
+    hits = sum(len(set(got) & set(expected)) for got, expected in zip(results, reference))
+    return hits / max(1, sum(len(expected) for expected in reference))
+
+
+def percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--qdrant-host", default=None, help="Хост Qdrant; по умолчанию локальный режим в памяти")
+    parser.add_argument("--qdrant-port", type=int, default=6333)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'backend':>14} {'fill s':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall':>7} {'matrix MB':>10}")
+    for size in args.sizes:
+        ids, documents, vectors = make_corpus(size, args.dim)
+        queries = np.random.default_rng(1).standard_normal((args.queries, args.dim), dtype=np.float32)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            backends: dict[str, VectorBackend] = {
+                "numpy-float32": NumpyBackend(f"{tmp}/float32", dtype="float32"),
+                "numpy-int8": NumpyBackend(f"{tmp}/int8", dtype="int8"),
+            }
+            if args.qdrant_host:
+                client = QdrantClient(host=args.qdrant_host, port=args.qdrant_port)
+                async_client = AsyncQdrantClient(host=args.qdrant_host, port=args.qdrant_port)
+            else:
+                client = QdrantClient(path=f"{tmp}/qdrant")
+                async_client = None
+            collection_name = f"bench_{size}"
+            if client.collection_exists(collection_name):
+                client.delete_collection(collection_name)
+            qdrant = QdrantBackend(client, async_client, collection_name, with_sparse=False)
+            if async_client is None:
+                # Локальный QdrantClient синхронный: выполняем поиск в потоке, как NumpyBackend
+                qdrant.async_client = _ThreadedQdrant(client)
+            backends["qdrant"] = qdrant
+
+            reference = None
+            for name, backend in backends.items():
+                fill_seconds = fill(backend, ids, documents, vectors)
+                latencies, results = await measure(backend, queries, args.k)
+                reference = reference or results
+                matrix_mb = (
+                    backend._state[2].nbytes / 2**20 if isinstance(backend, NumpyBackend) else float("nan")
+                )
+                print(
+                    f"{size:>8} {name:>14} {fill_seconds:>8.2f} {statistics.median(latencies):>8.2f} "
+                    f"{percentile(latencies, 95):>8.2f} {recall(results, reference):>7.3f} {matrix_mb:>10.1f}"
+                )
+            client.close()
+
+
+class _ThreadedQdrant:
+    """Асинхронная обёртка над синхронным клиентом локального режима Qdrant."""
+
+    def __init__(self, client: QdrantClient) -> None:
+        self.client = client
+
+    async def query_points(self, **kwargs):
+        return await asyncio.to_thread(self.client.query_points, **kwargs)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Бенчмарк многопроцессного запуска: память и пропускная способность эмбеддинга
+запросов в зависимости от числа воркеров.
+
+Режимы:
+    local  - каждый воркер загружает свою копию модели (как uvicorn --workers без сервера эмбеддингов);
+    server - модель загружена один раз в src.rag.embedding_server, воркеры ходят к нему по Unix-сокету.
+
+Память - суммарные RSS и PSS (доля общих страниц делится между процессами) воркеров
+и сервера после загрузки модели; пропускная способность - запросов в секунду по всем
+воркерам за --duration секунд, тексты запросов уникальны (кэш не участвует). Только Linux (/proc).
+
+Запуск:
+    uv run python -m benchmarks.workers --workers 1 2 4 --duration 10
+"""
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+from benchmarks import fakes  # noqa: F401  (задаёт LLM API key по умолчанию)
+from src.rag.embedding_server import EmbeddingServer, RemoteEmbeddings
+from src.rag.embeddings import create_embedding_model
+from src.settings import settings
+
+
+def memory_mb(pid: int) -> tuple[float, float]:
+    """RSS и PSS процесса в МБ из /proc."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                values[name] = int(rest.split()[0]) / 1024
+    return values.get("Rss", 0.0), values.get("Pss", 0.0)
+
+
+def load_model():
+    return create_embedding_model(
+        settings.embedding_model_name, settings.embedding_backend, settings.embedding_threads, settings.embedding_onnx_file
+    )
+
+
+def run_server(socket_path: str) -> None:
+    server = EmbeddingServer(
+        load_model(),
+        socket_path,
+        max_batch=settings.embedding_server_max_batch,
+        batch_wait_ms=settings.embedding_server_batch_wait_ms,
+    )
+    asyncio.run(server.serve_forever())
+
+
+def run_worker(index: int, socket_path: str | None, ready, start, duration: float, results) -> None:
+    """Загружает модель (или подключается к серверу), ждёт старта и эмбеддит уникальные запросы."""
+    embeddings = RemoteEmbeddings(socket_path) if socket_path else load_model()
+    embeddings.embed_query("прогрев")
+    ready.put(os.getpid())
+    start.wait()
+    count = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        embeddings.embed_query(f"Как вывести деньги с карты, вопрос {index}-{count}?")
+        count += 1
+    results.put(count)
+
+
+def measure(mode: str, workers: int, duration: float) -> dict:
+    context = mp.get_context("spawn")
+    ready, results, start = context.Queue(), context.Queue(), context.Event()
+    processes = []
+    server = None
+    socket_path = None
+    if mode == "server":
+        socket_path = os.path.join(tempfile.mkdtemp(), "embeddings.sock")
+        server = context.Process(target=run_server, args=(socket_path,), daemon=True)
+        server.start()
+        client = RemoteEmbeddings(socket_path, timeout=5.0)
+        while True:
+            try:
+                client.ping()
+                break
+            except OSError:
+                time.sleep(0.2)
+
+    for index in range(workers):
+        process = context.Process(target=run_worker, args=(index, socket_path, ready, start, duration, results))
+        process.start()
+        processes.append(process)
+    pids = [ready.get() for _ in processes]
+    if server is not None:
+        pids.append(server.pid)
+    rss, pss = map(sum, zip(*(memory_mb(pid) for pid in pids)))
+
+    start.set()
+    total = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    if server is not None:
+        server.terminate()
+        server.join()
+    return {"rss_mb": rss, "pss_mb": pss, "qps": total / duration}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", choices=["local", "server"], default=["local", "server"])
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"Модель {settings.embedding_model_name}, бэкенд {settings.embedding_backend}, CPU: {os.cpu_count()}")
+    print(f"{'mode':>7} {'workers':>8} {'RSS MB':>9} {'PSS MB':>9} {'q/s':>9}")
+    for mode in args.modes:
+        for workers in args.workers:
+            result = measure(mode, workers, args.duration)
+            print(f"{mode:>7} {workers:>8} {result['rss_mb']:>9.0f} {result['pss_mb']:>9.0f} {result['qps']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
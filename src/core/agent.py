@@ -1,68 +1,253 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from typing import Any
+
 from src.core.logging_config import get_logger
 from src.models import ChatResponse
 from src.core.memory import conversation_memory
+from src.core.metrics import ANSWERS, LLM_CALL_SECONDS, STAGE_FAILURES, STAGE_SECONDS, timed_call
+from src.core.semantic_cache import SemanticAnswerCache
+from src.core.tracing import RequestTracer, TraceRecord, truncate
 from src.llm.client import get_llm
+from src.llm.prompt_builder import PromptBuilder, TokenCounter
 from src.llm.prompts import RAG_ANSWER_PROMPT
 from src.rag.retriever import RAGRetriever
+from src.scenario.classifier import ConditionClassifier, ConditionDecisionCache
 from src.scenario.runner import ScenarioRunner
+from src.settings import settings
 
 logger = get_logger(__name__)
 
 
+@dataclass
+class PreparedTurn:
+    """Всё, что нужно для генерации ответа на сообщение пользователя."""
+
+    conversation_id: str
+    message: str
+    last_step_scenario: str = ""
+    chunks: list[dict[str, Any]] = field(default_factory=list)
+    prompt_inputs: dict[str, str] = field(default_factory=dict)
+    cached_answer: str | None = None
+    cache_vector: list[float] | None = None
+    context_key: str = ""
+    # Длительности этапов в секундах и самая долгая из параллельных веток первого сообщения
+    timings: dict[str, float] = field(default_factory=dict)
+    critical_path: str = "retrieval"
+    started: float = field(default_factory=time.perf_counter)
+    prompt_tokens: int = 0
+    streaming: bool = False
+
+
 class SupportAgent:
     """Агент технической поддержки с RAG и сценариями."""
 
-    def __init__(self, retriever: RAGRetriever) -> None:
+    def __init__(self, retriever: RAGRetriever, tracer: RequestTracer | None = None) -> None:
         """
         Инициализирует агента поддержки.
+
+        Args:
+            retriever: Ретривер базы знаний
+            tracer: Выборочная трассировка запросов (None - без трассировки)
         """
         self.retriever = retriever
-        self.scenario_runner = ScenarioRunner()
+        self.tracer = tracer
+        self.condition_classifier: ConditionClassifier | None = None
+        if settings.condition_classifier_enabled:
+            self.condition_classifier = ConditionClassifier(
+                retriever.embedding_model,
+                margin=settings.condition_classifier_margin,
+                yes_threshold=settings.condition_classifier_yes_threshold,
+                no_threshold=settings.condition_classifier_no_threshold,
+            )
+        self.condition_cache: ConditionDecisionCache | None = None
+        if settings.condition_cache_size > 0:
+            self.condition_cache = ConditionDecisionCache(settings.condition_cache_size)
+        self.scenario_runner = ScenarioRunner(classifier=self.condition_classifier, decision_cache=self.condition_cache)
         self.llm = get_llm()
+        self.prompt_builder = PromptBuilder(
+            RAG_ANSWER_PROMPT,
+            TokenCounter(settings.prompt_tokenizer_encoding),
+            max_tokens=settings.prompt_max_tokens,
+            max_overlap=settings.chunk_overlap,
+        )
+        self.answer_cache: SemanticAnswerCache | None = None
+        if settings.semantic_cache_enabled:
+            self.answer_cache = SemanticAnswerCache(
+                threshold=settings.semantic_cache_threshold,
+                max_size=settings.semantic_cache_size,
+                ttl_seconds=settings.semantic_cache_ttl_seconds,
+            )
 
-    async def handle_message(self, conversation_id: str, message: str) -> ChatResponse:
+    async def warmup(self) -> dict[str, float]:
         """
-        Обрабатывает сообщение пользователя.
+        Прогревает всё, что иначе инициализировалось бы на первом запросе: поиск
+        (модель эмбеддингов, хранилище, переранжирование), прототипы условий сценария
+        и токенизатор промпта. LLM не вызывается.
+
+        Returns:
+            dict: Длительности прогрева по компонентам в секундах
+        """
+        timings: dict[str, float] = {}
+        started = time.perf_counter()
+        await self.retriever.warmup()
+        timings["retrieval"] = time.perf_counter() - started
+
+        if self.condition_classifier is not None:
+            started = time.perf_counter()
+            await self.condition_classifier.warmup()
+            timings["conditions"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await asyncio.to_thread(lambda: self.prompt_builder.base_tokens)
+        timings["tokenizer"] = time.perf_counter() - started
+        return timings
+
+    async def _run_scenario(self, message: str, timings: dict[str, float]) -> tuple[str, str]:
+        """
+        Выполняет сценарий с таймаутом.
+
+        Args:
+            message: Сообщение пользователя
+            timings: Словарь для длительностей этапов
+
+        Returns:
+            tuple: (контекст сценария, последняя нода) или пустые строки при ошибке или таймауте
+        """
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(self.scenario_runner.run(message), timeout=settings.scenario_timeout_seconds)
+        except TimeoutError:
+            STAGE_FAILURES.inc("scenario", "timeout")
+            logger.warning(f"Сценарий не уложился в {settings.scenario_timeout_seconds} с, отвечаем без него")
+        except Exception as e:
+            STAGE_FAILURES.inc("scenario", "error")
+            logger.warning(f"Ошибка при выполнении сценария: {e}", exc_info=True)
+        finally:
+            timings["scenario"] = time.perf_counter() - started
+        return "", ""
+
+    async def _retrieve(
+        self, message: str, timings: dict[str, float], query_vector: list[float] | None = None
+    ) -> tuple[str, list[dict[str, Any]]]:
+        """
+        Ищет чанки в базе знаний с таймаутом.
+
+        Args:
+            message: Сообщение пользователя
+            timings: Словарь для длительностей этапов (этапы поиска пишутся с префиксом retrieval.)
+            query_vector: Уже посчитанный эмбеддинг сообщения
+
+        Returns:
+            tuple: (контекст, чанки) или пустой результат при ошибке или таймауте
+        """
+        started = time.perf_counter()
+        retrieval_timings: dict[str, float] = {}
+        try:
+            return await asyncio.wait_for(
+                self.retriever.retrieve(message, timings=retrieval_timings, query_vector=query_vector),
+                timeout=settings.retrieval_timeout_seconds,
+            )
+        except TimeoutError:
+            STAGE_FAILURES.inc("retrieval", "timeout")
+            logger.warning(f"Поиск по базе знаний не уложился в {settings.retrieval_timeout_seconds} с, отвечаем без контекста")
+        except Exception as e:
+            STAGE_FAILURES.inc("retrieval", "error")
+            logger.warning(f"Ошибка при поиске по базе знаний: {e}", exc_info=True)
+        finally:
+            timings["retrieval"] = time.perf_counter() - started
+            timings.update({f"retrieval.{stage}": value for stage, value in retrieval_timings.items()})
+        return "", []
+
+    async def _embed_message(self, message: str, timings: dict[str, float]) -> list[float] | None:
+        """
+        Эмбеддит сообщение один раз для семантического кэша и поиска.
+
+        Args:
+            message: Сообщение пользователя
+            timings: Словарь для длительностей этапов
+
+        Returns:
+            list[float] | None: Эмбеддинг или None при ошибке или таймауте (поиск тогда эмбеддит сам)
+        """
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                self.retriever.embedding_model.aembed_query(message), timeout=settings.retrieval_timeout_seconds
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось посчитать эмбеддинг для семантического кэша: {type(e).__name__}: {e}")
+            return None
+        finally:
+            timings["retrieval.embedding"] = time.perf_counter() - started
+
+    async def _prepare_turn(self, conversation_id: str, message: str) -> PreparedTurn:
+        """
+        Выполняет сценарий и поиск по базе знаний, собирает входные данные для LLM.
+
+        На первом сообщении сценарий и поиск независимы и выполняются параллельно,
+        у каждой ветки свой таймаут и запасной пустой результат. Если включён семантический
+        кэш, сообщение эмбеддится один раз для кэша и поиска, а после сценария (его контекст
+        входит в ключ кэша) проверяется кэш; при попадании поиск отменяется.
 
         Args:
             conversation_id: Идентификатор диалога
             message: Сообщение пользователя
 
         Returns:
-            ChatResponse: Ответ агента
+            PreparedTurn: Подготовленный ход диалога (с готовым ответом при попадании в кэш)
         """
+        turn = PreparedTurn(conversation_id=conversation_id, message=message)
         scenario_context = ""
-        last_step_scenario = ""
+        is_first_message = await conversation_memory.is_first_message(conversation_id)
+        await conversation_memory.add_message(conversation_id, "user", message)
 
-        if conversation_memory.is_first_message(conversation_id):
-            logger.info(f"Первый запрос для conversation_id={conversation_id}, запуск сценария")
-            logger.info(f"Сообщение пользователя: {message}")
+        if is_first_message:
+            logger.info(f"Первый запрос для conversation_id={conversation_id}, запуск сценария и поиска")
+            scenario_task = asyncio.create_task(self._run_scenario(message, turn.timings))
+            retrieval_task = None
+            # Тайминги поиска отдельно: при отмене поиска они не должны попасть в ход диалога
+            retrieval_timings: dict[str, float] = {}
             try:
-                scenario_context, last_step_scenario = self.scenario_runner.run(message)
-                logger.info(f"Сценарий выполнен, last_step={last_step_scenario}")
-            except Exception as e:
-                logger.warning(f"Ошибка при выполнении сценария: {e}", exc_info=True)
-                scenario_context = ""
-                last_step_scenario = ""
-
-        conversation_memory.add_message(conversation_id, "user", message)
+                query_vector = None
+                if self.answer_cache is not None:
+                    query_vector = await self._embed_message(message, turn.timings)
+                retrieval_task = asyncio.create_task(self._retrieve(message, retrieval_timings, query_vector))
+                scenario_context, turn.last_step_scenario = await scenario_task
+                logger.info(f"Сценарий выполнен, last_step={turn.last_step_scenario}")
 
-        context, chunks = self.retriever.retrieve(message)
-        history = conversation_memory.format_history(conversation_id)
+                # Семантический кэш: только для первого сообщения (истории нет), ответ берётся
+                # лишь при совпадении контекста сценария, чтобы не отдавать чужие персональные данные
+                if query_vector is not None:
+                    turn.context_key = self.answer_cache.make_context_key(scenario_context)
+                    cached = self.answer_cache.lookup(query_vector, turn.context_key, self.retriever.kb_version)
+                    if cached is not None:
+                        logger.info(f"Ответ для conversation_id={conversation_id} взят из семантического кэша")
+                        turn.cached_answer = cached.answer
+                        turn.chunks = cached.chunks
+                        turn.critical_path = "scenario"
+                        turn.timings["prepare"] = time.perf_counter() - turn.started
+                        return turn
+                    turn.cache_vector = query_vector
 
-        chain = RAG_ANSWER_PROMPT | self.llm
-        response = chain.invoke(
-            {
-                "context": f"{scenario_context}\n\nКонтекст из базы знаний:\n{context}",
-                "history": history,
-                "question": message,
-            }
-        )
-        answer = response.content
+                _, chunks = await retrieval_task
+            finally:
+                for task in (scenario_task, retrieval_task):
+                    if task is not None and not task.done():
+                        task.cancel()
+            turn.timings.update(retrieval_timings)
+            retrieval_seconds = retrieval_timings["retrieval"] + turn.timings.get("retrieval.embedding", 0.0)
+            turn.critical_path = "scenario" if turn.timings["scenario"] >= retrieval_seconds else "retrieval"
+        else:
+            _, chunks = await self._retrieve(message, turn.timings)
 
-        conversation_memory.add_message(conversation_id, "assistant", answer)
+        history_summary, history = await conversation_memory.get_history(conversation_id)
+        # Текущее сообщение уже в памяти и передаётся в промпт отдельно как вопрос
+        history = history[:-1]
 
-        chunks_data = [
+        turn.chunks = [
             {
                 "chunk_id": chunk["chunk_id"],
                 "text": chunk["text"],
@@ -71,11 +256,158 @@ class SupportAgent:
             }
             for chunk in chunks
         ]
+        prompt = self.prompt_builder.build(message, scenario_context, turn.chunks, history_summary, history)
+        turn.prompt_inputs = prompt.inputs
+        turn.prompt_tokens = prompt.tokens
+        if prompt.dropped_chunks or prompt.dropped_history:
+            logger.info(
+                f"Промпт conversation_id={conversation_id} урезан до {prompt.tokens} токенов: "
+                f"не вошли чанков {prompt.dropped_chunks}, сообщений истории {prompt.dropped_history}"
+            )
+        turn.timings["prepare"] = time.perf_counter() - turn.started
+        return turn
+
+    def _trace(self, turn: PreparedTurn, answer: str | None = None, error: Exception | None = None) -> None:
+        """
+        Отдаёт завершённый ход в трассировку, если он попал в выборку.
+
+        Args:
+            turn: Ход диалога (тайминги, чанки, сценарий)
+            answer: Ответ агента
+            error: Исключение, которым завершился запрос
+        """
+        if self.tracer is None:
+            return
+        total = turn.timings.setdefault("total", time.perf_counter() - turn.started)
+        if not self.tracer.should_sample(total, error is not None):
+            return
+        self.tracer.submit(
+            TraceRecord(
+                name="chat_stream" if turn.streaming else "chat",
+                started_ns=time.time_ns() - int((time.perf_counter() - turn.started) * 1e9),
+                timings=dict(turn.timings),
+                inputs={"conversation_id": turn.conversation_id, "message": truncate(turn.message)},
+                outputs={
+                    "answer": truncate(answer or ""),
+                    "chunks": [f"{chunk['chunk_id']}:{chunk['score']:.3f}" for chunk in turn.chunks],
+                    "last_step_scenario": turn.last_step_scenario,
+                },
+                attributes={
+                    "critical_path": turn.critical_path,
+                    "prompt_tokens": turn.prompt_tokens,
+                    "cached_answer": turn.cached_answer is not None,
+                },
+                error=f"{type(error).__name__}: {error}" if error is not None else None,
+            )
+        )
+
+    async def _finish_turn(self, turn: PreparedTurn, answer: str) -> ChatResponse:
+        """
+        Сохраняет ответ в память диалога и кэш, формирует ответ API.
+
+        Args:
+            turn: Подготовленный ход диалога
+            answer: Итоговый ответ агента
+
+        Returns:
+            ChatResponse: Ответ агента
+        """
+        await conversation_memory.add_message(turn.conversation_id, "assistant", answer)
+        turn.timings["total"] = time.perf_counter() - turn.started
+        for stage, seconds in turn.timings.items():
+            STAGE_SECONDS.observe(seconds, stage)
+        ANSWERS.inc("llm" if turn.cached_answer is None else "semantic_cache")
+        logger.info(
+            f"Тайминги conversation_id={turn.conversation_id}, critical_path={turn.critical_path}, "
+            f"prompt_tokens={turn.prompt_tokens}: "
+            + ", ".join(f"{stage}={seconds * 1000:.0f}мс" for stage, seconds in turn.timings.items())
+        )
+
+        if turn.cache_vector is not None:
+            self.answer_cache.store(turn.cache_vector, turn.context_key, self.retriever.kb_version, answer, turn.chunks)
+        self._trace(turn, answer)
 
         return ChatResponse(
-            conversation_id=conversation_id,
+            conversation_id=turn.conversation_id,
             answer=answer,
-            chunks=chunks_data,
-            last_step_scenario=last_step_scenario,
+            chunks=turn.chunks,
+            last_step_scenario=turn.last_step_scenario,
         )
 
+    async def handle_message(self, conversation_id: str, message: str) -> ChatResponse:
+        """
+        Обрабатывает сообщение пользователя.
+
+        Args:
+            conversation_id: Идентификатор диалога
+            message: Сообщение пользователя
+
+        Returns:
+            ChatResponse: Ответ агента
+        """
+        turn = PreparedTurn(conversation_id=conversation_id, message=message)
+        try:
+            turn = await self._prepare_turn(conversation_id, message)
+            if turn.cached_answer is not None:
+                return await self._finish_turn(turn, turn.cached_answer)
+
+            started = time.perf_counter()
+            chain = RAG_ANSWER_PROMPT | self.llm
+            with timed_call(LLM_CALL_SECONDS, "answer"):
+                response = await chain.ainvoke(turn.prompt_inputs)
+            turn.timings["llm"] = time.perf_counter() - started
+            return await self._finish_turn(turn, response.content)
+        except Exception as e:
+            self._trace(turn, error=e)
+            raise
+
+    async def stream_message(self, conversation_id: str, message: str) -> AsyncIterator[dict[str, Any]]:
+        """
+        Обрабатывает сообщение пользователя с потоковой генерацией ответа.
+
+        Сначала отдаёт событие "context" с найденными чанками и last_step_scenario,
+        затем события "token" по мере генерации и финальное событие "done".
+        Ответ записывается в память диалога только после завершения генерации.
+
+        Args:
+            conversation_id: Идентификатор диалога
+            message: Сообщение пользователя
+
+        Yields:
+            dict: Событие с полями event и data
+        """
+        turn = PreparedTurn(conversation_id=conversation_id, message=message, streaming=True)
+        try:
+            turn = await self._prepare_turn(conversation_id, message)
+            turn.streaming = True
+            yield {
+                "event": "context",
+                "data": {
+                    "conversation_id": conversation_id,
+                    "chunks": turn.chunks,
+                    "last_step_scenario": turn.last_step_scenario,
+                },
+            }
+
+            if turn.cached_answer is not None:
+                answer = turn.cached_answer
+                yield {"event": "token", "data": {"text": answer}}
+            else:
+                started = time.perf_counter()
+                chain = RAG_ANSWER_PROMPT | self.llm
+                answer_parts = []
+                with timed_call(LLM_CALL_SECONDS, "answer"):
+                    async for chunk in chain.astream(turn.prompt_inputs):
+                        if chunk.content:
+                            if not answer_parts:
+                                turn.timings["llm_first_token"] = time.perf_counter() - started
+                            answer_parts.append(chunk.content)
+                            yield {"event": "token", "data": {"text": chunk.content}}
+                turn.timings["llm"] = time.perf_counter() - started
+                answer = "".join(answer_parts)
+
+            response = await self._finish_turn(turn, answer)
+            yield {"event": "done", "data": response.model_dump()}
+        except Exception as e:
+            self._trace(turn, error=e)
+            raise
@@ -0,0 +1,413 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.core.logging_config import get_logger
+from src.settings import PROJECT_ROOT, settings
+
+logger = get_logger(__name__)
+
+# Компактные коды ролей: сообщение хранится кортежем (роль, текст)
+USER = "u"
+ASSISTANT = "a"
+
+
+@dataclass(slots=True)
+class Conversation:
+    """Диалог: сырые сообщения и резюме более ранней части."""
+
+    messages: list[tuple[str, str]] = field(default_factory=list)
+    summary: str = ""
+    updated_at: float = field(default_factory=time.time)
+
+    def size_bytes(self) -> int:
+        """Приблизительный объём текста диалога в байтах."""
+        return len(self.summary.encode("utf-8")) + sum(len(content.encode("utf-8")) + 1 for _, content in self.messages)
+
+
+class ConversationStore(ABC):
+    """Хранилище диалогов по conversation_id."""
+
+    def __init__(self, max_messages: int) -> None:
+        """
+        Args:
+            max_messages: Сколько последних сырых сообщений хранить в диалоге
+        """
+        self.max_messages = max_messages
+
+    @abstractmethod
+    async def get(self, conversation_id: str) -> Conversation | None:
+        """
+        Возвращает диалог или None, если его нет или он вытеснен.
+
+        Args:
+            conversation_id: Идентификатор диалога
+        """
+
+    @abstractmethod
+    async def append(self, conversation_id: str, role: str, content: str) -> None:
+        """
+        Добавляет сообщение, создавая диалог при необходимости.
+
+        Args:
+            conversation_id: Идентификатор диалога
+            role: USER или ASSISTANT
+            content: Текст сообщения
+        """
+
+    @abstractmethod
+    async def set_summary(self, conversation_id: str, summary: str, covered: int, expected_summary: str) -> bool:
+        """
+        Сохраняет резюме и удаляет сообщения, которые оно покрывает.
+
+        Резюме применяется, только если текущее резюме диалога равно expected_summary:
+        так параллельная суммаризация того же диалога (например, в другом воркере)
+        не удалит сообщения дважды.
+
+        Args:
+            conversation_id: Идентификатор диалога
+            summary: Новое резюме
+            covered: Сколько первых сообщений диалога вошло в резюме
+            expected_summary: Резюме, от которого считалось новое
+
+        Returns:
+            bool: Применено ли резюме
+        """
+
+    @abstractmethod
+    async def count(self) -> int:
+        """Количество хранимых диалогов."""
+
+    async def close(self) -> None:
+        """Освобождает ресурсы хранилища."""
+
+
+class MemoryConversationStore(ConversationStore):
+    """Диалоги в памяти процесса: LRU с idle-TTL и ограничением по количеству и объёму."""
+
+    def __init__(self, max_conversations: int, ttl_seconds: float, max_bytes: int, max_messages: int) -> None:
+        """
+        Args:
+            max_conversations: Максимальное количество диалогов
+            ttl_seconds: Время бездействия, после которого диалог удаляется (0 - без TTL)
+            max_bytes: Ограничение суммарного объёма текста диалогов
+            max_messages: Сколько последних сырых сообщений хранить в диалоге
+        """
+        super().__init__(max_messages)
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds or None
+        self.max_bytes = max_bytes
+        self._conversations: OrderedDict[str, Conversation] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _expired(self, conversation: Conversation, now: float) -> bool:
+        return self.ttl_seconds is not None and now - conversation.updated_at > self.ttl_seconds
+
+    def _drop(self, conversation_id: str) -> None:
+        self._conversations.pop(conversation_id, None)
+        self._total_bytes -= self._sizes.pop(conversation_id, 0)
+        self.evictions += 1
+
+    def _resize(self, conversation_id: str, conversation: Conversation) -> None:
+        size = conversation.size_bytes()
+        self._total_bytes += size - self._sizes.get(conversation_id, 0)
+        self._sizes[conversation_id] = size
+
+    def _evict(self, now: float) -> None:
+        """Удаляет устаревшие диалоги с начала LRU и самые давние сверх лимитов."""
+        while self._conversations:
+            oldest_id, oldest = next(iter(self._conversations.items()))
+            over_limit = len(self._conversations) > self.max_conversations or self._total_bytes > self.max_bytes
+            if not over_limit and not self._expired(oldest, now):
+                return
+            self._drop(oldest_id)
+
+    async def get(self, conversation_id: str) -> Conversation | None:
+        now = time.time()
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return None
+            if self._expired(conversation, now):
+                self._drop(conversation_id)
+                return None
+            self._conversations.move_to_end(conversation_id)
+            return Conversation(list(conversation.messages), conversation.summary, conversation.updated_at)
+
+    async def append(self, conversation_id: str, role: str, content: str) -> None:
+        now = time.time()
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None or self._expired(conversation, now):
+                conversation = self._conversations[conversation_id] = Conversation()
+            conversation.messages.append((role, content))
+            del conversation.messages[: -self.max_messages]
+            conversation.updated_at = now
+            self._conversations.move_to_end(conversation_id)
+            self._resize(conversation_id, conversation)
+            self._evict(now)
+
+    async def set_summary(self, conversation_id: str, summary: str, covered: int, expected_summary: str) -> bool:
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None or conversation.summary != expected_summary:
+                return False
+            conversation.summary = summary
+            del conversation.messages[:covered]
+            self._resize(conversation_id, conversation)
+            return True
+
+    async def count(self) -> int:
+        with self._lock:
+            return len(self._conversations)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Диалоги в SQLite (WAL): переживают перезапуск и общие для воркеров на одной машине.
+
+    Диалоги, не менявшиеся дольше TTL, и самые давние сверх лимита количества
+    удаляются периодически при записи.
+    """
+
+    # Как часто (в записях) запускать очистку
+    SWEEP_EVERY = 100
+
+    def __init__(self, path: str, max_conversations: int, ttl_seconds: float, max_messages: int) -> None:
+        """
+        Args:
+            path: Путь к файлу базы
+            max_conversations: Максимальное количество диалогов
+            ttl_seconds: Время бездействия, после которого диалог удаляется (0 - без TTL)
+            max_messages: Сколько последних сырых сообщений хранить в диалоге
+        """
+        super().__init__(max_messages)
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds or None
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                messages TEXT NOT NULL,
+                summary TEXT NOT NULL DEFAULT '',
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at);
+            """
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _read(self, conversation_id: str) -> Conversation | None:
+        row = self._connection.execute(
+            "SELECT messages, summary, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None or (self.ttl_seconds is not None and time.time() - row[2] > self.ttl_seconds):
+            return None
+        return Conversation([tuple(message) for message in json.loads(row[0])], row[1], row[2])
+
+    def _get(self, conversation_id: str) -> Conversation | None:
+        with self._lock:
+            return self._read(conversation_id)
+
+    def _sweep(self) -> None:
+        """Удаляет устаревшие диалоги и самые давние сверх лимита."""
+        if self.ttl_seconds is not None:
+            self._connection.execute("DELETE FROM conversations WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+        self._connection.execute(
+            "DELETE FROM conversations WHERE id IN "
+            "(SELECT id FROM conversations ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_conversations,),
+        )
+
+    def _append(self, conversation_id: str, role: str, content: str) -> None:
+        # BEGIN IMMEDIATE: чтение и запись диалога атомарны и между процессами
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                conversation = self._read(conversation_id) or Conversation()
+                conversation.messages.append((role, content))
+                del conversation.messages[: -self.max_messages]
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO conversations (id, messages, summary, updated_at) VALUES (?, ?, ?, ?)",
+                    (
+                        conversation_id,
+                        json.dumps(conversation.messages, ensure_ascii=False),
+                        conversation.summary,
+                        time.time(),
+                    ),
+                )
+                self._writes += 1
+                if self._writes % self.SWEEP_EVERY == 0:
+                    self._sweep()
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _set_summary(self, conversation_id: str, summary: str, covered: int, expected_summary: str) -> bool:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                conversation = self._read(conversation_id)
+                if conversation is None or conversation.summary != expected_summary:
+                    self._connection.execute("ROLLBACK")
+                    return False
+                self._connection.execute(
+                    "UPDATE conversations SET messages = ?, summary = ? WHERE id = ?",
+                    (json.dumps(conversation.messages[covered:], ensure_ascii=False), summary, conversation_id),
+                )
+                self._connection.execute("COMMIT")
+                return True
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def _close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    async def get(self, conversation_id: str) -> Conversation | None:
+        return await asyncio.to_thread(self._get, conversation_id)
+
+    async def append(self, conversation_id: str, role: str, content: str) -> None:
+        await asyncio.to_thread(self._append, conversation_id, role, content)
+
+    async def set_summary(self, conversation_id: str, summary: str, covered: int, expected_summary: str) -> bool:
+        return await asyncio.to_thread(self._set_summary, conversation_id, summary, covered, expected_summary)
+
+    async def count(self) -> int:
+        # Блокировку может держать запись, ждущая другой процесс (busy_timeout), поэтому не в event loop
+        return await asyncio.to_thread(self._count)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+
+
+class RedisConversationStore(ConversationStore):
+    """Диалоги в Redis или совместимом по протоколу хранилище (Valkey, KeyDB, Dragonfly).
+
+    Сообщения хранятся списком, резюме - отдельным ключом. Idle-TTL задаётся EXPIRE
+    при каждой записи; вытеснение по памяти выполняет сам сервер
+    (maxmemory + maxmemory-policy allkeys-lru). Для подсчёта диалогов без обхода
+    ключей время последней записи каждого диалога хранится в sorted set. Нужен пакет redis.
+    """
+
+    def __init__(self, url: str, ttl_seconds: float, max_messages: int, prefix: str = "onlineshoprag:conversation") -> None:
+        """
+        Args:
+            url: URL сервера, например redis://localhost:6379/0
+            ttl_seconds: Время бездействия, после которого диалог удаляется (0 - без TTL)
+            max_messages: Сколько последних сырых сообщений хранить в диалоге
+            prefix: Префикс ключей
+        """
+        super().__init__(max_messages)
+        import redis.asyncio
+
+        self.client = redis.asyncio.Redis.from_url(url, decode_responses=True)
+        self.ttl_seconds = int(ttl_seconds) or None
+        self.prefix = prefix
+        # conversation_id -> время последней записи; по нему count() не сканирует ключи
+        self.index_key = f"{prefix}s:updated_at"
+
+    def _keys(self, conversation_id: str) -> tuple[str, str]:
+        return f"{self.prefix}:{conversation_id}:messages", f"{self.prefix}:{conversation_id}:summary"
+
+    async def get(self, conversation_id: str) -> Conversation | None:
+        messages_key, summary_key = self._keys(conversation_id)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.lrange(messages_key, 0, -1)
+            pipe.get(summary_key)
+            messages, summary = await pipe.execute()
+        if not messages and summary is None:
+            return None
+        return Conversation([tuple(json.loads(message)) for message in messages], summary or "")
+
+    async def append(self, conversation_id: str, role: str, content: str) -> None:
+        messages_key, summary_key = self._keys(conversation_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.rpush(messages_key, json.dumps((role, content), ensure_ascii=False))
+            pipe.ltrim(messages_key, -self.max_messages, -1)
+            pipe.zadd(self.index_key, {conversation_id: time.time()})
+            if self.ttl_seconds:
+                pipe.expire(messages_key, self.ttl_seconds)
+                pipe.expire(summary_key, self.ttl_seconds)
+                pipe.expire(self.index_key, self.ttl_seconds)
+            await pipe.execute()
+
+    async def set_summary(self, conversation_id: str, summary: str, covered: int, expected_summary: str) -> bool:
+        from redis.exceptions import WatchError
+
+        messages_key, summary_key = self._keys(conversation_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(summary_key)
+                if (await pipe.get(summary_key) or "") != expected_summary:
+                    return False
+                pipe.multi()
+                pipe.set(summary_key, summary, ex=self.ttl_seconds)
+                pipe.ltrim(messages_key, covered, -1)
+                await pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    async def count(self) -> int:
+        """Количество диалогов по индексу: O(log N) плюс удаление устаревших записей индекса.
+
+        Диалоги, вытесненные сервером по памяти до истечения TTL, учитываются до истечения TTL.
+        """
+        async with self.client.pipeline(transaction=False) as pipe:
+            if self.ttl_seconds:
+                pipe.zremrangebyscore(self.index_key, "-inf", time.time() - self.ttl_seconds)
+            pipe.zcard(self.index_key)
+            results = await pipe.execute()
+        return results[-1]
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_conversation_store() -> ConversationStore:
+    """
+    Создаёт хранилище диалогов по настройке conversation_store.
+
+    Returns:
+        ConversationStore: Хранилище в памяти, SQLite или Redis
+    """
+    if settings.conversation_store == "sqlite":
+        return SQLiteConversationStore(
+            str(PROJECT_ROOT / settings.conversation_sqlite_path),
+            max_conversations=settings.conversation_max_count,
+            ttl_seconds=settings.conversation_ttl_seconds,
+            max_messages=settings.conversation_max_messages,
+        )
+    if settings.conversation_store == "redis":
+        return RedisConversationStore(
+            settings.conversation_redis_url,
+            ttl_seconds=settings.conversation_ttl_seconds,
+            max_messages=settings.conversation_max_messages,
+        )
+    return MemoryConversationStore(
+        max_conversations=settings.conversation_max_count,
+        ttl_seconds=settings.conversation_ttl_seconds,
+        max_bytes=int(settings.conversation_max_memory_mb * 2**20),
+        max_messages=settings.conversation_max_messages,
+    )
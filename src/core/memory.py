@@ -1,67 +1,119 @@
-from langchain.memory import ConversationSummaryBufferMemory
-from langchain.schema import BaseMessage
+import asyncio
+import threading
 
-from src.settings import settings
+from src.core.conversation_store import ASSISTANT, USER, Conversation, ConversationStore, create_conversation_store
+from src.core.logging_config import get_logger
+from src.core.metrics import LLM_CALL_SECONDS, MEMORY_OPERATION_SECONDS, timed_call
 from src.llm.client import get_llm
+from src.llm.prompts import SUMMARY_PROMPT
+from src.settings import settings
+
+logger = get_logger(__name__)
+
+
+def _format_messages(messages: list[tuple[str, str]]) -> list[str]:
+    return [f"{'Пользователь' if role == USER else 'Агент'}: {content}" for role, content in messages]
 
 
 class ConversationMemory:
-    """Управление памятью диалогов по conversation_id."""
+    """Управление памятью диалогов по conversation_id поверх хранилища диалогов.
 
-    def __init__(self) -> None:
-        """
-        Инициализирует хранилище памяти диалогов.
-        """
-        self.memories: dict[str, ConversationSummaryBufferMemory] = {}
-        self.llm = get_llm()
+    Когда сырых сообщений становится больше max_history_messages, старые сообщения
+    сворачиваются в резюме фоновой задачей вне пути запроса. Задача откладывается
+    на summary_debounce_seconds и одна на диалог: сообщения, пришедшие за это время,
+    попадают в ту же суммаризацию. Запрос использует последнее готовое резюме
+    и последние сырые сообщения.
+    """
 
-    def get_memory(self, conversation_id: str) -> ConversationSummaryBufferMemory:
+    def __init__(self, store: ConversationStore | None = None) -> None:
         """
-        Получает или создает память для conversation_id.
+        Инициализирует память диалогов.
 
         Args:
-            conversation_id: Идентификатор диалога
-
-        Returns:
-            ConversationSummaryBufferMemory: Объект памяти для диалога
+            store: Хранилище диалогов (по умолчанию выбирается настройкой conversation_store)
         """
-        if conversation_id not in self.memories:
-            self.memories[conversation_id] = ConversationSummaryBufferMemory(
-                llm=self.llm,
-                max_token_limit=settings.max_history_messages * 50,
-                return_messages=True,
-            )
-        return self.memories[conversation_id]
+        self.store = store or create_conversation_store()
+        self.llm = get_llm()
+        self._summary_tasks: dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.summaries_completed = 0
+        self.summaries_failed = 0
 
-    def add_message(self, conversation_id: str, role: str, content: str) -> None:
+    async def add_message(self, conversation_id: str, role: str, content: str) -> None:
         """
-        Добавляет сообщение в память диалога.
+        Добавляет сообщение в память диалога и при необходимости планирует суммаризацию.
 
         Args:
             conversation_id: Идентификатор диалога
             role: Роль отправителя ('user' или 'assistant')
             content: Текст сообщения
         """
-        memory = self.get_memory(conversation_id)
-        if role == "user":
-            memory.chat_memory.add_user_message(content)
-        else:
-            memory.chat_memory.add_ai_message(content)
-
-    def get_history(self, conversation_id: str) -> list[BaseMessage]:
+        with MEMORY_OPERATION_SECONDS.time("append"):
+            await self.store.append(conversation_id, USER if role == "user" else ASSISTANT, content)
+        # Проверяем после ответа агента, чтобы суммаризация шла между ходами диалога
+        if settings.summary_enabled and role != "user":
+            conversation = await self._get(conversation_id)
+            if conversation is not None and len(conversation.messages) > settings.max_history_messages:
+                self._schedule_summary(conversation_id)
+
+    async def _get(self, conversation_id: str) -> Conversation | None:
+        """Читает диалог из хранилища с замером длительности."""
+        with MEMORY_OPERATION_SECONDS.time("get"):
+            return await self.store.get(conversation_id)
+
+    def _schedule_summary(self, conversation_id: str) -> None:
+        """Запускает фоновую суммаризацию диалога, если она ещё не запланирована."""
+        task = self._summary_tasks.get(conversation_id)
+        if task is not None and not task.done():
+            return
+        self._summary_tasks[conversation_id] = asyncio.create_task(self._summarize_later(conversation_id))
+
+    async def _summarize_later(self, conversation_id: str) -> None:
+        """Ждёт паузу debounce и сворачивает старые сообщения диалога в резюме."""
+        try:
+            await asyncio.sleep(settings.summary_debounce_seconds)
+            await self.summarize(conversation_id)
+            with self._lock:
+                self.summaries_completed += 1
+        except Exception as e:
+            with self._lock:
+                self.summaries_failed += 1
+            logger.warning(f"Не удалось обновить резюме conversation_id={conversation_id}: {type(e).__name__}: {e}")
+        finally:
+            self._summary_tasks.pop(conversation_id, None)
+
+    async def summarize(self, conversation_id: str) -> bool:
         """
-        Получает историю сообщений диалога.
+        Сворачивает все сообщения диалога, кроме summary_keep_messages последних, в резюме.
 
         Args:
             conversation_id: Идентификатор диалога
 
         Returns:
-            list[BaseMessage]: Список сообщений диалога
+            bool: Обновлено ли резюме
         """
-        memory = self.get_memory(conversation_id)
-        return memory.chat_memory.messages
+        conversation = await self._get(conversation_id)
+        if conversation is None:
+            return False
+        covered = len(conversation.messages) - settings.summary_keep_messages
+        if covered <= 0:
+            return False
+
+        history_parts = _format_messages(conversation.messages[:covered])
+        if conversation.summary:
+            history_parts.insert(0, f"Предыдущее резюме: {conversation.summary}")
+        chain = SUMMARY_PROMPT | self.llm
+        with timed_call(LLM_CALL_SECONDS, "summary"):
+            response = await chain.ainvoke({"history": "\n".join(history_parts)})
+        with MEMORY_OPERATION_SECONDS.time("set_summary"):
+            applied = await self.store.set_summary(
+                conversation_id, response.content.strip(), covered, expected_summary=conversation.summary
+            )
+        if not applied:
+            logger.info(f"Резюме conversation_id={conversation_id} уже обновлено параллельно, результат отброшен")
+        return applied
 
-    def get_summary(self, conversation_id: str) -> str:
+    async def get_summary(self, conversation_id: str) -> str:
         """
         Получает summary диалога.
 
@@ -71,12 +123,27 @@ class ConversationMemory:
         Returns:
             str: Резюме диалога
         """
-        memory = self.get_memory(conversation_id)
-        return memory.moving_summary_buffer or ""
+        conversation = await self._get(conversation_id)
+        return conversation.summary if conversation else ""
 
-    def format_history(self, conversation_id: str) -> str:
+    async def get_history(self, conversation_id: str) -> tuple[str, list[str]]:
         """
-        Форматирует историю диалога в строку для промпта.
+        Получает последнее резюме и последние сообщения диалога.
+
+        Args:
+            conversation_id: Идентификатор диалога
+
+        Returns:
+            tuple: (резюме, не более max_history_messages сообщений вида "Роль: текст" от старых к новым)
+        """
+        conversation = await self._get(conversation_id)
+        if conversation is None:
+            return "", []
+        return conversation.summary, _format_messages(conversation.messages[-settings.max_history_messages :])
+
+    async def format_history(self, conversation_id: str) -> str:
+        """
+        Форматирует историю диалога в строку для промпта: последнее резюме и последние сообщения.
 
         Args:
             conversation_id: Идентификатор диалога
@@ -84,18 +151,15 @@ class ConversationMemory:
         Returns:
             str: Отформатированная история диалога
         """
-        messages = self.get_history(conversation_id)
-        if not messages:
+        summary, history_parts = await self.get_history(conversation_id)
+        if summary:
+            history_parts.insert(0, f"Резюме предыдущей части диалога: {summary}")
+        if not history_parts:
             return "Истории диалога нет."
 
-        history_parts = []
-        for msg in messages[-settings.max_history_messages :]:
-            role = "Пользователь" if msg.type == "human" else "Агент"
-            history_parts.append(f"{role}: {msg.content}")
-
         return "\n".join(history_parts)
 
-    def is_first_message(self, conversation_id: str) -> bool:
+    async def is_first_message(self, conversation_id: str) -> bool:
         """
         Проверяет, является ли это первым сообщением в диалоге.
 
@@ -105,8 +169,32 @@ class ConversationMemory:
         Returns:
             bool: True если это первое сообщение
         """
-        return conversation_id not in self.memories or len(self.get_history(conversation_id)) == 0
+        conversation = await self._get(conversation_id)
+        return conversation is None or (not conversation.messages and not conversation.summary)
 
+    async def stats(self) -> dict[str, int]:
+        """
+        Возвращает статистику памяти.
+
+        Returns:
+            dict: Количество хранимых диалогов, ожидающих, выполненных и неудачных суммаризаций
+        """
+        conversations = await self.store.count()
+        with self._lock:
+            return {
+                "conversations": conversations,
+                "summaries_pending": len(self._summary_tasks),
+                "summaries_completed": self.summaries_completed,
+                "summaries_failed": self.summaries_failed,
+            }
+
+    async def close(self) -> None:
+        """Отменяет незавершённые суммаризации и закрывает хранилище."""
+        tasks = list(self._summary_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.close()
 
-conversation_memory = ConversationMemory()
 
+conversation_memory = ConversationMemory()
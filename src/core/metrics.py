@@ -0,0 +1,265 @@
+"""
+Метрики приложения в текстовом формате Prometheus для /metrics.
+
+Счётчики, gauge и гистограммы без внешних зависимостей. Наблюдение - поиск корзины
+bisect'ом и несколько сложений под блокировкой метрики, поэтому метрики можно
+держать включёнными в проде. Серии создаются при первом наблюдении с новыми метками.
+"""
+import asyncio
+import bisect
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+# Границы корзин в секундах: от быстрых этапов (fusion, BM25) до вызовов LLM
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, имена меток и серии по значениям меток."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _check_labels(self, labels: tuple[str, ...]) -> None:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {labels}")
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def collect(self) -> list[str]:
+        """Строки метрики в текстовом формате Prometheus."""
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}", *self._samples()]
+
+
+class Counter(_Metric):
+    """Монотонный счётчик."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, value: float = 1.0) -> None:
+        """Увеличивает счётчик серии с метками labels."""
+        with self._lock:
+            if labels not in self._values:
+                self._check_labels(labels)
+                self._values[labels] = 0.0
+            self._values[labels] += value
+
+    def value(self, *labels: str) -> float:
+        """Текущее значение серии (0, если наблюдений не было)."""
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и уменьшаться."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        """Задаёт значение серии."""
+        with self._lock:
+            if labels not in self._values:
+                self._check_labels(labels)
+            self._values[labels] = float(value)
+
+    def inc(self, *labels: str, value: float = 1.0) -> None:
+        """Увеличивает значение серии."""
+        with self._lock:
+            if labels not in self._values:
+                self._check_labels(labels)
+                self._values[labels] = 0.0
+            self._values[labels] += value
+
+    def dec(self, *labels: str, value: float = 1.0) -> None:
+        """Уменьшает значение серии."""
+        self.inc(*labels, value=-value)
+
+    @contextmanager
+    def track(self, *labels: str) -> Iterator[None]:
+        """Увеличивает значение на время блока (например, запросы в обработке)."""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Histogram(_Metric):
+    """Гистограмма длительностей с фиксированными корзинами, суммой и количеством."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для серии: счётчики по корзинам (последняя - +Inf), сумма
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Добавляет наблюдение в серию с метками labels."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                self._check_labels(labels)
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Замеряет длительность блока."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = [(labels, list(counts), total[0]) for labels, (counts, total) in self._series.items()]
+        lines = []
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                bucket_labels = _format_labels((*self.labelnames, "le"), (*labels, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            series_labels = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{series_labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{series_labels} {cumulative}")
+        return lines
+
+
+@contextmanager
+def timed_call(histogram: Histogram, *labels: str) -> Iterator[None]:
+    """
+    Замеряет вызов с меткой статуса: ok, error или cancelled (отмена задачи, обрыв стрима).
+
+    Args:
+        histogram: Гистограмма, последняя метка которой - status
+        labels: Остальные метки
+    """
+    started = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    except (GeneratorExit, asyncio.CancelledError):
+        status = "cancelled"
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, *labels, status)
+
+
+class MetricsRegistry:
+    """Набор метрик, отдаваемых одной страницей /metrics."""
+
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        metric = Gauge(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "onlineshoprag_http_request_duration_seconds",
+    "Время обработки запроса к API до последнего байта ответа",
+    ("endpoint", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge(
+    "onlineshoprag_http_requests_in_flight", "Запросы к API в обработке", ("endpoint",)
+)
+STAGE_SECONDS = registry.histogram(
+    "onlineshoprag_stage_duration_seconds",
+    "Длительность этапов обработки сообщения (scenario, retrieval.embedding, retrieval.dense_search, "
+    "retrieval.bm25, retrieval.fusion, retrieval.rerank, prepare, llm, llm_first_token, total)",
+    ("stage",),
+)
+STAGE_FAILURES = registry.counter(
+    "onlineshoprag_stage_failures", "Этапы, завершившиеся таймаутом или ошибкой", ("stage", "reason")
+)
+ANSWERS = registry.counter("onlineshoprag_answers", "Ответы по источнику: llm или semantic_cache", ("source",))
+LLM_CALL_SECONDS = registry.histogram(
+    "onlineshoprag_llm_call_duration_seconds",
+    "Длительность вызовов LLM по назначению (condition, condition_batch, answer, summary)",
+    ("kind", "status"),
+)
+LLM_IN_FLIGHT = registry.gauge("onlineshoprag_llm_in_flight", "Вызовы LLM, выполняющиеся в шлюзе")
+MEMORY_OPERATION_SECONDS = registry.histogram(
+    "onlineshoprag_memory_operation_duration_seconds", "Длительность операций хранилища диалогов", ("operation",)
+)
+CONVERSATIONS = registry.gauge("onlineshoprag_conversations", "Диалоги в хранилище памяти")
+SUMMARIES_PENDING = registry.gauge("onlineshoprag_summaries_pending", "Запланированные фоновые суммаризации")
+READY = registry.gauge("onlineshoprag_ready", "1, если приложение инициализировано и прогрето")
+TRACES = registry.counter(
+    "onlineshoprag_traces", "Трассы запросов: sampled, dropped (очередь заполнена), exported, failed", ("outcome",)
+)
+TRACE_QUEUE = registry.gauge("onlineshoprag_trace_queue", "Трассы, ожидающие отправки в MLflow")
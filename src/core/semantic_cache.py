@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    """Закэшированный ответ на первый вопрос диалога."""
+
+    answer: str
+    chunks: list[dict[str, Any]]
+    context_key: str
+    kb_version: int
+    vector: np.ndarray
+    created_at: float
+
+
+class SemanticAnswerCache:
+    """Кэш ответов на первые вопросы диалога с поиском по косинусной близости.
+
+    Ответ переиспользуется только при совпадении контекста сценария (context_key),
+    поэтому ответы, зависящие от данных конкретного пользователя, не утекают в чужие диалоги.
+    """
+
+    def __init__(self, threshold: float, max_size: int, ttl_seconds: float | None = None) -> None:
+        """
+        Инициализирует кэш.
+
+        Args:
+            threshold: Минимальная косинусная близость вопросов для попадания
+            max_size: Максимальное количество ответов в кэше
+            ttl_seconds: Время жизни ответа в секундах (None или 0 - без TTL)
+        """
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds or None
+        self._entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_context_key(scenario_context: str) -> str:
+        """
+        Строит ключ контекста сценария.
+
+        Args:
+            scenario_context: Контекст, сформированный сценарием
+
+        Returns:
+            str: Хэш контекста
+        """
+        return hashlib.sha1(scenario_context.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(vector: list[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def lookup(self, vector: list[float], context_key: str, kb_version: int) -> CachedAnswer | None:
+        """
+        Ищет закэшированный ответ на близкий вопрос.
+
+        Args:
+            vector: Эмбеддинг вопроса
+            context_key: Ключ контекста сценария
+            kb_version: Текущая версия базы знаний
+
+        Returns:
+            CachedAnswer | None: Лучший подходящий ответ или None
+        """
+        query = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            self._drop_stale(now, kb_version)
+            candidates = [
+                (entry_id, entry) for entry_id, entry in self._entries.items() if entry.context_key == context_key
+            ]
+            if candidates:
+                similarities = np.stack([entry.vector for _, entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        vector: list[float],
+        context_key: str,
+        kb_version: int,
+        answer: str,
+        chunks: list[dict[str, Any]],
+    ) -> None:
+        """
+        Сохраняет ответ на первый вопрос диалога.
+
+        Args:
+            vector: Эмбеддинг вопроса
+            context_key: Ключ контекста сценария
+            kb_version: Версия базы знаний, по которой получен ответ
+            answer: Ответ агента
+            chunks: Найденные чанки
+        """
+        entry = CachedAnswer(
+            answer=answer,
+            chunks=chunks,
+            context_key=context_key,
+            kb_version=kb_version,
+            vector=self._normalize(vector),
+            created_at=time.monotonic(),
+        )
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Очищает кэш (например, после переиндексации базы знаний)."""
+        with self._lock:
+            self.evictions += len(self._entries)
+            self._entries.clear()
+
+    def _drop_stale(self, now: float, kb_version: int) -> None:
+        """Удаляет записи с истёкшим TTL или от предыдущей версии базы знаний."""
+        stale = [
+            entry_id
+            for entry_id, entry in self._entries.items()
+            if entry.kb_version != kb_version or (self.ttl_seconds and now - entry.created_at > self.ttl_seconds)
+        ]
+        for entry_id in stale:
+            del self._entries[entry_id]
+        self.evictions += len(stale)
+
+    def stats(self) -> dict[str, float]:
+        """
+        Возвращает статистику кэша.
+
+        Returns:
+            dict: size, hits, misses, evictions, hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,8 +1,6 @@
 from pathlib import Path
 
-from qdrant_client import QdrantClient
-
-from src.core.logging_config import get_logger
+from src.core.logging_config import get_logger, setup_logging
 from src.settings import settings
 from src.rag.retriever import RAGRetriever
 
@@ -11,19 +9,15 @@ logger = get_logger(__name__)
 
 def check_and_index_qdrant(retriever: RAGRetriever) -> None:
     """
-    Проверяет наличие данных в Qdrant и индексирует при необходимости.
-    """
-    client = QdrantClient(host=settings.qdrant_host, port=settings.qdrant_port)
+    Синхронизирует Qdrant с файлом базы знаний.
 
-    try:
-        collection_info = client.get_collection(settings.qdrant_collection_name)
-        points_count = collection_info.points_count
-        if points_count > 0:
-            logger.info(f"Qdrant коллекция уже содержит {points_count} векторов, пропускаем индексацию")
-            return
-    except Exception:
-        pass
+    Индексация инкрементальная: если документ не менялся, ничего не эмбеддится,
+    а правки в документе доходят до коллекции при следующем старте.
 
+    Raises:
+        Exception: Ошибка индексации не перехватывается, чтобы приложение не считалось
+            готовым с пустой или устаревшей базой знаний
+    """
     project_root = Path(__file__).parent.parent.parent
     html_path = project_root / settings.context_html_file
 
@@ -31,10 +25,19 @@ def check_and_index_qdrant(retriever: RAGRetriever) -> None:
         logger.warning(f"Файл {html_path} не найден, пропускаем индексацию")
         return
 
-    logger.info("Начинаем индексацию документа в Qdrant...")
-    try:
-        retriever.index_document(str(html_path))
-        logger.info("Индексация завершена успешно")
-    except Exception as e:
-        logger.error(f"Ошибка при индексации: {e}", exc_info=True)
+    logger.info("Начинаем синхронизацию документа с Qdrant...")
+    report = retriever.index_document(str(html_path))
+    logger.info(
+        f"Индексация завершена успешно: добавлено {report.added}, обновлено {report.updated}, "
+        f"удалено {report.deleted}, без изменений {report.unchanged}"
+    )
+
+
+def main() -> None:
+    """Синхронизирует базу знаний с хранилищем и завершается (используется src.serve до старта воркеров)."""
+    setup_logging()
+    check_and_index_qdrant(RAGRetriever())
+
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Выборочная асинхронная трассировка запросов в MLflow.
+
+Решение о записи принимается по завершении запроса (tail sampling): записываются
+доля tracing_sample_rate обычных запросов, все запросы с ошибкой и все запросы
+дольше tracing_slow_ms. Трасса строится из таймингов этапов, уже собранных агентом,
+поэтому на пути запроса нет ни колбэков LangChain, ни сетевых вызовов: запись кладётся
+в ограниченную очередь, в MLflow её отправляет фоновый поток. Если очередь заполнена
+(MLflow медленный или недоступен), запись отбрасывается, а не блокирует запрос.
+"""
+import queue
+import random
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from src.core.logging_config import get_logger
+from src.core.metrics import TRACES
+
+logger = get_logger(__name__)
+
+# Длина текстов сообщения и ответа в трассе
+MAX_TEXT_CHARS = 2000
+# Не чаще одного предупреждения об ошибке экспорта за этот интервал, секунд
+EXPORT_ERROR_LOG_INTERVAL = 60.0
+
+
+@dataclass(slots=True)
+class TraceRecord:
+    """Завершённый запрос для экспорта: корневой спан и спаны этапов по таймингам."""
+
+    name: str
+    started_ns: int
+    timings: dict[str, float]
+    inputs: dict[str, Any]
+    outputs: dict[str, Any] = field(default_factory=dict)
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
+
+def truncate(text: str, limit: int = MAX_TEXT_CHARS) -> str:
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class MlflowTraceExporter:
+    """Отправляет записи в MLflow как трассу: корневой спан запроса и дочерние спаны этапов."""
+
+    # Этапы, которые становятся дочерними спанами (остальные тайминги - атрибуты корня), и тип спана
+    STAGE_SPANS = {"scenario": "CHAIN", "retrieval": "RETRIEVER", "llm": "LLM"}
+
+    def __init__(self, tracking_uri: str, experiment_name: str) -> None:
+        """
+        Args:
+            tracking_uri: Адрес сервера MLflow
+            experiment_name: Эксперимент для трасс
+        """
+        import mlflow
+
+        self.mlflow = mlflow
+        mlflow.set_tracking_uri(tracking_uri)
+        self.experiment_id = mlflow.set_experiment(experiment_name).experiment_id
+
+    def _stage_start_ns(self, record: TraceRecord, stage: str) -> int:
+        """Начало этапа: сценарий и поиск идут с начала запроса, LLM - после подготовки промпта."""
+        if stage == "llm":
+            return record.started_ns + int(record.timings.get("prepare", 0.0) * 1e9)
+        return record.started_ns
+
+    def export(self, record: TraceRecord) -> None:
+        """Записывает трассу в MLflow (вызывается из фонового потока)."""
+        total_ns = int(record.timings.get("total", 0.0) * 1e9)
+        attributes = {
+            **record.attributes,
+            **{f"timing_ms.{stage}": round(seconds * 1000, 2) for stage, seconds in record.timings.items()},
+        }
+        root = self.mlflow.start_span_no_context(
+            record.name,
+            span_type="CHAIN",
+            inputs=record.inputs,
+            attributes=attributes,
+            experiment_id=self.experiment_id,
+            start_time_ns=record.started_ns,
+        )
+        for stage, span_type in self.STAGE_SPANS.items():
+            if stage not in record.timings:
+                continue
+            start_ns = self._stage_start_ns(record, stage)
+            span = self.mlflow.start_span_no_context(
+                stage, span_type=span_type, parent_span=root, start_time_ns=start_ns
+            )
+            span.end(end_time_ns=start_ns + int(record.timings[stage] * 1e9))
+        root.end(
+            outputs=record.outputs or None,
+            attributes={"error": record.error} if record.error else None,
+            status="ERROR" if record.error else "OK",
+            end_time_ns=record.started_ns + total_ns,
+        )
+
+
+class RequestTracer:
+    """Выборка запросов для трассировки и фоновый экспорт через ограниченную очередь."""
+
+    def __init__(
+        self,
+        export: Callable[[TraceRecord], None],
+        sample_rate: float,
+        slow_seconds: float,
+        queue_size: int,
+    ) -> None:
+        """
+        Запускает фоновый поток экспорта.
+
+        Args:
+            export: Функция отправки записи (например, MlflowTraceExporter.export)
+            sample_rate: Доля обычных запросов, которые записываются (0..1)
+            slow_seconds: Запросы дольше этого порога записываются всегда
+            queue_size: Максимум записей, ожидающих отправки
+        """
+        self._export = export
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self._queue: queue.Queue[TraceRecord | None] = queue.Queue(maxsize=queue_size)
+        self._last_error_logged = 0.0
+        self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._worker.start()
+
+    def should_sample(self, total_seconds: float, error: bool) -> bool:
+        """
+        Решает, записывать ли запрос.
+
+        Args:
+            total_seconds: Длительность запроса
+            error: Завершился ли запрос ошибкой
+
+        Returns:
+            bool: True для ошибок, медленных запросов и случайной доли sample_rate остальных
+        """
+        if error or total_seconds >= self.slow_seconds:
+            return True
+        return random.random() < self.sample_rate
+
+    def submit(self, record: TraceRecord) -> None:
+        """Ставит запись в очередь экспорта; при заполненной очереди запись отбрасывается."""
+        try:
+            self._queue.put_nowait(record)
+            TRACES.inc("sampled")
+        except queue.Full:
+            TRACES.inc("dropped")
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            try:
+                self._export(record)
+                TRACES.inc("exported")
+            except Exception as e:
+                TRACES.inc("failed")
+                now = time.monotonic()
+                if now - self._last_error_logged >= EXPORT_ERROR_LOG_INTERVAL:
+                    self._last_error_logged = now
+                    logger.warning(f"Не удалось отправить трассу в MLflow: {type(e).__name__}: {e}")
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Останавливает экспорт, дав отправить накопленные записи за timeout секунд.
+
+        Args:
+            timeout: Сколько ждать фоновый поток
+        """
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._worker.join(timeout)
+
+    def pending(self) -> int:
+        """Записи, ожидающие отправки."""
+        return self._queue.qsize()
@@ -1,19 +1,45 @@
+from functools import lru_cache
+
+import httpx
 from langchain_openai import ChatOpenAI
 
+from src.llm.gateway import LLMGateway
 from src.settings import settings
 
 
-def get_llm() -> ChatOpenAI:
+@lru_cache(maxsize=1)
+def get_llm() -> LLMGateway:
     """
-    Создает и возвращает экземпляр ChatOpenAI.
+    Возвращает общий для процесса шлюз к LLM.
+
+    Шлюз создаётся один раз: все вызовы (проверка условий сценария, ответы,
+    суммаризация памяти) идут через один ChatOpenAI с пулом keep-alive соединений,
+    общим ограничением числа одновременных запросов, повторами и таймаутами.
 
     Returns:
-        ChatOpenAI: Экземпляр LLM для генерации ответов
+        LLMGateway: Шлюз к LLM с интерфейсом чат-модели Langchain
     """
-    return ChatOpenAI(
+    limits = httpx.Limits(
+        max_connections=settings.llm_max_in_flight,
+        max_keepalive_connections=settings.llm_max_in_flight,
+        keepalive_expiry=settings.llm_keepalive_seconds,
+    )
+    llm = ChatOpenAI(
         model=settings.llm_model,
         api_key=settings.llm_api_key,
         base_url=settings.llm_api_base,
         temperature=0.7,
+        # Повторы и таймауты выполняет шлюз
+        max_retries=0,
+        timeout=settings.llm_timeout_seconds,
+        http_client=httpx.Client(limits=limits, timeout=settings.llm_timeout_seconds),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=settings.llm_timeout_seconds),
+    )
+    return LLMGateway(
+        llm=llm,
+        max_in_flight=settings.llm_max_in_flight,
+        max_retries=settings.llm_max_retries,
+        timeout=settings.llm_timeout_seconds,
+        backoff_base=settings.llm_retry_backoff_seconds,
+        backoff_max=settings.llm_retry_backoff_max_seconds,
     )
-
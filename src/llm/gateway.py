@@ -0,0 +1,279 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import openai
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from src.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Сколько последних замеров хранится для перцентилей
+METRICS_WINDOW = 1024
+
+
+class GatewayMetrics:
+    """Потокобезопасные счётчики и окна замеров шлюза LLM."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.queue_wait: deque[float] = deque(maxlen=METRICS_WINDOW)
+        self.upstream_latency: deque[float] = deque(maxlen=METRICS_WINDOW)
+
+    def add(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            getattr(self, name).append(seconds)
+
+    @staticmethod
+    def _percentile(values: list[float], q: float) -> float:
+        if not values:
+            return 0.0
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def stats(self) -> dict[str, float]:
+        """
+        Возвращает статистику шлюза.
+
+        Returns:
+            dict: Счётчики и p50/p95 ожидания в очереди и задержки upstream в секундах
+        """
+        with self._lock:
+            queue_wait = list(self.queue_wait)
+            upstream = list(self.upstream_latency)
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "in_flight": self.in_flight,
+                "queue_wait_p50": self._percentile(queue_wait, 0.5),
+                "queue_wait_p95": self._percentile(queue_wait, 0.95),
+                "upstream_latency_p50": self._percentile(upstream, 0.5),
+                "upstream_latency_p95": self._percentile(upstream, 0.95),
+            }
+
+
+def _retry_after(error: Exception) -> float | None:
+    """Извлекает задержку из заголовков Retry-After / retry-after-ms ответа, если они есть."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    """429, 5xx, обрывы соединения и таймауты повторяются, остальные ошибки - нет."""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, TimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class LLMGateway(BaseChatModel):
+    """Общий для процесса шлюз к LLM поверх одной модели с пулом keep-alive соединений.
+
+    Ограничивает число одновременных запросов семафором, повторяет запросы
+    при 429/5xx с экспоненциальной задержкой со случайным разбросом (учитывая Retry-After),
+    ограничивает время каждого вызова и собирает метрики ожидания в очереди и задержки upstream.
+    Стриминг повторяется только до первого полученного токена. Синхронные вызовы
+    ограничиваются отдельным семафором того же размера.
+    """
+
+    llm: BaseChatModel
+    max_in_flight: int = 16
+    max_retries: int = 3
+    timeout: float = 60.0
+    backoff_base: float = 0.5
+    backoff_max: float = 10.0
+
+    _metrics: GatewayMetrics = PrivateAttr(default_factory=GatewayMetrics)
+    _async_semaphore: asyncio.Semaphore | None = PrivateAttr(default=None)
+    _semaphore_loop: asyncio.AbstractEventLoop | None = PrivateAttr(default=None)
+    _sync_semaphore: threading.BoundedSemaphore | None = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-gateway"
+
+    @property
+    def metrics(self) -> GatewayMetrics:
+        return self._metrics
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Задержка перед повтором: Retry-After от сервера или экспонента с полным разбросом."""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max) + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _should_retry(self, attempt: int, error: Exception) -> bool:
+        if isinstance(error, TimeoutError):
+            self._metrics.add("timeouts")
+        if attempt < self.max_retries and _is_retryable(error):
+            self._metrics.add("retries")
+            return True
+        self._metrics.add("failures")
+        return False
+
+    @asynccontextmanager
+    async def _async_slot(self):
+        """Занимает место в семафоре (создаётся заново для нового event loop) и считает ожидание."""
+        loop = asyncio.get_running_loop()
+        if self._async_semaphore is None or self._semaphore_loop is not loop:
+            self._async_semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._semaphore_loop = loop
+        started = time.perf_counter()
+        async with self._async_semaphore:
+            self._metrics.observe("queue_wait", time.perf_counter() - started)
+            self._metrics.add("in_flight")
+            try:
+                yield
+            finally:
+                self._metrics.add("in_flight", -1)
+
+    @contextmanager
+    def _sync_slot(self):
+        """То же для синхронных вызовов (например, суммаризации памяти в потоке)."""
+        if self._sync_semaphore is None:
+            self._sync_semaphore = threading.BoundedSemaphore(self.max_in_flight)
+        started = time.perf_counter()
+        with self._sync_semaphore:
+            self._metrics.observe("queue_wait", time.perf_counter() - started)
+            self._metrics.add("in_flight")
+            try:
+                yield
+            finally:
+                self._metrics.add("in_flight", -1)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._metrics.add("calls")
+        async with self._async_slot():
+            attempt = 0
+            while True:
+                started = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(self.llm._agenerate(messages, stop=stop, **kwargs), self.timeout)
+                    self._metrics.observe("upstream_latency", time.perf_counter() - started)
+                    return result
+                except Exception as e:
+                    if not self._should_retry(attempt, e):
+                        raise
+                    delay = self._backoff(attempt, e)
+                    logger.warning(f"Ошибка LLM ({type(e).__name__}), повтор {attempt + 1} через {delay:.2f} с")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        self._metrics.add("calls")
+        async with self._async_slot():
+            attempt = 0
+            while True:
+                started = time.perf_counter()
+                stream = self.llm._astream(messages, stop=stop, **kwargs)
+                try:
+                    # Таймаут ограничивает ожидание каждого следующего фрагмента
+                    first = await asyncio.wait_for(anext(stream), self.timeout)
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    await stream.aclose()
+                    if not self._should_retry(attempt, e):
+                        raise
+                    delay = self._backoff(attempt, e)
+                    logger.warning(f"Ошибка LLM ({type(e).__name__}), повтор {attempt + 1} через {delay:.2f} с")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+
+                try:
+                    chunk = first
+                    while True:
+                        if run_manager:
+                            await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                        yield chunk
+                        try:
+                            chunk = await asyncio.wait_for(anext(stream), self.timeout)
+                        except StopAsyncIteration:
+                            break
+                except Exception as e:
+                    # После первого фрагмента запрос не повторяется: часть ответа уже отдана
+                    if isinstance(e, TimeoutError):
+                        self._metrics.add("timeouts")
+                    self._metrics.add("failures")
+                    raise
+                finally:
+                    await stream.aclose()
+                self._metrics.observe("upstream_latency", time.perf_counter() - started)
+                return
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._metrics.add("calls")
+        with self._sync_slot():
+            attempt = 0
+            while True:
+                started = time.perf_counter()
+                try:
+                    result = self.llm._generate(messages, stop=stop, **kwargs)
+                    self._metrics.observe("upstream_latency", time.perf_counter() - started)
+                    return result
+                except Exception as e:
+                    if not self._should_retry(attempt, e):
+                        raise
+                    delay = self._backoff(attempt, e)
+                    logger.warning(f"Ошибка LLM ({type(e).__name__}), повтор {attempt + 1} через {delay:.2f} с")
+                    time.sleep(delay)
+                    attempt += 1
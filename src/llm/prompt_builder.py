@@ -0,0 +1,236 @@
+import math
+from dataclasses import dataclass, field
+from typing import Any
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Запасная оценка, если токенизатор недоступен: для русского текста в BPE-токенизаторах
+# выходит около 3 символов на токен
+CHARS_PER_TOKEN = 3
+# Служебные токены на каждое сообщение чата (роль и разделители)
+TOKENS_PER_MESSAGE = 4
+
+
+class TokenCounter:
+    """Подсчёт токенов токенизатором модели (tiktoken) с запасной оценкой по длине текста."""
+
+    def __init__(self, encoding_name: str) -> None:
+        """
+        Args:
+            encoding_name: Имя кодировки tiktoken (o200k_base для gpt-oss и gpt-4o)
+        """
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+
+    def _get_encoding(self):
+        if not self._loaded:
+            self._loaded = True
+            try:
+                import tiktoken
+
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                logger.warning(
+                    f"Токенизатор {self.encoding_name} недоступен ({type(e).__name__}), "
+                    f"токены оцениваются как {CHARS_PER_TOKEN} символа на токен"
+                )
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        """
+        Считает токены в тексте.
+
+        Args:
+            text: Текст
+
+        Returns:
+            int: Количество токенов
+        """
+        if not text:
+            return 0
+        encoding = self._get_encoding()
+        if encoding is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(encoding.encode(text, disallowed_special=()))
+
+
+def _merge_overlap(first: str, second: str, max_overlap: int) -> str:
+    """Склеивает соседние части чанка, убирая перекрытие (суффикс первой = префикс второй)."""
+    for size in range(min(len(first), len(second), max_overlap), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first} {second}"
+
+
+def _split_chunk_id(chunk_id: str) -> tuple[str, int | None]:
+    """Разбирает id вида "12_0" на исходный чанк и номер части."""
+    parent, _, index = chunk_id.rpartition("_")
+    if parent and index.isdigit():
+        return parent, int(index)
+    return chunk_id, None
+
+
+def merge_sibling_chunks(chunks: list[dict[str, Any]], max_overlap: int) -> list[dict[str, Any]]:
+    """
+    Объединяет части одного исходного чанка и удаляет повторы.
+
+    split_chunks режет чанк на части _0, _1, ... с перекрытием: если в выдачу попало
+    несколько частей одного чанка, соседние части склеиваются без перекрытия,
+    несоседние - через пробел в порядке номеров. Группа занимает место своей лучшей
+    части в ранжировании. Чанки с одинаковым текстом остаются в одном экземпляре.
+
+    Args:
+        chunks: Чанки в порядке убывания релевантности
+        max_overlap: Максимальная длина перекрытия в символах (chunk_overlap)
+
+    Returns:
+        list[dict]: Объединённые чанки (chunk_id через "+", score - максимальный)
+    """
+    groups: dict[str, list[tuple[int | None, dict[str, Any]]]] = {}
+    seen_texts: set[str] = set()
+    for chunk in chunks:
+        text_key = " ".join(chunk["text"].split())
+        if text_key in seen_texts:
+            continue
+        seen_texts.add(text_key)
+        parent, index = _split_chunk_id(chunk["chunk_id"])
+        groups.setdefault(parent, []).append((index, chunk))
+
+    merged = []
+    for parts in groups.values():
+        if len(parts) == 1:
+            merged.append(parts[0][1])
+            continue
+        parts.sort(key=lambda part: (part[0] is None, part[0] or 0))
+        text = parts[0][1]["text"]
+        for (previous_index, _), (index, chunk) in zip(parts, parts[1:]):
+            adjacent = previous_index is not None and index == previous_index + 1
+            text = _merge_overlap(text, chunk["text"], max_overlap) if adjacent else f"{text} {chunk['text']}"
+        best = max((chunk for _, chunk in parts), key=lambda chunk: chunk.get("score", 0.0))
+        merged.append(
+            best | {"text": text, "chunk_id": "+".join(chunk["chunk_id"] for _, chunk in parts), "score": best.get("score", 0.0)}
+        )
+    return merged
+
+
+@dataclass
+class BuiltPrompt:
+    """Входные данные промпта, собранные в бюджет токенов."""
+
+    inputs: dict[str, str]
+    tokens: int
+    # Сколько чанков и сообщений истории не поместилось в бюджет
+    dropped_chunks: int = 0
+    dropped_history: int = 0
+    sections: dict[str, int] = field(default_factory=dict)
+
+
+class PromptBuilder:
+    """Собирает контекст сценария, чанки и историю в бюджет токенов по приоритету.
+
+    Системный промпт, вопрос пользователя и контекст сценария входят всегда.
+    Оставшийся бюджет заполняется в порядке: лучший чанк, последняя пара сообщений
+    истории и резюме, остальные чанки по убыванию релевантности, более ранние
+    сообщения истории от новых к старым. История не прерывается: если сообщение
+    не поместилось, более старые тоже не добавляются.
+    """
+
+    def __init__(self, prompt: ChatPromptTemplate, counter: TokenCounter, max_tokens: int, max_overlap: int) -> None:
+        """
+        Args:
+            prompt: Шаблон промпта с переменными context, history, question
+            counter: Счётчик токенов
+            max_tokens: Бюджет токенов на весь промпт
+            max_overlap: Перекрытие соседних частей чанков в символах
+        """
+        self.prompt = prompt
+        self.counter = counter
+        self.max_tokens = max_tokens
+        self.max_overlap = max_overlap
+        self._base_tokens: int | None = None
+
+    def _count_messages(self, **inputs: str) -> int:
+        messages = self.prompt.format_messages(**inputs)
+        return sum(self.counter.count(message.content) + TOKENS_PER_MESSAGE for message in messages)
+
+    @property
+    def base_tokens(self) -> int:
+        """Токены шаблона с пустыми переменными."""
+        if self._base_tokens is None:
+            self._base_tokens = self._count_messages(context="", history="", question="")
+        return self._base_tokens
+
+    def build(
+        self,
+        question: str,
+        scenario_context: str,
+        chunks: list[dict[str, Any]],
+        history_summary: str,
+        history: list[str],
+    ) -> BuiltPrompt:
+        """
+        Собирает входные данные промпта.
+
+        Args:
+            question: Вопрос пользователя
+            scenario_context: Контекст сценария (может быть пустым)
+            chunks: Найденные чанки в порядке убывания релевантности
+            history_summary: Резюме ранней части диалога (может быть пустым)
+            history: Сообщения истории вида "Роль: текст" от старых к новым
+
+        Returns:
+            BuiltPrompt: Входные данные промпта и число токенов
+        """
+        chunks = merge_sibling_chunks(chunks, self.max_overlap)
+        used = self.base_tokens + self.counter.count(question) + self.counter.count(scenario_context)
+
+        # Кандидаты: (приоритет, раздел, позиция в разделе, текст) в порядке заполнения бюджета
+        candidates: list[tuple[int, str, int, str]] = []
+        for position, chunk in enumerate(chunks):
+            candidates.append((0 if position == 0 else 2, "chunks", position, chunk["text"]))
+        for age, line in enumerate(reversed(history)):
+            candidates.append((1 if age < 2 else 3, "history", age, line))
+        if history_summary:
+            candidates.append((1, "summary", 0, f"Резюме предыдущей части диалога: {history_summary}"))
+        candidates.sort(key=lambda candidate: candidate[0])
+
+        selected: dict[str, dict[int, str]] = {"chunks": {}, "summary": {}, "history": {}}
+        sections = {"base": self.base_tokens, "question": used - self.base_tokens, "chunks": 0, "history": 0}
+        history_closed = False
+        for _, section, position, text in candidates:
+            if section == "history" and history_closed:
+                continue
+            # +2 токена на разделители между частями
+            tokens = self.counter.count(text) + 2
+            if used + tokens > self.max_tokens:
+                if section == "history":
+                    history_closed = True
+                continue
+            used += tokens
+            selected[section][position] = text
+            sections["chunks" if section == "chunks" else "history"] += tokens
+
+        context_parts = [
+            f"[{number}] {selected['chunks'][position]}"
+            for number, position in enumerate(sorted(selected["chunks"]), 1)
+        ]
+        knowledge = "\n\n".join(context_parts)
+        history_lines = list(selected["summary"].values()) + [
+            selected["history"][age] for age in sorted(selected["history"], reverse=True)
+        ]
+        return BuiltPrompt(
+            inputs={
+                "context": f"{scenario_context}\n\nКонтекст из базы знаний:\n{knowledge}",
+                "history": "\n".join(history_lines) if history_lines else "Истории диалога нет.",
+                "question": question,
+            },
+            tokens=used,
+            dropped_chunks=len(chunks) - len(selected["chunks"]),
+            dropped_history=len(history) - len(selected["history"]),
+            sections=sections,
+        )
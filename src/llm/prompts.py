@@ -33,11 +33,26 @@ CONDITION_CHECK_PROMPT = ChatPromptTemplate.from_messages(
     ]
 )
 
+BATCH_CONDITION_CHECK_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            """Ты помощник для проверки условий. Проанализируй сообщение пользователя и каждое условие из списка.
+Верни только JSON-объект, где ключ - номер условия, значение - "да" или "нет". Например: {{"1": "да", "2": "нет"}}""",
+        ),
+        (
+            "human",
+            "Сообщение пользователя: {message}\n\nУсловия:\n{conditions}\n\nJSON с ответами:",
+        ),
+    ]
+)
+
 SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
     [
         (
             "system",
-            """Создай краткое резюме диалога с пользователем, выделив ключевые темы и вопросы.""",
+            """Создай краткое резюме диалога с пользователем, выделив ключевые темы и вопросы.
+Если в истории есть предыдущее резюме, дополни его новыми сообщениями.""",
         ),
         ("human", "История диалога:\n{history}\n\nРезюме:"),
     ]
@@ -1,42 +1,184 @@
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import json
+from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING
 
-import mlflow
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
 from src.core.logging_config import get_logger, setup_logging
+from src.core.metrics import (
+    CONVERSATIONS,
+    TRACE_QUEUE,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS_IN_FLIGHT,
+    LLM_IN_FLIGHT,
+    READY,
+    SUMMARIES_PENDING,
+    registry,
+    timed_call,
+)
 from src.models import ChatRequest, ChatResponse
-from src.core.agent import SupportAgent
 from src.settings import settings
-from src.core.startup import check_and_index_qdrant
-from src.rag.retriever import RAGRetriever
+
+if TYPE_CHECKING:
+    from src.core.agent import SupportAgent
 
 setup_logging()
 logger = get_logger(__name__)
 
-mlflow.set_tracking_uri(settings.mlflow_tracking_uri)
-mlflow.set_experiment(settings.mlflow_experiment_name)
-mlflow.langchain.autolog()
 
-logger.info("Инициализация приложения...")
-retriever = RAGRetriever()
-agent = SupportAgent(retriever)
-logger.info("Приложение готово к работе")
+@dataclass
+class StartupReport:
+    """Ход запуска: готовность и длительности этапов в секундах."""
+
+    ready: bool = False
+    error: str | None = None
+    import_seconds: float = 0.0
+    stages: dict[str, float] = field(default_factory=dict)
+    time_to_ready_seconds: float | None = None
+
+
+# Создаётся в фоне после старта сервера; до готовности /chat отвечает 503
+agent: "SupportAgent | None" = None
+startup = StartupReport()
+
+
+def _initialize() -> "SupportAgent":
+    """Импортирует тяжёлые модули, загружает модели, подключается к хранилищу и синхронизирует базу знаний."""
+    started = time.perf_counter()
+    from src.core.agent import SupportAgent
+    from src.core.startup import check_and_index_qdrant
+    from src.core.tracing import MlflowTraceExporter, RequestTracer
+    from src.rag.retriever import RAGRetriever
+
+    startup.stages["imports"] = time.perf_counter() - started
+
+    tracer = None
+    if settings.tracing_enabled:
+        started = time.perf_counter()
+        try:
+            exporter = MlflowTraceExporter(settings.mlflow_tracking_uri, settings.mlflow_experiment_name)
+            tracer = RequestTracer(
+                exporter.export,
+                sample_rate=settings.tracing_sample_rate,
+                slow_seconds=settings.tracing_slow_ms / 1000,
+                queue_size=settings.tracing_queue_size,
+            )
+        except Exception as e:
+            # Трассировка не должна мешать работе: без MLflow приложение работает без трасс
+            logger.warning(f"MLflow недоступен, трассировка отключена: {type(e).__name__}: {e}")
+        startup.stages["mlflow"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    retriever = RAGRetriever()
+    new_agent = SupportAgent(retriever, tracer=tracer)
+    startup.stages["init"] = time.perf_counter() - started
+
+    if settings.index_on_startup:
+        started = time.perf_counter()
+        check_and_index_qdrant(retriever)
+        startup.stages["index"] = time.perf_counter() - started
+    return new_agent
+
+
+async def _start() -> None:
+    """Инициализирует и прогревает агента в фоне, пока сервер уже отвечает на /health и /ready."""
+    global agent
+    logger.info("Инициализация приложения...")
+    try:
+        # В отдельном потоке, чтобы event loop отвечал на пробы во время загрузки
+        new_agent = await asyncio.to_thread(_initialize)
+        started = time.perf_counter()
+        warmup_timings = await new_agent.warmup()
+        startup.stages["warmup"] = time.perf_counter() - started
+    except Exception as e:
+        startup.error = f"{type(e).__name__}: {e}"
+        logger.error(f"Ошибка при инициализации приложения: {e}", exc_info=True)
+        return
+
+    agent = new_agent
+    startup.time_to_ready_seconds = time.perf_counter() - _import_started
+    startup.ready = True
+    READY.set(1)
+    stages = ", ".join(f"{name} {seconds:.2f}" for name, seconds in startup.stages.items())
+    warmup = ", ".join(f"{name} {seconds:.2f}" for name, seconds in warmup_timings.items())
+    logger.info(
+        f"Приложение готово к работе за {startup.time_to_ready_seconds:.2f} с "
+        f"(импорт модуля {startup.import_seconds:.2f}, {stages}; прогрев: {warmup})"
+    )
+
+
+def _require_agent() -> "SupportAgent":
+    """Возвращает агента или 503, если приложение ещё не готово."""
+    if agent is None:
+        detail = f"Ошибка инициализации: {startup.error}" if startup.error else "Приложение ещё не готово"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+    return agent
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения."""
     logger.info("Запуск приложения...")
-    check_and_index_qdrant(retriever)
+    startup_task = asyncio.create_task(_start())
     yield
+    startup_task.cancel()
+    if agent is not None:
+        from src.core.memory import conversation_memory
+
+        retriever = agent.retriever
+        if retriever.embedding_cache is not None:
+            logger.info(f"Статистика кэша эмбеддингов: {retriever.embedding_cache.stats()}")
+        if retriever.reranker is not None:
+            logger.info(f"Статистика переранжирования: {retriever.reranker.stats()}")
+        logger.info(f"Статистика шлюза LLM: {agent.llm.metrics.stats()}")
+        if agent.condition_cache is not None:
+            logger.info(f"Статистика кэша решений по условиям: {agent.condition_cache.stats()}")
+        if agent.condition_classifier is not None:
+            logger.info(f"Статистика локальной проверки условий: {agent.condition_classifier.stats()}")
+        logger.info(f"Статистика памяти диалогов: {await conversation_memory.stats()}")
+        await conversation_memory.close()
+        if agent.tracer is not None:
+            await asyncio.to_thread(agent.tracer.close)
     logger.info("Остановка приложения...")
 
 
 app = FastAPI(title="OnlineShopRAG API", version="0.1.0", lifespan=lifespan)
 
 @app.get("/health")
-def health_check() -> dict[str, str]:
-    """Проверка здоровья приложения."""
-    return {"status": "ok"}
+def health_check() -> JSONResponse:
+    """Проверка живости: процесс отвечает; 503, если инициализация завершилась ошибкой."""
+    if startup.error:
+        return JSONResponse({"status": "error", "detail": startup.error}, status_code=503)
+    return JSONResponse({"status": "ok"})
+
+
+@app.get("/ready")
+def ready_check() -> JSONResponse:
+    """Проверка готовности: 200 только после инициализации, индексации и прогрева, иначе 503."""
+    return JSONResponse(asdict(startup), status_code=200 if startup.ready else 503)
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """Метрики в текстовом формате Prometheus: длительности этапов, вызовов LLM, операций памяти и gauge нагрузки."""
+    if agent is not None:
+        from src.core.memory import conversation_memory
+
+        memory_stats = await conversation_memory.stats()
+        CONVERSATIONS.set(memory_stats["conversations"])
+        SUMMARIES_PENDING.set(memory_stats["summaries_pending"])
+        LLM_IN_FLIGHT.set(agent.llm.metrics.in_flight)
+        if agent.tracer is not None:
+            TRACE_QUEUE.set(agent.tracer.pending())
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.post("/chat", response_model=ChatResponse)
@@ -51,14 +193,62 @@ async def chat(request: ChatRequest) -> ChatResponse:
         ChatResponse: Ответ агента с chunks и last_step_scenario
     """
     logger.info(f"Получен запрос от conversation_id={request.conversation_id}")
+    current_agent = _require_agent()
     try:
-        response = await agent.handle_message(
-            conversation_id=request.conversation_id,
-            message=request.message,
-        )
+        with HTTP_REQUESTS_IN_FLIGHT.track("chat"), timed_call(HTTP_REQUEST_SECONDS, "chat"):
+            response = await current_agent.handle_message(
+                conversation_id=request.conversation_id,
+                message=request.message,
+            )
         logger.info(f"Ответ сформирован для conversation_id={request.conversation_id}, найдено {len(response.chunks)} чанков")
         return response
     except Exception as e:
         logger.error(f"Ошибка при обработке запроса: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+
+
+def _format_sse(event: str, data: dict) -> str:
+    """Форматирует событие в формате server-sent events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """
+    Обрабатывает запрос пользователя в чат с потоковой отдачей ответа (SSE).
+
+    События: context (chunks и last_step_scenario), token (фрагмент ответа),
+    done (итоговый ChatResponse), error (ошибка обработки).
+
+    Args:
+        request: Запрос с conversation_id и message
+
+    Returns:
+        StreamingResponse: Поток text/event-stream
+    """
+    logger.info(f"Получен потоковый запрос от conversation_id={request.conversation_id}")
+    current_agent = _require_agent()
+
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            with HTTP_REQUESTS_IN_FLIGHT.track("chat_stream"), timed_call(HTTP_REQUEST_SECONDS, "chat_stream"):
+                async for event in current_agent.stream_message(
+                    conversation_id=request.conversation_id,
+                    message=request.message,
+                ):
+                    yield _format_sse(event["event"], event["data"])
+            logger.info(f"Потоковый ответ завершён для conversation_id={request.conversation_id}")
+        except Exception as e:
+            logger.error(f"Ошибка при потоковой обработке запроса: {e}", exc_info=True)
+            yield _format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+startup.import_seconds = time.perf_counter() - _import_started
+logger.info(f"Модуль приложения импортирован за {startup.import_seconds:.2f} с")
@@ -0,0 +1,225 @@
+"""
+Сервер эмбеддингов для многопроцессного запуска: модель загружается один раз
+в отдельном процессе, воркеры приложения получают векторы по Unix-сокету.
+
+Запросы от всех воркеров собираются в батчи: сервер ждёт до batch_wait_ms
+после первого запроса и эмбеддит до max_batch текстов одним вызовом модели.
+
+Протокол: кадры с 4-байтовой длиной (big-endian). Запрос - JSON {"texts": [...]},
+ответ - байт статуса, число строк и размерность (>BII) и матрица float32;
+при ошибке статус 1 и текст ошибки в UTF-8. Пустой список текстов - проверка готовности.
+
+Запуск:
+    uv run python -m src.rag.embedding_server
+"""
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.core.logging_config import get_logger, setup_logging
+from src.settings import settings
+
+logger = get_logger(__name__)
+
+_LENGTH = struct.Struct(">I")
+_HEADER = struct.Struct(">BII")
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+def _encode_vectors(vectors: np.ndarray) -> bytes:
+    rows, dim = vectors.shape if vectors.size else (0, 0)
+    return _HEADER.pack(STATUS_OK, rows, dim) + np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+
+
+def _decode_vectors(payload: bytes) -> list[list[float]]:
+    status, rows, dim = _HEADER.unpack_from(payload)
+    if status != STATUS_OK:
+        raise RuntimeError(f"Сервер эмбеддингов вернул ошибку: {payload[_HEADER.size :].decode('utf-8')}")
+    return np.frombuffer(payload, dtype=np.float32, offset=_HEADER.size).reshape(rows, dim).tolist()
+
+
+class EmbeddingServer:
+    """Сервер эмбеддингов на Unix-сокете с батчированием запросов разных клиентов."""
+
+    def __init__(self, embeddings: Embeddings, socket_path: str, max_batch: int, batch_wait_ms: float) -> None:
+        """
+        Args:
+            embeddings: Загруженная модель эмбеддингов
+            socket_path: Путь к Unix-сокету
+            max_batch: Максимум текстов в одном вызове модели
+            batch_wait_ms: Сколько ждать других запросов после первого
+        """
+        self.embeddings = embeddings
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait_ms / 1000
+        self._queue: asyncio.Queue[tuple[list[str], asyncio.Future]] = asyncio.Queue()
+        self.batches = 0
+        self.texts = 0
+
+    async def _batcher(self) -> None:
+        """Собирает запросы в батчи и эмбеддит их в отдельном потоке."""
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._queue.get()]
+            size = len(requests[0][0])
+            deadline = loop.time() + self.batch_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except TimeoutError:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                vectors = np.asarray(await asyncio.to_thread(self.embeddings.embed_documents, texts), dtype=np.float32)
+            except Exception as e:
+                logger.error(f"Ошибка эмбеддинга батча из {len(texts)} текстов: {e}", exc_info=True)
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for request_texts, future in requests:
+                if not future.done():
+                    future.set_result(vectors[offset : offset + len(request_texts)])
+                offset += len(request_texts)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Обслуживает постоянное соединение воркера."""
+        try:
+            while True:
+                try:
+                    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                    request = json.loads(await reader.readexactly(length))
+                except asyncio.IncompleteReadError:
+                    return
+                try:
+                    texts = [str(text) for text in request["texts"]]
+                    if texts:
+                        future = asyncio.get_running_loop().create_future()
+                        await self._queue.put((texts, future))
+                        response = _encode_vectors(await future)
+                    else:
+                        response = _encode_vectors(np.zeros((0, 0), dtype=np.float32))
+                except Exception as e:
+                    response = _HEADER.pack(STATUS_ERROR, 0, 0) + f"{type(e).__name__}: {e}".encode("utf-8")
+                writer.write(_LENGTH.pack(len(response)) + response)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve_forever(self) -> None:
+        """Запускает сервер; устаревший файл сокета удаляется."""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        batcher = asyncio.create_task(self._batcher())
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        logger.info(f"Сервер эмбеддингов слушает {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class RemoteEmbeddings(Embeddings):
+    """Клиент сервера эмбеддингов. У каждого потока своё постоянное соединение."""
+
+    def __init__(self, socket_path: str, timeout: float = 30.0) -> None:
+        """
+        Args:
+            socket_path: Путь к Unix-сокету сервера
+            timeout: Таймаут ответа в секундах
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        connection.connect(self.socket_path)
+        return connection
+
+    @staticmethod
+    def _read_exactly(connection: socket.socket, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            part = connection.recv(size - len(data))
+            if not part:
+                raise ConnectionError("Сервер эмбеддингов закрыл соединение")
+            data += part
+        return bytes(data)
+
+    def _request(self, texts: list[str]) -> list[list[float]]:
+        payload = json.dumps({"texts": texts}, ensure_ascii=False).encode("utf-8")
+        # Одна повторная попытка на новом соединении, если старое оборвалось (например, сервер перезапущен)
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            try:
+                if connection is None:
+                    connection = self._local.connection = self._connect()
+                connection.sendall(_LENGTH.pack(len(payload)) + payload)
+                (length,) = _LENGTH.unpack(self._read_exactly(connection, _LENGTH.size))
+                return _decode_vectors(self._read_exactly(connection, length))
+            except OSError:
+                if connection is not None:
+                    connection.close()
+                self._local.connection = None
+                if attempt == 1:
+                    raise
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Эмбеддит документы на сервере."""
+        return self._request(list(texts)) if texts else []
+
+    def embed_query(self, text: str) -> list[float]:
+        """Эмбеддит запрос на сервере."""
+        return self._request([text])[0]
+
+    def ping(self) -> None:
+        """Проверяет, что сервер отвечает (бросает OSError, если нет)."""
+        self._request([])
+
+
+def main() -> None:
+    """Загружает модель по настройкам и запускает сервер на embedding_server_socket."""
+    from src.rag.embeddings import create_embedding_model
+
+    setup_logging()
+    socket_path = settings.embedding_server_socket or "data/embeddings.sock"
+    embeddings = create_embedding_model(
+        settings.embedding_model_name,
+        backend=settings.embedding_backend,
+        threads=settings.embedding_threads,
+        onnx_file=settings.embedding_onnx_file,
+    )
+    server = EmbeddingServer(
+        embeddings,
+        socket_path,
+        max_batch=settings.embedding_server_max_batch,
+        batch_wait_ms=settings.embedding_server_batch_wait_ms,
+    )
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
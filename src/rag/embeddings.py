@@ -0,0 +1,205 @@
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from src.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Квантованный ONNX-файл из репозитория модели на Hugging Face (AVX2 есть на любом современном x86 CPU)
+DEFAULT_ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Нормализует запрос для ключа кэша: регистр, ё/е, пунктуация, пробелы.
+
+    Args:
+        text: Исходный текст запроса
+
+    Returns:
+        str: Нормализованный текст
+    """
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class EmbeddingCache:
+    """Потокобезопасный LRU-кэш эмбеддингов с TTL и счётчиками попаданий."""
+
+    def __init__(self, max_size: int, ttl_seconds: float | None = None) -> None:
+        """
+        Инициализирует кэш.
+
+        Args:
+            max_size: Максимальное количество векторов в кэше
+            ttl_seconds: Время жизни записи в секундах (None или 0 - без TTL)
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds or None
+        self._entries: OrderedDict[tuple[str, str], tuple[float, list[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple[str, str]) -> list[float] | None:
+        """
+        Возвращает вектор по ключу или None, если его нет или он устарел.
+
+        Args:
+            key: Пара (имя модели, нормализованный запрос)
+
+        Returns:
+            list[float] | None: Закэшированный вектор
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple[str, str], vector: list[float]) -> None:
+        """
+        Кладёт вектор в кэш, вытесняя самые давние записи при переполнении.
+
+        Args:
+            key: Пара (имя модели, нормализованный запрос)
+            vector: Эмбеддинг
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Очищает кэш (счётчики сохраняются)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, float]:
+        """
+        Возвращает статистику кэша.
+
+        Returns:
+            dict: size, hits, misses, evictions, hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Обёртка над моделью эмбеддингов, кэширующая эмбеддинги запросов.
+
+    Нормализованный запрос используется только как ключ кэша, на промахе эмбеддится
+    исходный текст: вектор тот же, что отдаёт модель без кэша, а варианты написания,
+    отличающиеся регистром, ё/е и пунктуацией, получают вектор первого из них.
+    Эмбеддинги документов при индексации не кэшируются.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: EmbeddingCache) -> None:
+        """
+        Инициализирует обёртку.
+
+        Args:
+            embeddings: Исходная модель эмбеддингов
+            model_name: Имя модели, входит в ключ кэша
+            cache: Хранилище векторов
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Эмбеддит документы без кэширования."""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        """Эмбеддит запрос с использованием кэша."""
+        key = (self.model_name, normalize_query(text))
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Асинхронно эмбеддит запрос: попадание в кэш отдаётся сразу, промах считается в executor."""
+        key = (self.model_name, normalize_query(text))
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = await asyncio.to_thread(self.embeddings.embed_query, text)
+            self.cache.put(key, vector)
+        return vector
+
+
+def create_embedding_model(model_name: str, backend: str = "torch", threads: int = 0, onnx_file: str = "") -> Embeddings:
+    """
+    Создаёт модель эмбеддингов для CPU с выбранным бэкендом инференса.
+
+    Бэкенды:
+        torch - исходная модель PyTorch в float32;
+        torch_int8 - динамическая int8-квантизация линейных слоёв PyTorch;
+        onnx - ONNX Runtime (нужен пакет optimum[onnxruntime]);
+        onnx_int8 - квантованный ONNX-файл из репозитория модели.
+
+    Args:
+        model_name: Имя модели sentence-transformers
+        backend: Бэкенд инференса
+        threads: Число потоков внутри операции (0 - значение по умолчанию библиотеки)
+        onnx_file: Путь к ONNX-файлу внутри репозитория модели (пусто - по умолчанию для бэкенда)
+
+    Returns:
+        Embeddings: Модель эмбеддингов
+    """
+    model_kwargs: dict = {"device": "cpu"}
+    if backend in ("onnx", "onnx_int8"):
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        if threads > 0:
+            session_options.intra_op_num_threads = threads
+        ort_kwargs: dict = {"session_options": session_options, "provider": "CPUExecutionProvider"}
+        file_name = onnx_file or (DEFAULT_ONNX_INT8_FILE if backend == "onnx_int8" else "")
+        if file_name:
+            ort_kwargs["file_name"] = file_name
+        model_kwargs.update(backend="onnx", model_kwargs=ort_kwargs)
+    elif threads > 0:
+        import torch
+
+        torch.set_num_threads(threads)
+
+    embeddings = HuggingFaceEmbeddings(model_name=model_name, model_kwargs=model_kwargs)
+
+    if backend == "torch_int8":
+        import torch
+
+        torch.quantization.quantize_dynamic(embeddings._client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    logger.info(f"Модель эмбеддингов {model_name} загружена, бэкенд {backend}")
+    return embeddings
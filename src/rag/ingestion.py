@@ -0,0 +1,115 @@
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from src.core.logging_config import get_logger
+from src.rag.vector_store import VectorBackend
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class IngestStats:
+    """Итог загрузки документов в хранилище векторов."""
+
+    chunks: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        """Пропускная способность загрузки."""
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+
+class IngestionPipeline:
+    """Пакетный эмбеддинг документов в пуле потоков с конвейерной загрузкой в хранилище.
+
+    Документы сортируются по длине, чтобы внутри батча было меньше паддинга.
+    Батчи эмбеддятся параллельно (PyTorch отпускает GIL на время вычислений),
+    а готовые батчи загружаются в хранилище отдельным потоком, пока считаются следующие.
+    """
+
+    def __init__(
+        self,
+        backend: VectorBackend,
+        embeddings: Embeddings,
+        batch_size: int = 64,
+        workers: int = 2,
+        progress_callback: Callable[[int, int, float], None] | None = None,
+    ) -> None:
+        """
+        Инициализирует пайплайн.
+
+        Args:
+            backend: Хранилище векторов
+            embeddings: Модель эмбеддингов
+            batch_size: Размер батча эмбеддинга и загрузки
+            workers: Количество потоков эмбеддинга
+            progress_callback: Вызывается после каждого загруженного батча с (готово, всего, чанков/с)
+        """
+        self.backend = backend
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.progress_callback = progress_callback or self._log_progress
+
+    @staticmethod
+    def _log_progress(done: int, total: int, chunks_per_second: float) -> None:
+        logger.info(f"Загружено {done}/{total} чанков ({chunks_per_second:.1f} чанков/с)")
+
+    def _embed_batch(self, documents: list[Document]) -> list[list[float]]:
+        return self.embeddings.embed_documents([doc.page_content for doc in documents])
+
+    def run(self, documents: list[Document], ids: list[str]) -> IngestStats:
+        """
+        Эмбеддит документы и загружает их в хранилище.
+
+        Args:
+            documents: Документы для загрузки
+            ids: Id точек в том же порядке
+
+        Returns:
+            IngestStats: Количество чанков, батчей и длительность
+        """
+        stats = IngestStats()
+        if not documents:
+            return stats
+
+        order = sorted(range(len(documents)), key=lambda i: len(documents[i].page_content))
+        batches = [order[i : i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        total = len(documents)
+        started = time.perf_counter()
+
+        def upsert(batch: list[int], vectors: list[list[float]]) -> None:
+            self.backend.upsert([ids[i] for i in batch], [documents[i] for i in batch], vectors)
+            stats.chunks += len(batch)
+            stats.batches += 1
+            elapsed = time.perf_counter() - started
+            self.progress_callback(stats.chunks, total, stats.chunks / elapsed if elapsed else 0.0)
+
+        # Окно незавершённых батчей ограничено, чтобы не держать в памяти все векторы сразу
+        max_pending = self.workers * 2
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="embed") as embed_pool, ThreadPoolExecutor(
+            1, thread_name_prefix="upsert"
+        ) as upsert_pool:
+            pending: deque[tuple[list[int], Future]] = deque()
+            upserts: list[Future] = []
+            for batch in batches:
+                pending.append((batch, embed_pool.submit(self._embed_batch, [documents[i] for i in batch])))
+                if len(pending) >= max_pending:
+                    done_batch, future = pending.popleft()
+                    upserts.append(upsert_pool.submit(upsert, done_batch, future.result()))
+            while pending:
+                done_batch, future = pending.popleft()
+                upserts.append(upsert_pool.submit(upsert, done_batch, future.result()))
+            for future in upserts:
+                future.result()
+
+        stats.seconds = time.perf_counter() - started
+        return stats
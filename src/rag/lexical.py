@@ -0,0 +1,218 @@
+import json
+import re
+import shutil
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from langchain.schema import Document
+
+from src.rag.stemmer import stem
+
+_TOKEN_RE = re.compile(r"\w+")
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+INDEX_FORMAT_VERSION = 1
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Разбивает текст на токены и приводит русские слова к основе.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        list[str]: Список токенов
+    """
+    tokens = _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+    return [stem(token) if _CYRILLIC_RE.search(token) else token for token in tokens]
+
+
+class LexicalIndex:
+    """BM25-индекс в виде CSR-постингов на NumPy.
+
+    Строится при индексации, сохраняется на диск набором .npy файлов
+    и при старте открывается через memory-map без повторной токенизации корпуса.
+    Вместе с индексом хранится отпечаток корпуса, по которому он построен.
+    """
+
+    def __init__(
+        self,
+        vocabulary: dict[str, int],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        documents: list[dict],
+        k1: float = 1.5,
+        b: float = 0.75,
+        fingerprint: str = "",
+    ) -> None:
+        """
+        Инициализирует индекс из готовых массивов.
+
+        Args:
+            vocabulary: Токен -> номер терма
+            offsets: Границы постингов терма i: [offsets[i], offsets[i + 1])
+            doc_ids: Номера документов в постингах
+            term_freqs: Частоты терма в документах постингов
+            doc_lengths: Длины документов в токенах
+            documents: Тексты и метаданные документов
+            k1: Параметр насыщения частоты BM25
+            b: Параметр нормализации длины BM25
+            fingerprint: Отпечаток корпуса, по которому построен индекс
+        """
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.fingerprint = fingerprint
+
+        n_docs = len(documents)
+        doc_freqs = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if n_docs else 0.0
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / avg_length)).astype(np.float32) if n_docs else doc_lengths
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @classmethod
+    def from_documents(cls, documents: list[Document], fingerprint: str = "") -> "LexicalIndex":
+        """
+        Строит индекс по документам.
+
+        Args:
+            documents: Документы корпуса
+            fingerprint: Отпечаток корпуса, сохраняется вместе с индексом
+
+        Returns:
+            LexicalIndex: Построенный индекс
+        """
+        vocabulary: dict[str, int] = {}
+        postings: list[list[tuple[int, int]]] = []
+        doc_lengths = np.zeros(len(documents), dtype=np.float32)
+
+        for doc_id, doc in enumerate(documents):
+            counts = Counter(tokenize(doc.page_content))
+            doc_lengths[doc_id] = sum(counts.values())
+            for token, freq in counts.items():
+                term_id = vocabulary.setdefault(token, len(vocabulary))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc_id, freq))
+
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term_postings) for term_postings in postings])
+        doc_ids = np.fromiter((d for term_postings in postings for d, _ in term_postings), dtype=np.int32, count=int(offsets[-1]))
+        term_freqs = np.fromiter(
+            (f for term_postings in postings for _, f in term_postings), dtype=np.float32, count=int(offsets[-1])
+        )
+        stored = [{"text": doc.page_content, "metadata": doc.metadata} for doc in documents]
+        return cls(vocabulary, offsets, doc_ids, term_freqs, doc_lengths, stored, fingerprint=fingerprint)
+
+    def search(self, query: str, k: int) -> list[Document]:
+        """
+        Ищет k документов с наибольшим BM25-скором.
+
+        Args:
+            query: Текст запроса
+            k: Количество результатов
+
+        Returns:
+            list[Document]: Документы с ненулевым скором, score в metadata["bm25_score"]
+        """
+        term_ids = [self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary]
+        if not term_ids or not self.documents:
+            return []
+
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end]
+            scores[docs] += self.idf[term_id] * freqs * (self.k1 + 1) / (freqs + self.length_norm[docs])
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for doc_id in top:
+            if scores[doc_id] <= 0:
+                break
+            stored = self.documents[doc_id]
+            metadata = dict(stored["metadata"])
+            metadata["bm25_score"] = float(scores[doc_id])
+            results.append(Document(page_content=stored["text"], metadata=metadata))
+        return results
+
+    def save(self, path: str | Path) -> None:
+        """
+        Атомарно сохраняет индекс в директорию.
+
+        Args:
+            path: Путь к директории индекса
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir(parents=True)
+
+        np.save(tmp_path / "offsets.npy", self.offsets)
+        np.save(tmp_path / "doc_ids.npy", self.doc_ids)
+        np.save(tmp_path / "term_freqs.npy", self.term_freqs)
+        np.save(tmp_path / "doc_lengths.npy", self.doc_lengths)
+        with open(tmp_path / "vocabulary.json", "w", encoding="utf-8") as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False)
+        with open(tmp_path / "documents.json", "w", encoding="utf-8") as f:
+            json.dump(self.documents, f, ensure_ascii=False)
+        with open(tmp_path / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_FORMAT_VERSION, "k1": self.k1, "b": self.b, "fingerprint": self.fingerprint}, f)
+
+        old_path = path.with_name(path.name + ".old")
+        shutil.rmtree(old_path, ignore_errors=True)
+        if path.exists():
+            path.rename(old_path)
+        tmp_path.rename(path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "LexicalIndex | None":
+        """
+        Загружает индекс с диска, открывая постинги через memory-map.
+
+        Args:
+            path: Путь к директории индекса
+
+        Returns:
+            LexicalIndex | None: Индекс или None, если его нет или формат устарел
+        """
+        path = Path(path)
+        meta_path = path / "meta.json"
+        if not meta_path.exists():
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_FORMAT_VERSION:
+            return None
+        with open(path / "vocabulary.json", encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        with open(path / "documents.json", encoding="utf-8") as f:
+            documents = json.load(f)
+        return cls(
+            vocabulary=vocabulary,
+            offsets=np.load(path / "offsets.npy", mmap_mode="r"),
+            doc_ids=np.load(path / "doc_ids.npy", mmap_mode="r"),
+            term_freqs=np.load(path / "term_freqs.npy", mmap_mode="r"),
+            doc_lengths=np.load(path / "doc_lengths.npy"),
+            documents=documents,
+            k1=meta["k1"],
+            b=meta["b"],
+            fingerprint=meta.get("fingerprint", ""),
+        )
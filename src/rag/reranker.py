@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+from langchain.schema import Document
+
+from src.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Вес нового замера в скользящем среднем задержки
+LATENCY_EWMA_ALPHA = 0.2
+# После стольких пропусков подряд запрос всё же переранжируется, чтобы обновить оценку задержки
+PROBE_EVERY = 20
+
+
+class CrossEncoderReranker:
+    """Переранжирование кандидатов поиска CPU cross-encoder'ом с бюджетом времени.
+
+    Все пары (запрос, чанк) оцениваются одним батчем. Перед запуском задержка
+    оценивается по скользящему среднему прошлых запусков с учётом уже выполняющихся:
+    если она не укладывается в бюджет, переранжирование пропускается и остаётся
+    порядок fusion. Запуск, не уложившийся в бюджет, тоже не ждётся - его результат
+    только обновляет оценку задержки. Каждый PROBE_EVERY-й запрос подряд после пропусков
+    выполняется, чтобы оценка восстановилась, когда нагрузка спадёт.
+    """
+
+    def __init__(self, model_name: str, max_length: int, budget_seconds: float) -> None:
+        """
+        Загружает модель.
+
+        Args:
+            model_name: Модель cross-encoder из sentence-transformers
+            max_length: Максимальная длина пары (запрос, чанк) в токенах
+            budget_seconds: Бюджет времени на переранжирование одного запроса
+        """
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.model_name = model_name
+        self.budget_seconds = budget_seconds
+        self._lock = threading.Lock()
+        self._latency: float | None = None
+        self._in_flight = 0
+        self._skipped_in_row = 0
+        self.reranked = 0
+        self.skipped = 0
+        self.timeouts = 0
+        logger.info(f"Модель переранжирования {model_name} загружена")
+
+    def score(self, query: str, texts: list[str]) -> np.ndarray:
+        """
+        Оценивает релевантность чанков запросу одним батчем.
+
+        Args:
+            query: Текст запроса
+            texts: Тексты чанков
+
+        Returns:
+            np.ndarray: Скоры в порядке текстов (больше - релевантнее)
+        """
+        return self.model.predict(
+            [(query, text) for text in texts], batch_size=len(texts), show_progress_bar=False, convert_to_numpy=True
+        )
+
+    def warmup(self) -> None:
+        """Прогоняет модель один раз вне учёта задержки, чтобы холодный запуск не попал в оценку."""
+        self.score("прогрев", ["прогрев"])
+
+    def _timed_score(self, query: str, texts: list[str]) -> np.ndarray:
+        """Оценивает пары и обновляет оценку задержки; счётчик выполняющихся уменьшается по завершении."""
+        started = time.perf_counter()
+        try:
+            return self.score(query, texts)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._in_flight -= 1
+                self._latency = (
+                    elapsed if self._latency is None else LATENCY_EWMA_ALPHA * elapsed + (1 - LATENCY_EWMA_ALPHA) * self._latency
+                )
+
+    async def rerank(self, query: str, docs: list[Document]) -> list[tuple[Document, float]] | None:
+        """
+        Переранжирует документы, если это укладывается в бюджет времени.
+
+        Args:
+            query: Текст запроса
+            docs: Кандидаты в порядке fusion
+
+        Returns:
+            list | None: Пары (документ, скор) по убыванию скора или None, если переранжирование пропущено
+        """
+        if not docs:
+            return []
+        with self._lock:
+            over_budget = self._latency is not None and self._latency * (self._in_flight + 1) > self.budget_seconds
+            if over_budget and self._skipped_in_row < PROBE_EVERY:
+                self._skipped_in_row += 1
+                self.skipped += 1
+                return None
+            self._skipped_in_row = 0
+            self._in_flight += 1
+
+        try:
+            scores = await asyncio.wait_for(
+                asyncio.to_thread(self._timed_score, query, [doc.page_content for doc in docs]), self.budget_seconds
+            )
+        except TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+                # Запуск ещё идёт и занял не меньше бюджета: оценка учитывает это сразу
+                self._latency = max(self._latency or 0.0, self.budget_seconds)
+            return None
+
+        with self._lock:
+            self.reranked += 1
+        order = np.argsort(-scores, kind="stable")
+        return [(docs[i], float(scores[i])) for i in order]
+
+    def stats(self) -> dict[str, float]:
+        """
+        Возвращает статистику переранжирования.
+
+        Returns:
+            dict: reranked, skipped (по оценке нагрузки), timeouts и средняя задержка в мс
+        """
+        with self._lock:
+            return {
+                "reranked": self.reranked,
+                "skipped": self.skipped,
+                "timeouts": self.timeouts,
+                "latency_ms": (self._latency or 0.0) * 1000,
+            }
@@ -1,99 +1,261 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
 
-from langchain.retrievers import EnsembleRetriever
 from langchain.schema import Document
-from langchain_community.retrievers import BM25Retriever
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
 
 from src.core.logging_config import get_logger
-from src.settings import settings
+from src.settings import PROJECT_ROOT, settings
 from src.rag.chunking import parse_html, split_chunks
+from src.rag.embedding_server import RemoteEmbeddings
+from src.rag.embeddings import CachedEmbeddings, EmbeddingCache, create_embedding_model
+from src.rag.ingestion import IngestionPipeline
+from src.rag.lexical import LexicalIndex
+from src.rag.reranker import CrossEncoderReranker
+from src.rag.vector_store import VectorBackend, create_vector_backend
 
 logger = get_logger(__name__)
 
 
+# Веса и константа RRF такие же, как были у EnsembleRetriever(weights=[0.4, 0.6])
+BM25_WEIGHT = 0.4
+DENSE_WEIGHT = 0.6
+RRF_C = 60
+
+# Запрос для прогрева модели эмбеддингов, хранилища и пула потоков при старте
+WARMUP_QUERY = "Как вывести деньги на карту?"
+
+# Пространство имён для детерминированных id точек Qdrant
+CHUNK_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "onlineshoprag/kb_chunks")
+
+
+@dataclass
+class IndexReport:
+    """Итог инкрементальной индексации."""
+
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> bool:
+        """Изменилось ли содержимое коллекции."""
+        return bool(self.added or self.updated or self.deleted)
+
+
+def chunk_point_id(chunk_id: str) -> str:
+    """
+    Возвращает детерминированный id точки Qdrant для чанка.
+
+    Args:
+        chunk_id: Идентификатор чанка (например, "12_0")
+
+    Returns:
+        str: UUID точки
+    """
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, chunk_id))
+
+
+def chunk_content_hash(chunk: dict[str, str], embedding_model: str, with_sparse: bool = False) -> str:
+    """
+    Считает хэш содержимого чанка (текст и метаданные, попадающие в payload).
+
+    Модель эмбеддингов входит в хэш: после её смены все чанки считаются изменёнными
+    и эмбеддятся заново, даже если размерность векторов совпадает. Наличие sparse-вектора
+    тоже входит в хэш: чанки, загруженные в режиме client, после возврата в режим server
+    загружаются заново уже со sparse-векторами.
+
+    Args:
+        chunk: Чанк с полями text, source, date
+        embedding_model: Модель эмбеддингов, которой строится вектор чанка
+        with_sparse: Загружается ли вместе с dense-вектором sparse-вектор BM25
+
+    Returns:
+        str: SHA-256 в hex
+    """
+    parts = (chunk["text"], chunk["source"], chunk["date"], embedding_model)
+    if with_sparse:
+        parts += ("sparse",)
+    content = "\x1f".join(parts)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def corpus_fingerprint(content_hashes: dict[str, str]) -> str:
+    """
+    Считает отпечаток содержимого хранилища: по нему проверяется, что BM25 индекс на диске актуален.
+
+    Args:
+        content_hashes: id точки -> content_hash
+
+    Returns:
+        str: SHA-256 в hex
+    """
+    digest = hashlib.sha256()
+    for point_id in sorted(content_hashes):
+        digest.update(f"{point_id}:{content_hashes[point_id]}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def weighted_rrf(ranked_lists: list[list[Document]], weights: list[float], c: int = RRF_C) -> list[Document]:
+    """
+    Объединяет ранжированные списки документов взвешенным Reciprocal Rank Fusion.
+
+    Args:
+        ranked_lists: Списки документов, каждый отсортирован по убыванию релевантности
+        weights: Вес каждого списка
+        c: Сглаживающая константа RRF
+
+    Returns:
+        list[Document]: Уникальные (по chunk_id) документы в порядке убывания RRF-скора
+    """
+    fused_scores: dict[str, float] = {}
+    docs_by_key: dict[str, Document] = {}
+    for docs, weight in zip(ranked_lists, weights):
+        for rank, doc in enumerate(docs, 1):
+            key = doc.metadata.get("chunk_id") or doc.page_content
+            fused_scores[key] = fused_scores.get(key, 0.0) + weight / (rank + c)
+            docs_by_key.setdefault(key, doc)
+
+    ordered_keys = sorted(fused_scores, key=fused_scores.__getitem__, reverse=True)
+    return [docs_by_key[key] for key in ordered_keys]
+
+
 class RAGRetriever:
-    """Ретривер для поиска релевантных чанков с использованием Qdrant + BM25."""
+    """Ретривер для поиска релевантных чанков с использованием хранилища векторов + BM25."""
 
     def __init__(self, documents: list[Document] | None = None) -> None:
         """
-        Инициализирует ретривер с подключением к Qdrant и BM25.
+        Инициализирует ретривер с подключением к хранилищу векторов и BM25.
 
         Args:
-            documents: Список документов для BM25 ретривера. Если None, загружает из Qdrant.
+            documents: Список документов для BM25 индекса. Если None, индекс загружается
+                с диска, а при его отсутствии строится по содержимому хранилища.
         """
-        self.client = QdrantClient(host=settings.qdrant_host, port=settings.qdrant_port)
-        self.collection_name = settings.qdrant_collection_name
-
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name=settings.embedding_model_name,
-            model_kwargs={"device": "cpu"},
-        )
+        self.server_hybrid = settings.hybrid_search_mode == "server"
+        if self.server_hybrid and settings.vector_backend != "qdrant":
+            logger.warning("Гибридный поиск на стороне хранилища доступен только для Qdrant, используем режим client")
+            self.server_hybrid = False
+        self.backend: VectorBackend = create_vector_backend(with_sparse=self.server_hybrid)
+        # Увеличивается при каждой переиндексации, по нему инвалидируются кэши ответов
+        self.kb_version = 0
+
+        if settings.embedding_server_socket:
+            # Модель загружена один раз в сервере эмбеддингов, общем для воркеров
+            self.embedding_model = RemoteEmbeddings(settings.embedding_server_socket)
+        else:
+            self.embedding_model = create_embedding_model(
+                settings.embedding_model_name,
+                backend=settings.embedding_backend,
+                threads=settings.embedding_threads,
+                onnx_file=settings.embedding_onnx_file,
+            )
+        self.embedding_cache: EmbeddingCache | None = None
+        if settings.embedding_cache_size > 0:
+            self.embedding_cache = EmbeddingCache(
+                max_size=settings.embedding_cache_size,
+                ttl_seconds=settings.embedding_cache_ttl_seconds,
+            )
+            self.embedding_model = CachedEmbeddings(
+                self.embedding_model,
+                # Векторы разных бэкендов немного отличаются, поэтому бэкенд входит в ключ кэша
+                model_name=f"{settings.embedding_model_name}:{settings.embedding_backend}",
+                cache=self.embedding_cache,
+            )
 
-        # Проверяем существование коллекции и создаем если нет
-        try:
-            self.client.get_collection(self.collection_name)
-            logger.info(f"Коллекция {self.collection_name} существует")
-        except Exception:
-            logger.info(f"Коллекция {self.collection_name} не найдена, создаем пустую...")
-            vector_size = len(self.embedding_model.embed_query("dimension probe"))
-            self.client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+        self.reranker: CrossEncoderReranker | None = None
+        if settings.rerank_enabled:
+            self.reranker = CrossEncoderReranker(
+                settings.rerank_model_name,
+                max_length=settings.rerank_max_length,
+                budget_seconds=settings.rerank_budget_ms / 1000,
             )
-            logger.info(f"Создана пустая коллекция {self.collection_name}")
 
-        self.vector_store = QdrantVectorStore(
-            client=self.client,
-            collection_name=self.collection_name,
-            embedding=self.embedding_model,
-        )
+        self._ensure_collection()
 
-        qdrant_retriever = self.vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": settings.top_k, "score_threshold": settings.min_score},
-        )
+        # В режиме server лексический поиск выполняет Qdrant по sparse-векторам
+        self.lexical_index: LexicalIndex | None = None
+        if not self.server_hybrid:
+            if documents is None:
+                self._load_lexical_index()
+            elif documents:
+                self.lexical_index = LexicalIndex.from_documents(documents)
 
-        if documents is None:
-            try:
-                documents = self._load_documents_from_qdrant(self.vector_store)
-            except Exception:
-                documents = []
+    def _load_lexical_index(self) -> None:
+        """
+        Загружает BM25 индекс с диска или строит его по хранилищу векторов.
 
+        Индекс с диска используется, только если его отпечаток совпадает с текущим
+        содержимым хранилища; иначе (файла нет, другая коллекция, база менялась без
+        пересборки индекса) индекс строится заново.
+        """
+        index_path = self._bm25_index_path()
+        try:
+            fingerprint = corpus_fingerprint(self.backend.load_content_hashes())
+            index = LexicalIndex.load(index_path)
+            if index is not None and index.fingerprint == fingerprint:
+                self.lexical_index = index
+                logger.info(f"BM25 индекс загружен с диска: {len(index)} документов")
+                return
+            if index is not None:
+                logger.info(f"BM25 индекс {index_path} не соответствует {self.backend}, строим заново")
+            documents = self.backend.load_documents()
+        except Exception as e:
+            logger.warning(f"Не удалось выгрузить документы из {self.backend} для BM25: {e}")
+            return
         if documents:
-            bm25_retriever = BM25Retriever.from_documents(documents)
-            bm25_retriever.k = settings.top_k
+            self._build_lexical_index(documents)
 
-            self.retriever = EnsembleRetriever(
-                retrievers=[bm25_retriever, qdrant_retriever],
-                weights=[0.4, 0.6],
-            )
-        else:
-            self.retriever = qdrant_retriever
+    @staticmethod
+    def _bm25_index_path() -> Path:
+        """Путь к BM25 индексу; относительный путь из настроек считается от корня проекта."""
+        return PROJECT_ROOT / settings.bm25_index_path
 
-    def _load_documents_from_qdrant(self, vector_store: QdrantVectorStore) -> list[Document]:
+    def _build_lexical_index(self, documents: list[Document]) -> None:
         """
-        Загружает документы из Qdrant для BM25 ретривера.
+        Строит BM25 индекс по всему корпусу и сохраняет его на диск.
 
         Args:
-            vector_store: QdrantVectorStore для загрузки документов
+            documents: Все документы базы знаний
+        """
+        fingerprint = corpus_fingerprint(
+            {chunk_point_id(doc.metadata["chunk_id"]): doc.metadata.get("content_hash", "") for doc in documents}
+        )
+        self.lexical_index = LexicalIndex.from_documents(documents, fingerprint=fingerprint)
+        index_path = self._bm25_index_path()
+        try:
+            self.lexical_index.save(index_path)
+            logger.info(f"BM25 индекс на {len(documents)} документов сохранён в {index_path}")
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить BM25 индекс: {e}")
 
-        Returns:
-            list[Document]: Список документов из Qdrant
+    def _ensure_collection(self) -> None:
+        """
+        Готовит хранилище; размерность эмбеддингов вычисляется только при необходимости.
+
+        Хранилище с векторами другой модели эмбеддингов очищается, следующая индексация загрузит всё заново.
         """
-        all_docs = vector_store.similarity_search("", k=10000)
-        return all_docs
+        self.backend.ensure_collection(
+            lambda: len(self.embedding_model.embed_query("dimension probe")), settings.embedding_model_name
+        )
 
-    def index_document(self, html_path: str) -> None:
+    def index_document(self, html_path: str) -> IndexReport:
         """
-        Индексирует HTML документ в Qdrant.
+        Инкрементально индексирует HTML документ в хранилище векторов.
+
+        Id точки детерминированно выводится из chunk_id, а хэш содержимого хранится
+        в payload. Эмбеддятся и загружаются только новые и изменённые чанки,
+        удалённые из документа чанки удаляются из хранилища.
 
         Args:
             html_path: Путь к HTML файлу для индексации
+
+        Returns:
+            IndexReport: Количество добавленных, обновлённых, удалённых и неизменённых точек
         """
         logger.info(f"Парсинг HTML файла: {html_path}")
         chunks = parse_html(html_path)
@@ -103,83 +265,203 @@ class RAGRetriever:
         split_chunks_list = split_chunks(chunks)
         logger.info(f"Создано {len(split_chunks_list)} чанков")
 
-        collection_name = self.collection_name
+        self._ensure_collection()
+        indexed_hashes = self.backend.load_content_hashes()
+        logger.info(f"В хранилище {self.backend} уже {len(indexed_hashes)} точек")
 
-        try:
-            collection_info = self.client.get_collection(collection_name)
-            points_count = collection_info.points_count
-            if points_count > 0:
-                logger.info(f"Коллекция {collection_name} уже содержит {points_count} векторов, удаляем для переиндексации...")
-            self.client.delete_collection(collection_name)
-        except Exception:
-            pass
-
-        vector_size = len(self.embedding_model.embed_query("dimension probe"))
-        logger.info(f"Создание коллекции {collection_name} с размером вектора {vector_size}...")
-        self.client.create_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
-        )
-
-        logger.info("Преобразование в Langchain Document...")
+        report = IndexReport()
+        all_documents = []
         documents = []
+        ids = []
         for chunk in split_chunks_list:
+            point_id = chunk_point_id(chunk["chunk_id"])
+            content_hash = chunk_content_hash(chunk, settings.embedding_model_name, self.server_hybrid)
             doc = Document(
                 page_content=chunk["text"],
                 metadata={
                     "chunk_id": chunk["chunk_id"],
                     "source": chunk["source"],
                     "date": chunk["date"],
+                    "content_hash": content_hash,
                 },
             )
+            all_documents.append(doc)
+            previous_hash = indexed_hashes.pop(point_id, None)
+            if previous_hash == content_hash:
+                report.unchanged += 1
+                continue
+            if previous_hash is None:
+                report.added += 1
+            else:
+                report.updated += 1
+            ids.append(point_id)
             documents.append(doc)
 
-        logger.info("Загрузка документов в Qdrant через Langchain...")
-        self.vector_store.add_documents(documents)
-        logger.info(f"Успешно загружено {len(documents)} документов в Qdrant")
+        if documents:
+            logger.info(f"Загрузка {len(documents)} новых и изменённых документов в {self.backend}...")
+            pipeline = IngestionPipeline(
+                backend=self.backend,
+                embeddings=self.embedding_model,
+                batch_size=settings.ingest_batch_size,
+                workers=settings.ingest_workers,
+            )
+            ingest_stats = pipeline.run(documents, ids)
+            logger.info(
+                f"Загружено {ingest_stats.chunks} чанков за {ingest_stats.seconds:.2f} с "
+                f"({ingest_stats.chunks_per_second:.1f} чанков/с)"
+            )
+
+        # Всё, что осталось в indexed_hashes, в документе больше нет
+        if indexed_hashes:
+            stale_ids = list(indexed_hashes)
+            self.backend.delete(stale_ids)
+            report.deleted = len(stale_ids)
+        self.backend.flush()
+
+        if report.changed:
+            self.kb_version += 1
+        if not self.server_hybrid and (report.changed or self.lexical_index is None):
+            self._build_lexical_index(all_documents)
+        logger.info(f"Индексация завершена: {report}")
+        return report
+
+    async def _embed_query(self, query: str, query_vector: list[float] | None, timings: dict[str, float]) -> list[float]:
+        """Эмбеддит запрос, если вектор не посчитан заранее."""
+        if query_vector is not None:
+            return query_vector
+        started = time.perf_counter()
+        query_vector = await self.embedding_model.aembed_query(query)
+        timings["embedding"] = time.perf_counter() - started
+        return query_vector
+
+    async def _dense_branch(
+        self, query: str, k: int, timings: dict[str, float], query_vector: list[float] | None = None
+    ) -> list[Document]:
+        """Эмбеддит запрос ровно один раз и выполняет по нему dense-поиск."""
+        query_vector = await self._embed_query(query, query_vector, timings)
+
+        started = time.perf_counter()
+        dense_docs = await self.backend.search(query_vector, k=k)
+        timings["dense_search"] = time.perf_counter() - started
+        return dense_docs
+
+    async def _bm25_branch(self, query: str, k: int, timings: dict[str, float]) -> list[Document]:
+        """Выполняет лексический поиск BM25 в executor."""
+        if self.lexical_index is None:
+            return []
+        started = time.perf_counter()
+        bm25_docs = await asyncio.to_thread(self.lexical_index.search, query, k)
+        timings["bm25"] = time.perf_counter() - started
+        return bm25_docs
+
+    async def _server_hybrid_search(
+        self, query: str, k: int, timings: dict[str, float], query_vector: list[float] | None = None
+    ) -> list[Document]:
+        """
+        Гибридный поиск одним запросом к хранилищу (prefetch по dense и sparse векторам + RRF в Qdrant).
+
+        Args:
+            query: Текст запроса
+            k: Количество кандидатов
+            timings: Словарь для длительностей этапов
+            query_vector: Заранее посчитанный эмбеддинг запроса
+
+        Returns:
+            list[Document]: Документы в порядке RRF, косинусный score в metadata["score"]
+        """
+        query_vector = await self._embed_query(query, query_vector, timings)
+
+        started = time.perf_counter()
+        docs = await self.backend.hybrid_search(query, query_vector, k=k, score_threshold=settings.min_score)
+        timings["hybrid_search"] = time.perf_counter() - started
+        return docs
+
+    async def warmup(self) -> dict[str, float]:
+        """
+        Прогревает поиск: первый эмбеддинг (загрузка весов, JIT/оптимизация графа), первый
+        запрос к хранилищу, BM25 и пул потоков. Кэш эмбеддингов после прогрева очищается.
 
-    def retrieve(self, query: str) -> tuple[str, list[dict[str, Any]]]:
+        Returns:
+            dict: Длительности этапов прогревочного поиска в секундах
+        """
+        if self.reranker is not None:
+            await asyncio.to_thread(self.reranker.warmup)
+        timings: dict[str, float] = {}
+        await self.retrieve(WARMUP_QUERY, timings)
+        if self.embedding_cache is not None:
+            self.embedding_cache.clear()
+        return timings
+
+    async def retrieve(
+        self, query: str, timings: dict[str, float] | None = None, query_vector: list[float] | None = None
+    ) -> tuple[str, list[dict[str, Any]]]:
         """
         Ищет релевантные чанки для запроса и форматирует их в контекст.
 
+        Запрос эмбеддится один раз, dense-поиск в хранилище выполняется один раз и сразу
+        возвращает score. BM25 идёт параллельно, результаты объединяются взвешенным RRF.
+        min_score отсекает только dense-кандидатов: попадания одного BM25 остаются,
+        их score - 0.0. Если включено переранжирование, кандидатов берётся rerank_candidates,
+        и top_k выбирается по скору cross-encoder'а (score_rerank в чанке).
+
         Args:
             query: Текст запроса пользователя
+            timings: Необязательный словарь, куда записываются длительности этапов в секундах
+                (embedding, dense_search, bm25 или hybrid_search в режиме server, fusion, rerank, total)
+            query_vector: Эмбеддинг запроса, если он уже посчитан (тогда запрос не эмбеддится повторно)
 
         Returns:
             tuple: (отформатированный контекст, список чанков с метаданными)
         """
-        docs = self.retriever.invoke(query)
+        timings = {} if timings is None else timings
+        started_total = time.perf_counter()
+        fetch_k = max(settings.rerank_candidates, settings.top_k) if self.reranker else settings.top_k
+
+        if self.server_hybrid:
+            docs = await self._server_hybrid_search(query, max(fetch_k, settings.top_k * 2), timings, query_vector)
+            started = time.perf_counter()
+            scores_map = {doc.metadata.get("chunk_id", ""): doc.metadata["score"] for doc in docs}
+        else:
+            dense_docs, bm25_docs = await asyncio.gather(
+                self._dense_branch(query, max(fetch_k, settings.top_k * 2), timings, query_vector),
+                self._bm25_branch(query, fetch_k, timings),
+            )
 
-        scores_map = {}
-        try:
-            results_with_scores = self.vector_store.similarity_search_with_score(query, k=settings.top_k * 2)
-            for doc, score in results_with_scores:
-                chunk_id = doc.metadata.get("chunk_id", "")
-                if chunk_id:
-                    scores_map[chunk_id] = float(score)
-        except Exception:
-            pass
+            started = time.perf_counter()
+            scores_map = {doc.metadata.get("chunk_id", ""): doc.metadata["score"] for doc in dense_docs}
+            dense_candidates = [doc for doc in dense_docs if doc.metadata["score"] >= settings.min_score][:fetch_k]
+            if bm25_docs:
+                docs = weighted_rrf([bm25_docs, dense_candidates], [BM25_WEIGHT, DENSE_WEIGHT])
+            else:
+                docs = dense_candidates
+        docs = docs[:fetch_k]
+        timings["fusion"] = time.perf_counter() - started
+
+        rerank_scores: dict[int, float] = {}
+        if self.reranker is not None and len(docs) > 1:
+            started = time.perf_counter()
+            reranked = await self.reranker.rerank(query, docs)
+            timings["rerank"] = time.perf_counter() - started
+            if reranked is None:
+                logger.debug("Переранжирование пропущено: не укладывается в бюджет времени")
+            else:
+                docs = [doc for doc, _ in reranked]
+                rerank_scores = {id(doc): score for doc, score in reranked}
 
         chunks = []
-        for doc in docs:
+        for doc in docs[: settings.top_k]:
             metadata = doc.metadata
             chunk_id = metadata.get("chunk_id", "")
-            score = scores_map.get(chunk_id, metadata.get("score", 0.0))
-
-            # Фильтрация по min_score
-            if score >= settings.min_score:
-                chunks.append(
-                    {
-                        "text": doc.page_content,
-                        "chunk_id": chunk_id,
-                        "source": metadata.get("source", ""),
-                        "date": metadata.get("date", ""),
-                        "score": score,
-                    }
-                )
-
-        # Ограничиваем количество чанков до top_k
-        chunks = chunks[:settings.top_k]
+            chunk = {
+                "text": doc.page_content,
+                "chunk_id": chunk_id,
+                "source": metadata.get("source", ""),
+                "date": metadata.get("date", ""),
+                "score": scores_map.get(chunk_id, 0.0),
+            }
+            if id(doc) in rerank_scores:
+                chunk["score_rerank"] = rerank_scores[id(doc)]
+            chunks.append(chunk)
 
         if not chunks:
             context = ""
@@ -189,4 +471,6 @@ class RAGRetriever:
                 context_parts.append(f"[{i}] {chunk['text']}")
             context = "\n\n".join(context_parts)
 
+        timings["total"] = time.perf_counter() - started_total
+        logger.debug(f"Тайминги retrieve: {timings}")
         return context, chunks
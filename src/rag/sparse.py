@@ -0,0 +1,50 @@
+import zlib
+from collections import Counter
+
+from qdrant_client.http.models import SparseVector
+
+from src.rag.lexical import tokenize
+
+# Имя sparse-вектора в коллекции и параметры BM25. Средняя длина документа фиксирована,
+# чтобы веса уже загруженных чанков не менялись при инкрементальной индексации;
+# IDF считает сам Qdrant (Modifier.IDF).
+SPARSE_VECTOR_NAME = "bm25"
+BM25_K1 = 1.2
+BM25_B = 0.75
+AVG_DOC_LENGTH = 60.0
+
+
+def _token_index(token: str) -> int:
+    """Стабильно отображает токен в индекс sparse-вектора."""
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+def encode_document(text: str) -> SparseVector:
+    """
+    Строит sparse-вектор документа с BM25-насыщением частот термов.
+
+    Args:
+        text: Текст чанка
+
+    Returns:
+        SparseVector: Индексы термов и их веса
+    """
+    counts = Counter(_token_index(token) for token in tokenize(text))
+    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * sum(counts.values()) / AVG_DOC_LENGTH)
+    indices = sorted(counts)
+    values = [counts[i] * (BM25_K1 + 1) / (counts[i] + length_norm) for i in indices]
+    return SparseVector(indices=indices, values=values)
+
+
+def encode_query(text: str) -> SparseVector:
+    """
+    Строит sparse-вектор запроса: каждый уникальный терм с весом 1.
+
+    Args:
+        text: Текст запроса
+
+    Returns:
+        SparseVector: Индексы термов запроса
+    """
+    indices = sorted({_token_index(token) for token in tokenize(text)})
+    return SparseVector(indices=indices, values=[1.0] * len(indices))
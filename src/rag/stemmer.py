@@ -0,0 +1,107 @@
+"""Стеммер русского языка по алгоритму Snowball (Porter) без внешних зависимостей."""
+
+_VOWELS = set("аеиоуыэюя")
+
+_PERFECTIVE_GERUND_1 = ("вшись", "вши", "в")
+_PERFECTIVE_GERUND_2 = ("ившись", "ывшись", "ивши", "ывши", "ив", "ыв")
+_ADJECTIVE = (
+    "ими", "ыми", "его", "ого", "ему", "ому",
+    "ее", "ие", "ые", "ое", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+    "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+_PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+_REFLEXIVE = ("ся", "сь")
+_VERB_1 = ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н")
+_VERB_2 = (
+    "ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует", "уют", "ены", "ить",
+    "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят", "ит", "ыт", "ую", "ю",
+)
+_NOUN = (
+    "иями", "ями", "ами", "ией", "иям", "ием", "иях",
+    "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой", "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья",
+    "а", "е", "и", "й", "о", "у", "ы", "ь", "ю", "я",
+)
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+
+def _regions(word: str) -> tuple[int, int]:
+    """Возвращает начало областей RV и R2."""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in _VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start: int) -> int:
+        for i in range(start + 1, len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+                return i + 1
+        return len(word)
+
+    return rv, next_region(next_region(0) - 1)
+
+
+def _strip(word: str, rv: int, endings: tuple[str, ...], after_a_ya: bool = False) -> str | None:
+    """Отрезает самое длинное окончание из списка, лежащее в RV, или возвращает None."""
+    for ending in sorted(endings, key=len, reverse=True):
+        start = len(word) - len(ending)
+        if start < rv or not word.endswith(ending):
+            continue
+        if after_a_ya and (start - 1 < rv or word[start - 1] not in "ая"):
+            continue
+        return word[:start]
+    return None
+
+
+def stem(word: str) -> str:
+    """
+    Возвращает основу русского слова.
+
+    Args:
+        word: Слово в нижнем регистре
+
+    Returns:
+        str: Основа слова
+    """
+    word = word.replace("ё", "е")
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+
+    # Шаг 1: деепричастие, иначе возвратность + прилагательное/глагол/существительное
+    stripped = _strip(word, rv, _PERFECTIVE_GERUND_1, after_a_ya=True) or _strip(word, rv, _PERFECTIVE_GERUND_2)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        adjective = _strip(word, rv, _ADJECTIVE)
+        if adjective is not None:
+            word = _strip(adjective, rv, _PARTICIPLE_1, after_a_ya=True) or _strip(adjective, rv, _PARTICIPLE_2) or adjective
+        else:
+            verb = _strip(word, rv, _VERB_1, after_a_ya=True) or _strip(word, rv, _VERB_2)
+            if verb is not None:
+                word = verb
+            else:
+                word = _strip(word, rv, _NOUN) or word
+
+    # Шаг 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3: словообразовательные окончания в R2
+    word = _strip(word, max(rv, r2), _DERIVATIONAL) or word
+
+    # Шаг 4
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        return word[:-1]
+    superlative = _strip(word, rv, _SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+        if word.endswith("нн") and len(word) - 2 >= rv:
+            word = word[:-1]
+        return word
+    if word.endswith("ь") and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
@@ -0,0 +1,685 @@
+import asyncio
+import json
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from langchain.schema import Document
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Disabled,
+    Distance,
+    Fusion,
+    FusionQuery,
+    HnswConfigDiff,
+    Modifier,
+    PointIdsList,
+    PointStruct,
+    Prefetch,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    ScoredPoint,
+    SearchParams,
+    SparseVectorParams,
+    VectorParams,
+    VectorParamsDiff,
+)
+
+from src.core.logging_config import get_logger
+from src.rag.sparse import SPARSE_VECTOR_NAME, encode_document, encode_query
+from src.settings import PROJECT_ROOT, settings
+
+logger = get_logger(__name__)
+
+# Ключи payload совпадают с QdrantVectorStore, чтобы коллекция оставалась совместимой с Langchain
+CONTENT_KEY = QdrantVectorStore.CONTENT_KEY
+METADATA_KEY = QdrantVectorStore.METADATA_KEY
+SCROLL_BATCH = 256
+# Ключи метаданных коллекции: модель эмбеддингов и размерность, которыми построены векторы
+METADATA_EMBEDDING_MODEL = "embedding_model"
+METADATA_VECTOR_SIZE = "vector_size"
+
+
+class VectorBackend(ABC):
+    """Хранилище векторов чанков, которым пользуется RAGRetriever."""
+
+    supports_sparse: bool = False
+
+    @abstractmethod
+    def ensure_collection(self, vector_size: Callable[[], int], embedding_model: str) -> None:
+        """
+        Готовит хранилище к работе.
+
+        Если хранилище заполнено векторами другой модели эмбеддингов или другой
+        размерности, оно очищается, и следующая индексация загружает всё заново.
+
+        Args:
+            vector_size: Возвращает размерность эмбеддингов (вызывается только при необходимости)
+            embedding_model: Модель эмбеддингов, которой построены векторы
+        """
+
+    @abstractmethod
+    def load_content_hashes(self) -> dict[str, str]:
+        """
+        Возвращает хэши содержимого всех точек.
+
+        Returns:
+            dict: id точки -> content_hash (пустая строка для точек без хэша)
+        """
+
+    @abstractmethod
+    def load_documents(self) -> list[Document]:
+        """
+        Выгружает все документы хранилища.
+
+        Returns:
+            list[Document]: Документы с метаданными
+        """
+
+    @abstractmethod
+    def upsert(self, ids: list[str], documents: list[Document], vectors: list[list[float]]) -> None:
+        """
+        Добавляет или обновляет точки.
+
+        Args:
+            ids: Id точек
+            documents: Документы в том же порядке
+            vectors: Dense-эмбеддинги в том же порядке
+        """
+
+    @abstractmethod
+    def delete(self, ids: list[str]) -> None:
+        """
+        Удаляет точки по id.
+
+        Args:
+            ids: Id точек
+        """
+
+    @abstractmethod
+    async def search(self, query_vector: list[float], k: int) -> list[Document]:
+        """
+        Ищет k ближайших по косинусу документов.
+
+        Args:
+            query_vector: Эмбеддинг запроса
+            k: Количество результатов
+
+        Returns:
+            list[Document]: Документы с косинусным score в metadata["score"]
+        """
+
+    def flush(self) -> None:
+        """Сохраняет накопленные изменения (для хранилищ, пишущих на диск пакетно)."""
+
+    async def hybrid_search(self, query: str, query_vector: list[float], k: int, score_threshold: float) -> list[Document]:
+        """
+        Гибридный dense + sparse поиск на стороне хранилища.
+
+        Args:
+            query: Текст запроса
+            query_vector: Эмбеддинг запроса
+            k: Количество результатов
+            score_threshold: Минимальный косинус для dense-кандидатов
+
+        Returns:
+            list[Document]: Документы в порядке fusion, косинусный score в metadata["score"]
+        """
+        raise NotImplementedError(f"{type(self).__name__} не поддерживает гибридный поиск")
+
+
+@dataclass
+class QdrantIndexConfig:
+    """Параметры хранения и поиска dense-векторов в коллекции Qdrant."""
+
+    # none, scalar (int8) или binary (1 бит на измерение)
+    quantization: str = "none"
+    # Держать квантованные векторы в RAM
+    quantization_always_ram: bool = True
+    # Хранить исходные float32-векторы на диске (mmap), а не в RAM
+    on_disk: bool = False
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    # Параметры запроса: ef HNSW (None - по умолчанию Qdrant), оверсэмплинг и пересчёт по исходным векторам
+    search_ef: int | None = None
+    oversampling: float | None = None
+    rescore: bool = True
+
+    @classmethod
+    def from_settings(cls) -> "QdrantIndexConfig":
+        """Собирает конфигурацию из настроек приложения."""
+        return cls(
+            quantization=settings.qdrant_quantization,
+            quantization_always_ram=settings.qdrant_quantization_always_ram,
+            on_disk=settings.qdrant_on_disk_vectors,
+            hnsw_m=settings.qdrant_hnsw_m,
+            hnsw_ef_construct=settings.qdrant_hnsw_ef_construct,
+            search_ef=settings.qdrant_search_ef or None,
+            oversampling=settings.qdrant_oversampling or None,
+            rescore=settings.qdrant_rescore,
+        )
+
+    def quantization_config(self) -> ScalarQuantization | BinaryQuantization | None:
+        """Конфигурация квантизации для создания коллекции."""
+        if self.quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=self.quantization_always_ram)
+            )
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=self.quantization_always_ram))
+        return None
+
+    def hnsw_config(self) -> HnswConfigDiff:
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def search_params(self) -> SearchParams | None:
+        """Параметры запроса или None, если всё по умолчанию."""
+        quantization = None
+        if self.quantization != "none":
+            quantization = QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling)
+        if self.search_ef is None and quantization is None:
+            return None
+        return SearchParams(hnsw_ef=self.search_ef, quantization=quantization)
+
+
+class QdrantBackend(VectorBackend):
+    """Хранилище в коллекции Qdrant (dense-вектор и, опционально, sparse BM25-вектор)."""
+
+    supports_sparse = True
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        async_client: AsyncQdrantClient,
+        collection_name: str,
+        with_sparse: bool,
+        index_config: QdrantIndexConfig | None = None,
+    ) -> None:
+        """
+        Инициализирует хранилище.
+
+        Args:
+            client: Синхронный клиент (индексация)
+            async_client: Асинхронный клиент (поиск)
+            collection_name: Имя коллекции
+            with_sparse: Хранить ли sparse-вектор для гибридного поиска в Qdrant
+            index_config: Квантизация, on-disk хранение, HNSW и параметры запроса
+        """
+        self.client = client
+        self.async_client = async_client
+        self.collection_name = collection_name
+        self.with_sparse = with_sparse
+        self.index_config = index_config or QdrantIndexConfig()
+        self.search_params = self.index_config.search_params()
+
+    def __str__(self) -> str:
+        return f"Qdrant коллекция {self.collection_name}"
+
+    def ensure_collection(self, vector_size: Callable[[], int], embedding_model: str) -> None:
+        """
+        Создаёт коллекцию, если её ещё нет.
+
+        Модель эмбеддингов и размерность хранятся в метаданных коллекции. Коллекция
+        пересоздаётся, если они не совпадают с текущими (векторы разных моделей
+        несравнимы), а также если при with_sparse в ней нет sparse-вектора: добавить
+        sparse-вектор в существующую коллекцию Qdrant не позволяет.
+        """
+        try:
+            collection_info = self.client.get_collection(self.collection_name)
+        except Exception:
+            collection_info = None
+
+        size = None
+        if collection_info is not None:
+            reason = None
+            metadata = collection_info.config.metadata or {}
+            current_size = getattr(collection_info.config.params.vectors, "size", None)
+            sparse_vectors = collection_info.config.params.sparse_vectors or {}
+            if METADATA_EMBEDDING_MODEL in metadata:
+                if metadata[METADATA_EMBEDDING_MODEL] != embedding_model:
+                    reason = f"векторы модели {metadata[METADATA_EMBEDDING_MODEL]}, а используется {embedding_model}"
+            else:
+                # Коллекция создана до появления метаданных: проверить можно только размерность
+                size = vector_size()
+                if current_size != size:
+                    reason = f"размер вектора {current_size}, а у модели {embedding_model} - {size}"
+            if reason is None and self.with_sparse and SPARSE_VECTOR_NAME not in sparse_vectors:
+                reason = f"нет sparse-вектора {SPARSE_VECTOR_NAME} для гибридного поиска на стороне Qdrant"
+
+            if reason is None:
+                logger.info(f"Коллекция {self.collection_name} существует")
+                if METADATA_EMBEDDING_MODEL not in metadata:
+                    self.client.update_collection(
+                        collection_name=self.collection_name,
+                        metadata={METADATA_EMBEDDING_MODEL: embedding_model, METADATA_VECTOR_SIZE: size},
+                    )
+                self._sync_index_config(collection_info)
+                return
+            logger.warning(f"В коллекции {self.collection_name} {reason}: пересоздаем и индексируем заново...")
+            self.client.delete_collection(self.collection_name)
+        else:
+            logger.info(f"Коллекция {self.collection_name} не найдена, создаем пустую...")
+
+        size = size or vector_size()
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(size=size, distance=Distance.COSINE, on_disk=self.index_config.on_disk),
+            sparse_vectors_config=(
+                {SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)} if self.with_sparse else None
+            ),
+            hnsw_config=self.index_config.hnsw_config(),
+            quantization_config=self.index_config.quantization_config(),
+            metadata={METADATA_EMBEDDING_MODEL: embedding_model, METADATA_VECTOR_SIZE: size},
+        )
+        logger.info(f"Создана пустая коллекция {self.collection_name} с размером вектора {size}: {self.index_config}")
+
+    def _sync_index_config(self, collection_info) -> None:
+        """
+        Приводит параметры хранения существующей коллекции к настройкам.
+
+        Квантизация, on-disk и HNSW меняются без пересоздания коллекции:
+        Qdrant перестраивает индекс в фоне, поиск при этом продолжает работать.
+        """
+        config = collection_info.config
+        vectors = config.params.vectors
+        current_on_disk = bool(getattr(vectors, "on_disk", False))
+        current_quantization = config.quantization_config
+        if isinstance(current_quantization, ScalarQuantization):
+            current_kind = "scalar"
+        elif isinstance(current_quantization, BinaryQuantization):
+            current_kind = "binary"
+        else:
+            current_kind = "none"
+
+        update = {}
+        if current_on_disk != self.index_config.on_disk:
+            update["vectors_config"] = {"": VectorParamsDiff(on_disk=self.index_config.on_disk)}
+        if (config.hnsw_config.m, config.hnsw_config.ef_construct) != (self.index_config.hnsw_m, self.index_config.hnsw_ef_construct):
+            update["hnsw_config"] = self.index_config.hnsw_config()
+        if current_kind != self.index_config.quantization:
+            update["quantization_config"] = self.index_config.quantization_config() or Disabled.DISABLED
+        if update:
+            logger.info(f"Обновляем параметры коллекции {self.collection_name}: {', '.join(update)}")
+            self.client.update_collection(collection_name=self.collection_name, **update)
+
+    def _scroll_payloads(self) -> list[tuple[str, dict]]:
+        """Постранично читает id и payload всех точек коллекции."""
+        result = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=SCROLL_BATCH,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            result.extend((str(point.id), point.payload or {}) for point in points)
+            if offset is None:
+                return result
+
+    def load_content_hashes(self) -> dict[str, str]:
+        return {
+            point_id: (payload.get(METADATA_KEY) or {}).get("content_hash", "")
+            for point_id, payload in self._scroll_payloads()
+        }
+
+    def load_documents(self) -> list[Document]:
+        return [
+            Document(page_content=payload.get(CONTENT_KEY, ""), metadata=payload.get(METADATA_KEY) or {})
+            for _, payload in self._scroll_payloads()
+        ]
+
+    def upsert(self, ids: list[str], documents: list[Document], vectors: list[list[float]]) -> None:
+        points = [
+            PointStruct(
+                id=point_id,
+                vector={"": vector, SPARSE_VECTOR_NAME: encode_document(doc.page_content)} if self.with_sparse else vector,
+                payload={CONTENT_KEY: doc.page_content, METADATA_KEY: doc.metadata},
+            )
+            for point_id, doc, vector in zip(ids, documents, vectors)
+        ]
+        self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+
+    def delete(self, ids: list[str]) -> None:
+        self.client.delete(collection_name=self.collection_name, points_selector=PointIdsList(points=ids))
+
+    @staticmethod
+    def _point_to_document(point: ScoredPoint) -> Document:
+        """Преобразует точку Qdrant в Langchain Document со score в метаданных."""
+        payload = point.payload or {}
+        metadata = dict(payload.get(METADATA_KEY) or {})
+        metadata["score"] = float(point.score)
+        return Document(page_content=payload.get(CONTENT_KEY, ""), metadata=metadata)
+
+    async def search(self, query_vector: list[float], k: int) -> list[Document]:
+        response = await self.async_client.query_points(
+            collection_name=self.collection_name,
+            query=query_vector,
+            limit=k,
+            search_params=self.search_params,
+            with_payload=True,
+        )
+        return [self._point_to_document(point) for point in response.points]
+
+    async def hybrid_search(self, query: str, query_vector: list[float], k: int, score_threshold: float) -> list[Document]:
+        """
+        Один запрос в Qdrant: prefetch по dense и sparse векторам + RRF.
+
+        Косинусный score для кандидатов считается локально по возвращённым dense-векторам,
+        чтобы score в выдаче был таким же, как в режиме client.
+        """
+        response = await self.async_client.query_points(
+            collection_name=self.collection_name,
+            prefetch=[
+                Prefetch(query=query_vector, limit=k, score_threshold=score_threshold, params=self.search_params),
+                Prefetch(query=encode_query(query), using=SPARSE_VECTOR_NAME, limit=k),
+            ],
+            query=FusionQuery(fusion=Fusion.RRF),
+            limit=k,
+            with_payload=True,
+            with_vectors=True,
+        )
+
+        if not response.points:
+            return []
+        matrix = np.asarray(
+            [point.vector[""] if isinstance(point.vector, dict) else point.vector for point in response.points],
+            dtype=np.float32,
+        )
+        query_array = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_array)
+        scores = (matrix @ query_array) / np.where(norms == 0, 1.0, norms)
+
+        docs = []
+        for point, score in zip(response.points, scores):
+            doc = self._point_to_document(point)
+            doc.metadata["score"] = float(score)
+            docs.append(doc)
+        return docs
+
+
+class NumpyBackend(VectorBackend):
+    """Встроенное хранилище: нормированная матрица эмбеддингов на диске и таблица payload.
+
+    Матрица открывается через memory-map, точный top-k считается одним матричным
+    умножением и argpartition. В режиме int8 строки хранятся квантованными
+    с масштабом на строку, что уменьшает объём в 4 раза. Изменения накапливаются
+    в памяти и атомарно сохраняются на диск в flush(). Новые строки дописываются
+    в буфер, ёмкость которого растёт вдвое, поэтому загрузка корпуса батчами
+    копирует матрицу O(log N) раз, а не на каждом батче.
+    """
+
+    # Размер блока строк при поиске по int8-матрице, ограничивает временную float32-копию
+    INT8_BLOCK_ROWS = 16384
+
+    def __init__(self, path: str | Path, dtype: str = "float32") -> None:
+        """
+        Инициализирует хранилище и загружает индекс с диска, если он есть.
+
+        Args:
+            path: Директория индекса
+            dtype: Тип хранения векторов: float32 или int8
+        """
+        self.path = Path(path)
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._dirty = False
+        # Снимок (ids, payloads, матрица, масштабы) заменяется целиком, поиск читает его без блокировки
+        self._state: tuple[list[str], list[dict], np.ndarray | None, np.ndarray | None] = ([], [], None, None)
+        # Модель эмбеддингов, которой построены векторы (None - индекс сохранён без неё)
+        self.embedding_model: str | None = None
+        # Записываемые буферы с запасом строк: матрица снимка - их начало; None - снимок открыт с диска
+        self._buffer: np.ndarray | None = None
+        self._scales_buffer: np.ndarray | None = None
+        # id точки -> номер строки для upsert, строится при первом upsert после загрузки или удаления
+        self._row_by_id: dict[str, int] | None = None
+        self._load()
+
+    def __str__(self) -> str:
+        return f"NumPy индекс {self.path} ({self.dtype})"
+
+    def __len__(self) -> int:
+        return len(self._state[0])
+
+    def _load(self) -> None:
+        """Загружает индекс с диска, открывая матрицу через memory-map."""
+        table_path = self.path / "table.json"
+        if not table_path.exists():
+            return
+        with open(table_path, encoding="utf-8") as f:
+            table = json.load(f)
+        if table.get("dtype") != self.dtype:
+            logger.warning(f"NumPy индекс {self.path} сохранён в {table.get('dtype')}, ожидается {self.dtype}: игнорируем")
+            return
+        matrix = np.load(self.path / "vectors.npy", mmap_mode="r")
+        scales = np.load(self.path / "scales.npy", mmap_mode="r") if self.dtype == "int8" else None
+        self._state = (table["ids"], table["payloads"], matrix, scales)
+        self.embedding_model = table.get(METADATA_EMBEDDING_MODEL)
+        self._buffer = self._scales_buffer = self._row_by_id = None
+
+    def flush(self) -> None:
+        """Атомарно сохраняет накопленные изменения на диск и переоткрывает матрицу через memory-map."""
+        with self._lock:
+            if not self._dirty:
+                return
+            ids, payloads, matrix, scales = self._state
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            tmp_path.mkdir(parents=True)
+            if matrix is None:
+                matrix = np.empty((0, 0), dtype=np.int8 if self.dtype == "int8" else np.float32)
+            np.save(tmp_path / "vectors.npy", matrix)
+            if scales is not None:
+                np.save(tmp_path / "scales.npy", scales)
+            with open(tmp_path / "table.json", "w", encoding="utf-8") as f:
+                table = {"dtype": self.dtype, METADATA_EMBEDDING_MODEL: self.embedding_model, "ids": ids, "payloads": payloads}
+                json.dump(table, f, ensure_ascii=False)
+
+            old_path = self.path.with_name(self.path.name + ".old")
+            shutil.rmtree(old_path, ignore_errors=True)
+            if self.path.exists():
+                self.path.rename(old_path)
+            tmp_path.rename(self.path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            self._dirty = False
+            self._load()
+        logger.info(f"{self} сохранён: {len(self)} векторов")
+
+    def _encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        """Нормирует векторы и при необходимости квантует в int8 с масштабом на строку."""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self.dtype != "int8":
+            return vectors.astype(np.float32), None
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales = np.where(scales == 0, 1, scales).astype(np.float32)
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+    def ensure_collection(self, vector_size: Callable[[], int], embedding_model: str) -> None:
+        ids, _, matrix, _ = self._state
+        reason = None
+        if ids and self.embedding_model is not None and self.embedding_model != embedding_model:
+            reason = f"векторы модели {self.embedding_model}, а используется {embedding_model}"
+        elif ids and self.embedding_model is None and matrix.shape[1] != vector_size():
+            reason = f"размер вектора {matrix.shape[1]}, а у модели {embedding_model} другой"
+        with self._lock:
+            if reason is not None:
+                logger.warning(f"В {self} {reason}: очищаем и индексируем заново")
+                self._state = ([], [], None, None)
+                self._buffer = self._scales_buffer = self._row_by_id = None
+            if self.embedding_model != embedding_model:
+                self.embedding_model = embedding_model
+                self._dirty = True
+        logger.info(f"{self}: {len(self)} векторов")
+
+    def load_content_hashes(self) -> dict[str, str]:
+        ids, payloads, _, _ = self._state
+        return {
+            point_id: (payload.get(METADATA_KEY) or {}).get("content_hash", "")
+            for point_id, payload in zip(ids, payloads)
+        }
+
+    def load_documents(self) -> list[Document]:
+        return [
+            Document(page_content=payload.get(CONTENT_KEY, ""), metadata=payload.get(METADATA_KEY) or {})
+            for payload in self._state[1]
+        ]
+
+    def _reserve(self, rows: int, dim: int, dtype: np.dtype, with_scales: bool) -> None:
+        """
+        Гарантирует место под rows строк в буферах, при нехватке увеличивая ёмкость вдвое.
+
+        Args:
+            rows: Сколько строк должно поместиться
+            dim: Размерность векторов
+            dtype: Тип элементов матрицы
+            with_scales: Нужен ли буфер масштабов строк (int8)
+        """
+        if self._buffer is not None and len(self._buffer) >= rows:
+            return
+        _, _, matrix, scales = self._state
+        used = 0 if matrix is None else len(matrix)
+        capacity = max(rows, 2 * (len(self._buffer) if self._buffer is not None else used), 1024)
+        buffer = np.empty((capacity, dim), dtype=dtype)
+        scales_buffer = np.empty(capacity, dtype=np.float32) if with_scales else None
+        if used:
+            buffer[:used] = matrix
+            if scales_buffer is not None:
+                scales_buffer[:used] = scales
+        self._buffer, self._scales_buffer = buffer, scales_buffer
+
+    def upsert(self, ids: list[str], documents: list[Document], vectors: list[list[float]]) -> None:
+        encoded, encoded_scales = self._encode(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            all_ids, payloads, matrix, _ = self._state
+            if matrix is not None and len(matrix) and matrix.shape[1] != encoded.shape[1]:
+                raise ValueError(f"{self}: размер вектора {encoded.shape[1]}, в индексе {matrix.shape[1]}")
+            if self._row_by_id is None:
+                self._row_by_id = {point_id: row for row, point_id in enumerate(all_ids)}
+            used = len(all_ids)
+            new_count = sum(point_id not in self._row_by_id for point_id in dict.fromkeys(ids))
+            self._reserve(used + new_count, encoded.shape[1], encoded.dtype, encoded_scales is not None)
+            if new_count < len(dict.fromkeys(ids)) and matrix is not None and np.may_share_memory(matrix, self._buffer):
+                # Обновляемые строки читает текущий снимок: пишем в копии, иначе поиск увидит
+                # недописанный вектор или новый payload рядом со старым вектором
+                payloads = list(payloads)
+                self._buffer = self._buffer.copy()
+                if self._scales_buffer is not None:
+                    self._scales_buffer = self._scales_buffer.copy()
+
+            # Новые строки дописываются на месте: старый снимок видит только свои первые used строк
+            for i, (point_id, doc) in enumerate(zip(ids, documents)):
+                payload = {CONTENT_KEY: doc.page_content, METADATA_KEY: doc.metadata}
+                row = self._row_by_id.get(point_id)
+                if row is None:
+                    row = self._row_by_id[point_id] = len(all_ids)
+                    all_ids.append(point_id)
+                    payloads.append(payload)
+                else:
+                    payloads[row] = payload
+                self._buffer[row] = encoded[i]
+                if encoded_scales is not None:
+                    self._scales_buffer[row] = encoded_scales[i]
+
+            rows = len(all_ids)
+            scales = self._scales_buffer[:rows] if encoded_scales is not None else None
+            self._state = (all_ids, payloads, self._buffer[:rows], scales)
+            self._dirty = True
+
+    def delete(self, ids: list[str]) -> None:
+        to_delete = set(ids)
+        with self._lock:
+            all_ids, payloads, matrix, scales = self._state
+            keep = [row for row, point_id in enumerate(all_ids) if point_id not in to_delete]
+            if len(keep) == len(all_ids):
+                return
+            self._state = (
+                [all_ids[row] for row in keep],
+                [payloads[row] for row in keep],
+                np.asarray(matrix)[keep],
+                np.asarray(scales)[keep] if scales is not None else None,
+            )
+            self._buffer = self._scales_buffer = self._row_by_id = None
+            self._dirty = True
+
+    def search_many(self, query_vectors: np.ndarray, k: int) -> list[list[tuple[int, float]]]:
+        """
+        Точный top-k для пачки запросов.
+
+        Args:
+            query_vectors: Матрица запросов (n_queries, dim)
+            k: Количество результатов на запрос
+
+        Returns:
+            list: Для каждого запроса список (номер строки, косинус) по убыванию косинуса
+        """
+        return self._top_k(self._state, query_vectors, k)
+
+    def _top_k(self, state: tuple, query_vectors: np.ndarray, k: int) -> list[list[tuple[int, float]]]:
+        """Считает top-k по одному снимку состояния."""
+        _, _, matrix, scales = state
+        if matrix is None or not len(matrix):
+            return [[] for _ in range(len(query_vectors))]
+
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if scales is None:
+            scores = queries @ matrix.T
+        else:
+            scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+            for start in range(0, len(matrix), self.INT8_BLOCK_ROWS):
+                block = matrix[start : start + self.INT8_BLOCK_ROWS].astype(np.float32)
+                scores[:, start : start + len(block)] = (queries @ block.T) * scales[start : start + len(block)]
+
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, query_top in zip(scores, top):
+            ordered = query_top[np.argsort(-query_scores[query_top])]
+            results.append([(int(row), float(query_scores[row])) for row in ordered])
+        return results
+
+    def _search_sync(self, query_vector: list[float], k: int) -> list[Document]:
+        state = self._state
+        payloads = state[1]
+        docs = []
+        for row, score in self._top_k(state, np.asarray([query_vector]), k)[0]:
+            payload = payloads[row]
+            metadata = dict(payload.get(METADATA_KEY) or {})
+            metadata["score"] = score
+            docs.append(Document(page_content=payload.get(CONTENT_KEY, ""), metadata=metadata))
+        return docs
+
+    async def search(self, query_vector: list[float], k: int) -> list[Document]:
+        return await asyncio.to_thread(self._search_sync, query_vector, k)
+
+
+def create_vector_backend(with_sparse: bool) -> VectorBackend:
+    """
+    Создаёт хранилище векторов по настройке vector_backend.
+
+    Args:
+        with_sparse: Нужен ли гибридный поиск на стороне хранилища
+
+    Returns:
+        VectorBackend: Qdrant или встроенное NumPy-хранилище
+    """
+    if settings.vector_backend == "numpy":
+        return NumpyBackend(PROJECT_ROOT / settings.numpy_index_path, dtype=settings.numpy_index_dtype)
+    return QdrantBackend(
+        client=QdrantClient(host=settings.qdrant_host, port=settings.qdrant_port),
+        async_client=AsyncQdrantClient(host=settings.qdrant_host, port=settings.qdrant_port),
+        collection_name=settings.qdrant_collection_name,
+        with_sparse=with_sparse,
+        index_config=QdrantIndexConfig.from_settings(),
+    )
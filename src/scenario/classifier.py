@@ -0,0 +1,226 @@
+import asyncio
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.core.logging_config import get_logger
+from src.rag.embeddings import normalize_query
+
+logger = get_logger(__name__)
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+class ConditionDecisionCache:
+    """Потокобезопасный LRU-кэш решений по условиям сценария.
+
+    Ключ - пара (условие, нормализованное сообщение), поэтому повтор сообщения
+    с другим регистром, ё/е или пунктуацией не требует ни классификатора, ни LLM.
+    Хранит решения и локального классификатора, и LLM.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        Инициализирует кэш.
+
+        Args:
+            max_size: Максимальное количество решений в кэше
+        """
+        self.max_size = max_size
+        self._decisions: OrderedDict[tuple[str, str], bool] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, condition: str, message: str) -> bool | None:
+        """
+        Возвращает закэшированное решение.
+
+        Args:
+            condition: Текст условия
+            message: Сообщение пользователя
+
+        Returns:
+            bool | None: Решение или None, если его нет в кэше
+        """
+        key = (condition, normalize_query(message))
+        with self._lock:
+            decision = self._decisions.get(key)
+            if decision is None:
+                self.misses += 1
+                return None
+            self._decisions.move_to_end(key)
+            self.hits += 1
+            return decision
+
+    def put(self, condition: str, message: str, decision: bool) -> None:
+        """
+        Кладёт решение в кэш, вытесняя самые давние при переполнении.
+
+        Args:
+            condition: Текст условия
+            message: Сообщение пользователя
+            decision: Выполнено ли условие
+        """
+        key = (condition, normalize_query(message))
+        with self._lock:
+            self._decisions[key] = decision
+            self._decisions.move_to_end(key)
+            while len(self._decisions) > self.max_size:
+                self._decisions.popitem(last=False)
+
+    def stats(self) -> dict[str, float]:
+        """
+        Возвращает статистику кэша.
+
+        Returns:
+            dict: size, hits, misses, hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._decisions),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class ConditionClassifier:
+    """Локальная проверка условий сценария по близости эмбеддингов.
+
+    Сообщение (целиком и по предложениям) сравнивается с прототипами условия:
+    положительные - сам текст условия и примеры "да", отрицательные - примеры "нет".
+    С отрицательными примерами решение принимается по разнице косинусов (margin),
+    без них - по порогам косинуса с положительными прототипами. Неуверенные случаи
+    возвращаются как None и проверяются LLM. Решения кэширует ConditionDecisionCache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        margin: float = 0.1,
+        yes_threshold: float = 0.8,
+        no_threshold: float = 0.3,
+    ) -> None:
+        """
+        Инициализирует классификатор.
+
+        Args:
+            embeddings: Модель эмбеддингов (та же, что у ретривера)
+            margin: Минимальная разница косинусов с "да" и "нет" прототипами для уверенного решения
+            yes_threshold: Косинус с условием, начиная с которого без примеров "нет" ответ "да"
+            no_threshold: Косинус с условием, ниже которого без примеров "нет" ответ "нет"
+        """
+        self.embeddings = embeddings
+        self.margin = margin
+        self.yes_threshold = yes_threshold
+        self.no_threshold = no_threshold
+        self._examples: dict[str, tuple[tuple[str, ...], tuple[str, ...]]] = {}
+        self._prototypes: dict[str, tuple[np.ndarray, np.ndarray | None]] = {}
+        self._lock = threading.Lock()
+        self.local_decisions = 0
+        self.escalations = 0
+
+    def register(self, condition: str, yes_examples: tuple[str, ...] = (), no_examples: tuple[str, ...] = ()) -> None:
+        """
+        Задаёт примеры сообщений для условия.
+
+        Args:
+            condition: Текст условия
+            yes_examples: Сообщения, для которых условие выполнено
+            no_examples: Сообщения, для которых условие не выполнено
+        """
+        self._examples[condition] = (tuple(yes_examples), tuple(no_examples))
+        self._prototypes.pop(condition, None)
+
+    def _embed_normalized(self, texts: list[str]) -> np.ndarray:
+        matrix = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    async def _get_prototypes(self, condition: str) -> tuple[np.ndarray, np.ndarray | None]:
+        """Эмбеддит прототипы условия один раз и запоминает их."""
+        prototypes = self._prototypes.get(condition)
+        if prototypes is None:
+            yes_examples, no_examples = self._examples.get(condition, ((), ()))
+            positive = await asyncio.to_thread(self._embed_normalized, [condition, *yes_examples])
+            negative = await asyncio.to_thread(self._embed_normalized, list(no_examples)) if no_examples else None
+            prototypes = self._prototypes[condition] = (positive, negative)
+        return prototypes
+
+    async def warmup(self) -> None:
+        """Эмбеддит прототипы всех зарегистрированных условий заранее, а не на первом сообщении."""
+        for condition in self._examples:
+            await self._get_prototypes(condition)
+
+    async def _embed_message(self, message: str) -> np.ndarray:
+        """Эмбеддит сообщение целиком и по предложениям (через кэш эмбеддингов запросов)."""
+        segments = [message]
+        sentences = [sentence for sentence in _SENTENCE_RE.split(message.strip()) if sentence]
+        if len(sentences) > 1:
+            segments.extend(sentences)
+        vectors = await asyncio.gather(*(self.embeddings.aembed_query(segment) for segment in segments))
+        matrix = np.asarray(vectors, dtype=np.float32)
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    def _decide(self, segments: np.ndarray, positive: np.ndarray, negative: np.ndarray | None) -> bool | None:
+        """Принимает решение по косинусам сегментов сообщения с прототипами или возвращает None."""
+        positive_scores = (segments @ positive.T).max(axis=1)
+        if negative is None:
+            if positive_scores.max() >= self.yes_threshold:
+                return True
+            if positive_scores.max() <= self.no_threshold:
+                return False
+            return None
+
+        margins = positive_scores - (segments @ negative.T).max(axis=1)
+        if margins.max() >= self.margin:
+            return True
+        if margins.max() <= -self.margin:
+            return False
+        return None
+
+    async def classify(self, conditions: dict[str, str], message: str) -> dict[str, bool]:
+        """
+        Проверяет условия локально.
+
+        Args:
+            conditions: id if-ноды -> текст условия
+            message: Сообщение пользователя
+
+        Returns:
+            dict: Решения только для условий, по которым классификатор уверен
+        """
+        if not conditions:
+            return {}
+        decisions: dict[str, bool] = {}
+        segments = await self._embed_message(message)
+        for node_id, condition in conditions.items():
+            decision = self._decide(segments, *await self._get_prototypes(condition))
+            with self._lock:
+                if decision is None:
+                    self.escalations += 1
+                else:
+                    self.local_decisions += 1
+            if decision is not None:
+                decisions[node_id] = decision
+        return decisions
+
+    def stats(self) -> dict[str, float]:
+        """
+        Возвращает статистику классификатора.
+
+        Returns:
+            dict: local_decisions, escalations, local_decision_rate
+                (доля проверенных классификатором условий, решённых без LLM)
+        """
+        with self._lock:
+            total = self.local_decisions + self.escalations
+            return {
+                "local_decisions": self.local_decisions,
+                "escalations": self.escalations,
+                "local_decision_rate": self.local_decisions / total if total else 0.0,
+            }
@@ -1,88 +1,189 @@
+import asyncio
+import json
 import re
 from typing import Any
 
+from src.core.logging_config import get_logger
+from src.core.metrics import LLM_CALL_SECONDS, timed_call
 from src.llm.client import get_llm
-from src.llm.prompts import CONDITION_CHECK_PROMPT
-from src.scenario.tools import get_user_data
+from src.llm.prompts import BATCH_CONDITION_CHECK_PROMPT, CONDITION_CHECK_PROMPT
+from src.scenario.classifier import ConditionClassifier, ConditionDecisionCache
+from src.scenario.plan import IfStep, TextStep, ToolStep
+from src.scenario.tools import TOOLS
+
+logger = get_logger(__name__)
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def parse_condition_answers(text: str, count: int) -> list[bool] | None:
+    """
+    Разбирает ответ LLM на батч условий.
+
+    Args:
+        text: Ответ LLM с JSON-объектом {"1": "да", "2": "нет", ...}
+        count: Количество условий
+
+    Returns:
+        list[bool] | None: Ответы по порядку условий или None, если ответ не разобран
+    """
+    match = _JSON_OBJECT_RE.search(text)
+    if match is None:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    answers = []
+    for number in range(1, count + 1):
+        value = data.get(str(number))
+        if isinstance(value, bool):
+            answers.append(value)
+        elif isinstance(value, str) and value.strip().lower() in ("да", "нет", "yes", "no"):
+            answers.append(value.strip().lower() in ("да", "yes"))
+        else:
+            return None
+    return answers
 
 
 class NodeExecutor:
-    """Исполнитель нод сценария."""
+    """Исполнитель шагов скомпилированного сценария."""
 
-    def __init__(self) -> None:
+    def __init__(
+        self, classifier: ConditionClassifier | None = None, decision_cache: ConditionDecisionCache | None = None
+    ) -> None:
         """
         Инициализирует исполнитель нод.
+
+        Args:
+            classifier: Локальный классификатор условий (None - все условия проверяет LLM)
+            decision_cache: Кэш решений по условиям (None - без кэша)
         """
         self.tool_results: dict[str, Any] = {}
         self.scenario_context: list[str] = []
         self.llm = get_llm()
+        self.classifier = classifier
+        self.decision_cache = decision_cache
 
-    def execute_text(self, node: dict[str, Any], user_message: str) -> None:
+    def execute_text(self, step: TextStep) -> None:
         """
-        Выполняет text ноду с подстановкой переменных.
+        Выполняет text шаг с подстановкой переменных.
 
         Args:
-            node: Словарь с данными ноды
-            user_message: Сообщение пользователя для контекста
+            step: Шаг с разобранным шаблоном текста
         """
-        text = node.get("text", "")
-        text = self._substitute_variables(text)
-        self.scenario_context.append(text)
+        self.scenario_context.append(step.template.render(self.tool_results))
 
-    def execute_tool(self, node: dict[str, Any]) -> None:
+    async def execute_tool(self, step: ToolStep) -> None:
         """
-        Выполняет tool ноду и сохраняет результат.
+        Выполняет tool шаг и сохраняет результат. Tool, выполненный заранее, не вызывается повторно.
 
         Args:
-            node: Словарь с данными ноды
+            step: Шаг с именем tool
         """
-        tool_name = node.get("tool", "")
-        if tool_name == "get_user_data":
-            result = get_user_data()
-            self.tool_results[tool_name] = result
+        if step.tool not in self.tool_results:
+            await self.run_tools((step.tool,))
 
-    def execute_if(self, node: dict[str, Any], user_message: str) -> bool:
+    async def run_tools(self, tools: tuple[str, ...]) -> None:
         """
-        Выполняет if ноду с проверкой условия через LLM.
+        Параллельно выполняет независимые tools в executor и сохраняет результаты.
 
         Args:
-            node: Словарь с данными ноды
+            tools: Имена tools
+        """
+        results = await asyncio.gather(*(asyncio.to_thread(TOOLS[tool]) for tool in tools))
+        self.tool_results.update(zip(tools, results))
+
+    async def check_condition(self, condition: str, user_message: str) -> bool:
+        """
+        Проверяет одно условие через LLM.
+
+        Args:
+            condition: Текст условия
             user_message: Сообщение пользователя
 
         Returns:
             bool: True если условие выполнено, False иначе
         """
-        condition = node.get("condition", "")
         chain = CONDITION_CHECK_PROMPT | self.llm
-        response = chain.invoke({"message": user_message, "condition": condition})
+        with timed_call(LLM_CALL_SECONDS, "condition"):
+            response = await chain.ainvoke({"message": user_message, "condition": condition})
         answer = response.content.strip().lower()
         return answer.startswith("да")
 
-    def execute_end(self) -> None:
-        """
-        Выполняет end ноду (завершение сценария).
+    async def check_conditions(self, conditions: dict[str, str], user_message: str) -> dict[str, bool]:
         """
-        pass
+        Проверяет условия: сначала по кэшу решений, затем локальным классификатором,
+        остальные одним запросом к LLM. Новые решения кладутся в кэш.
+
+        Args:
+            conditions: id if-ноды -> текст условия
+            user_message: Сообщение пользователя
 
-    def _substitute_variables(self, text: str) -> str:
+        Returns:
+            dict: id if-ноды -> выполнено ли условие
+        """
+        cached: dict[str, bool] = {}
+        if self.decision_cache is not None:
+            for node_id, condition in conditions.items():
+                decision = self.decision_cache.get(condition, user_message)
+                if decision is not None:
+                    cached[node_id] = decision
+        pending = {node_id: condition for node_id, condition in conditions.items() if node_id not in cached}
+
+        decisions = await self.classifier.classify(pending, user_message) if self.classifier is not None else {}
+        remaining = {node_id: condition for node_id, condition in pending.items() if node_id not in decisions}
+        decisions |= await self._check_conditions_llm(remaining, user_message)
+        if self.decision_cache is not None:
+            for node_id, decision in decisions.items():
+                self.decision_cache.put(pending[node_id], user_message, decision)
+        return cached | decisions
+
+    async def _check_conditions_llm(self, conditions: dict[str, str], user_message: str) -> dict[str, bool]:
         """
-        Подставляет переменные из результатов выполнения tools.
+        Проверяет несколько условий одним запросом к LLM.
+
+        Если ответ не удалось разобрать, условия проверяются по одному.
 
         Args:
-            text: Текст с переменными вида {=@tool.variable=}
+            conditions: id if-ноды -> текст условия
+            user_message: Сообщение пользователя
 
         Returns:
-            str: Текст с подставленными значениями
+            dict: id if-ноды -> выполнено ли условие
+        """
+        if not conditions:
+            return {}
+        node_ids = list(conditions)
+        if len(node_ids) == 1:
+            return {node_ids[0]: await self.check_condition(conditions[node_ids[0]], user_message)}
+
+        numbered = "\n".join(f"{number}. {conditions[node_id]}" for number, node_id in enumerate(node_ids, 1))
+        chain = BATCH_CONDITION_CHECK_PROMPT | self.llm
+        with timed_call(LLM_CALL_SECONDS, "condition_batch"):
+            response = await chain.ainvoke({"message": user_message, "conditions": numbered})
+        answers = parse_condition_answers(response.content, len(node_ids))
+        if answers is None:
+            logger.warning("Не удалось разобрать ответ LLM на батч условий, проверяем по одному")
+            answers = [await self.check_condition(conditions[node_id], user_message) for node_id in node_ids]
+        return dict(zip(node_ids, answers))
+
+    async def execute_if(self, step: IfStep, user_message: str) -> bool:
         """
-        pattern = r"\{=@(\w+)\.(\w+)=\}"
-        matches = re.findall(pattern, text)
+        Проверяет условие if шага, зависящее от результатов tools.
 
-        for tool_name, variable_name in matches:
-            if tool_name in self.tool_results:
-                value = self.tool_results[tool_name].get(variable_name, "")
-                text = text.replace(f"{{=@{tool_name}.{variable_name}=}}", str(value))
+        Args:
+            step: If шаг
+            user_message: Сообщение пользователя
 
-        return text
+        Returns:
+            bool: True если условие выполнено, False иначе
+        """
+        condition = step.condition.render(self.tool_results)
+        return (await self.check_conditions({step.id: condition}, user_message))[step.id]
 
     def get_context(self) -> str:
         """
@@ -92,4 +193,3 @@ class NodeExecutor:
             str: Контекст сценария
         """
         return "\n".join(self.scenario_context)
-
@@ -0,0 +1,259 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+from src.scenario.tools import TOOLS
+
+_VARIABLE_RE = re.compile(r"\{=@(\w+)\.(\w+)=\}")
+
+
+class ScenarioValidationError(ValueError):
+    """Сценарий не прошёл проверку при компиляции."""
+
+
+@dataclass(frozen=True)
+class Template:
+    """Текст с переменными {=@tool.variable=}, разобранный один раз при компиляции."""
+
+    # Чередование литералов и ссылок (tool, variable)
+    parts: tuple[str | tuple[str, str], ...]
+
+    @classmethod
+    def parse(cls, text: str) -> "Template":
+        """
+        Разбирает текст на литералы и ссылки на переменные.
+
+        Args:
+            text: Текст с переменными вида {=@tool.variable=}
+
+        Returns:
+            Template: Разобранный шаблон
+        """
+        parts: list[str | tuple[str, str]] = []
+        position = 0
+        for match in _VARIABLE_RE.finditer(text):
+            if match.start() > position:
+                parts.append(text[position : match.start()])
+            parts.append((match.group(1), match.group(2)))
+            position = match.end()
+        if position < len(text):
+            parts.append(text[position:])
+        return cls(tuple(parts))
+
+    @property
+    def tools(self) -> set[str]:
+        """Tools, на результаты которых ссылается шаблон."""
+        return {part[0] for part in self.parts if isinstance(part, tuple)}
+
+    def render(self, tool_results: dict[str, dict[str, Any]]) -> str:
+        """
+        Подставляет значения переменных.
+
+        Args:
+            tool_results: Результаты выполненных tools
+
+        Returns:
+            str: Текст с подставленными значениями
+        """
+        return "".join(
+            part if isinstance(part, str) else str(tool_results.get(part[0], {}).get(part[1], "")) for part in self.parts
+        )
+
+
+@dataclass(frozen=True)
+class TextStep:
+    id: str
+    template: Template
+
+
+@dataclass(frozen=True)
+class ToolStep:
+    id: str
+    tool: str
+
+
+@dataclass(frozen=True)
+class IfStep:
+    id: str
+    condition: Template
+    then_steps: tuple["Step", ...] = ()
+    else_steps: tuple["Step", ...] = ()
+    # Примеры сообщений для локального классификатора условий
+    yes_examples: tuple[str, ...] = ()
+    no_examples: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class EndStep:
+    id: str
+
+
+Step = TextStep | ToolStep | IfStep | EndStep
+
+
+@dataclass
+class ScenarioPlan:
+    """Скомпилированный сценарий: дерево шагов и условия, зависящие только от сообщения пользователя."""
+
+    name: str
+    steps: tuple[Step, ...]
+    # id if-ноды -> текст условия; такие условия проверяются одним батчем до выполнения сценария
+    message_conditions: dict[str, str] = field(default_factory=dict)
+    # Tools верхнего уровня до первого возможного end: выполняются при любом сообщении и не зависят
+    # друг от друга (tools не принимают аргументов), поэтому запускаются параллельно заранее
+    eager_tools: tuple[str, ...] = ()
+
+
+def _compile_steps(
+    nodes: Any,
+    path: str,
+    available_tools: set[str],
+    seen_ids: set[str],
+    message_conditions: dict[str, str],
+) -> tuple[tuple[Step, ...], set[str]]:
+    """
+    Компилирует список нод и возвращает шаги и tools, гарантированно выполненные после них.
+
+    Args:
+        nodes: Список нод из JSON
+        path: Путь к списку в сценарии (для сообщений об ошибках)
+        available_tools: Tools, выполненные на любом пути до этого списка
+        seen_ids: Уже встреченные id нод
+        message_conditions: Сюда складываются условия без переменных
+
+    Returns:
+        tuple: (шаги, tools, выполненные на любом пути через список)
+    """
+    if not isinstance(nodes, list):
+        raise ScenarioValidationError(f"{path}: ожидается список нод")
+
+    available = set(available_tools)
+    steps: list[Step] = []
+    for index, node in enumerate(nodes):
+        node_path = f"{path}[{index}]"
+        if not isinstance(node, dict):
+            raise ScenarioValidationError(f"{node_path}: нода должна быть объектом")
+        node_id = str(node.get("id", ""))
+        if not node_id:
+            raise ScenarioValidationError(f"{node_path}: у ноды нет id")
+        if node_id in seen_ids:
+            raise ScenarioValidationError(f"{node_path}: повторяющийся id ноды {node_id}")
+        seen_ids.add(node_id)
+
+        node_type = node.get("type")
+        if node_type == "text":
+            template = Template.parse(node.get("text", ""))
+            _check_tools(template, available, node_id)
+            steps.append(TextStep(node_id, template))
+        elif node_type == "tool":
+            tool = node.get("tool", "")
+            if tool not in TOOLS:
+                raise ScenarioValidationError(f"Нода {node_id}: неизвестный tool {tool!r}")
+            available.add(tool)
+            steps.append(ToolStep(node_id, tool))
+        elif node_type == "if":
+            condition_text = node.get("condition", "")
+            if not condition_text:
+                raise ScenarioValidationError(f"Нода {node_id}: у if ноды нет условия")
+            condition = Template.parse(condition_text)
+            _check_tools(condition, available, node_id)
+            if not condition.tools:
+                message_conditions[node_id] = condition_text
+            then_steps, then_tools = _compile_steps(
+                node.get("children", []), f"{node_path}.children", available, seen_ids, message_conditions
+            )
+            else_steps, else_tools = _compile_steps(
+                node.get("else_children", []), f"{node_path}.else_children", available, seen_ids, message_conditions
+            )
+            examples = node.get("examples", {})
+            if not isinstance(examples, dict) or not all(
+                isinstance(examples.get(key, []), list) and all(isinstance(text, str) for text in examples.get(key, []))
+                for key in ("yes", "no")
+            ):
+                raise ScenarioValidationError(f"Нода {node_id}: examples должен быть объектом со списками строк yes/no")
+            # После if гарантированы только tools, выполненные в обеих ветках
+            available = then_tools & else_tools
+            steps.append(
+                IfStep(
+                    node_id,
+                    condition,
+                    then_steps,
+                    else_steps,
+                    yes_examples=tuple(examples.get("yes", [])),
+                    no_examples=tuple(examples.get("no", [])),
+                )
+            )
+        elif node_type == "end":
+            steps.append(EndStep(node_id))
+        else:
+            raise ScenarioValidationError(f"Нода {node_id}: неизвестный тип {node_type!r}")
+    return tuple(steps), available
+
+
+def _check_tools(template: Template, available: set[str], node_id: str) -> None:
+    """Проверяет, что шаблон ссылается только на уже выполненные tools."""
+    missing = template.tools - available
+    if missing:
+        raise ScenarioValidationError(
+            f"Нода {node_id}: переменные tools {', '.join(sorted(missing))} используются до их выполнения"
+        )
+
+
+def iter_if_steps(steps: tuple[Step, ...]):
+    """
+    Обходит все if шаги плана, включая вложенные.
+
+    Args:
+        steps: Шаги плана
+
+    Yields:
+        IfStep: If шаги в порядке обхода в глубину
+    """
+    for step in steps:
+        if isinstance(step, IfStep):
+            yield step
+            yield from iter_if_steps(step.then_steps)
+            yield from iter_if_steps(step.else_steps)
+
+
+def _may_end(step: Step) -> bool:
+    """Может ли выполнение шага завершить сценарий."""
+    if isinstance(step, EndStep):
+        return True
+    if isinstance(step, IfStep):
+        return any(_may_end(child) for child in step.then_steps + step.else_steps)
+    return False
+
+
+def compile_scenario(scenario_data: dict[str, Any]) -> ScenarioPlan:
+    """
+    Компилирует JSON сценария в план выполнения.
+
+    Проверяет типы и id нод, имена tools и то, что переменные tools используются
+    только после выполнения tool на любом пути. Вложенность if не ограничена,
+    шаблоны текстов разбираются один раз.
+
+    Args:
+        scenario_data: Сценарий из JSON файла
+
+    Returns:
+        ScenarioPlan: Скомпилированный план
+
+    Raises:
+        ScenarioValidationError: Если сценарий некорректен
+    """
+    message_conditions: dict[str, str] = {}
+    steps, _ = _compile_steps(scenario_data.get("code", []), "code", set(), set(), message_conditions)
+
+    eager_tools: list[str] = []
+    for step in steps:
+        if _may_end(step):
+            break
+        if isinstance(step, ToolStep) and step.tool not in eager_tools:
+            eager_tools.append(step.tool)
+    return ScenarioPlan(
+        name=scenario_data.get("name", ""),
+        steps=steps,
+        message_conditions=message_conditions,
+        eager_tools=tuple(eager_tools),
+    )
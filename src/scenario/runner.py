@@ -1,9 +1,12 @@
+import asyncio
 import json
 from pathlib import Path
 from typing import Any
 
 from src.settings import settings
+from src.scenario.classifier import ConditionClassifier, ConditionDecisionCache
 from src.scenario.nodes import NodeExecutor
+from src.scenario.plan import EndStep, IfStep, ScenarioPlan, Step, TextStep, ToolStep, compile_scenario, iter_if_steps
 from src.core.logging_config import get_logger
 
 
@@ -12,91 +15,102 @@ logger = get_logger(__name__)
 class ScenarioRunner:
     """Выполняет сценарий из JSON файла."""
 
-    def __init__(self, scenario_path: str = None) -> None:
+    def __init__(
+        self,
+        scenario_path: str = None,
+        classifier: ConditionClassifier | None = None,
+        decision_cache: ConditionDecisionCache | None = None,
+    ) -> None:
         """
         Инициализирует runner сценария.
 
         Args:
             scenario_path: Путь к JSON файлу со сценарием
+            classifier: Локальный классификатор условий (None - все условия проверяет LLM)
+            decision_cache: Кэш решений по условиям, общий для всех сообщений (None - без кэша)
         """
         self.scenario_path = settings.scenario_json_file or scenario_path
         self.scenario_data: dict[str, Any] = {}
+        self.plan: ScenarioPlan | None = None
+        self.classifier = classifier
+        self.decision_cache = decision_cache
         self.load_scenario()
 
     def load_scenario(self) -> None:
-        """Загружает сценарий из JSON файла."""
+        """Загружает сценарий из JSON файла и компилирует его в план."""
         path = Path(self.scenario_path)
         if not path.exists():
             raise FileNotFoundError(f"Сценарий не найден: {self.scenario_path}")
 
         with open(path, "r", encoding="utf-8") as f:
             self.scenario_data = json.load(f)
-
-    def run(self, user_message: str) -> tuple[str, str]:
+        self.plan = compile_scenario(self.scenario_data)
+        if self.classifier is not None:
+            for step in iter_if_steps(self.plan.steps):
+                if not step.condition.tools:
+                    self.classifier.register(step.condition.render({}), step.yes_examples, step.no_examples)
+        logger.info(
+            f"Сценарий {self.plan.name!r} скомпилирован: {len(self.plan.steps)} шагов верхнего уровня, "
+            f"{len(self.plan.message_conditions)} условий проверяются батчем"
+        )
+
+    async def _execute_steps(
+        self, steps: tuple[Step, ...], executor: NodeExecutor, user_message: str, answers: dict[str, bool]
+    ) -> tuple[str, bool]:
         """
-        Выполняет сценарий для сообщения пользователя.
+        Выполняет шаги по порядку, рекурсивно заходя в ветки if.
 
         Args:
+            steps: Шаги плана
+            executor: Исполнитель шагов
             user_message: Сообщение пользователя
+            answers: Заранее проверенные условия (id if-ноды -> результат)
 
         Returns:
-            tuple: (контекст сценария, последняя выполненная нода)
+            tuple: (последний выполненный шаг, встречен ли end)
         """
+        last_step = ""
+        for step in steps:
+            last_step = step.id
+            if isinstance(step, TextStep):
+                executor.execute_text(step)
+            elif isinstance(step, ToolStep):
+                await executor.execute_tool(step)
+                logger.debug(f"Выполнена tool нода {step.id}: {step.tool}")
+            elif isinstance(step, IfStep):
+                condition_met = answers.get(step.id)
+                if condition_met is None:
+                    condition_met = await executor.execute_if(step, user_message)
+                logger.debug(f"Выполнена if нода {step.id}, условие выполнено: {condition_met}")
+                branch = step.then_steps if condition_met else step.else_steps
+                branch_last, ended = await self._execute_steps(branch, executor, user_message, answers)
+                last_step = branch_last or last_step
+                if ended:
+                    return last_step, True
+            elif isinstance(step, EndStep):
+                return last_step, True
+        return last_step, False
+
+    async def run(self, user_message: str) -> tuple[str, str]:
+        """
+        Выполняет сценарий для сообщения пользователя.
 
-        logger.info(f"Запуск сценария для сообщения: {user_message}")
-        executor = NodeExecutor()
-        code = self.scenario_data.get("code", [])
-        logger.info(f"Загружено {len(code)} нод сценария")
+        Все условия, зависящие только от сообщения, проверяются одним запросом к LLM
+        параллельно с безусловными tools; условия с переменными tools проверяются по месту.
 
-        last_step = ""
+        Args:
+            user_message: Сообщение пользователя
 
-        i = 0
-        while i < len(code):
-            node = code[i]
-            node_type = node.get("type")
-            node_id = node.get("id", "")
-            logger.info(f"Выполнение ноды {node_id} типа {node_type}")
-
-            if node_type == "text":
-                executor.execute_text(node, user_message)
-                last_step = node_id
-                logger.info(f"Выполнена text нода {node_id}")
-
-            elif node_type == "tool":
-                executor.execute_tool(node)
-                last_step = node_id
-                logger.info(f"Выполнена tool нода {node_id}, результат: {executor.tool_results}")
-
-            elif node_type == "if":
-                condition_met = executor.execute_if(node, user_message)
-                last_step = node_id
-                logger.info(f"Выполнена if нода {node_id}, условие выполнено: {condition_met}")
-
-                if condition_met:
-                    children = node.get("children", [])
-                    logger.info(f"Выполнение {len(children)} дочерних нод для true ветки")
-                    for child in children:
-                        if child.get("type") == "text":
-                            executor.execute_text(child, user_message)
-                            last_step = child.get("id", "")
-                            logger.info(f"Выполнена дочерняя text нода {child.get('id')}")
-                else:
-                    else_children = node.get("else_children", [])
-                    logger.info(f"Выполнение {len(else_children)} дочерних нод для false ветки")
-                    for child in else_children:
-                        if child.get("type") == "text":
-                            executor.execute_text(child, user_message)
-                            last_step = child.get("id", "")
-                            logger.info(f"Выполнена дочерняя text нода {child.get('id')}")
-
-            elif node_type == "end":
-                executor.execute_end()
-                last_step = node_id
-                logger.info(f"Выполнена end нода {node_id}")
-                break
-
-            i += 1
+        Returns:
+            tuple: (контекст сценария, последняя выполненная нода)
+        """
+        executor = NodeExecutor(self.classifier, self.decision_cache)
+        answers, _ = await asyncio.gather(
+            executor.check_conditions(self.plan.message_conditions, user_message),
+            executor.run_tools(self.plan.eager_tools),
+        )
+        last_step, _ = await self._execute_steps(self.plan.steps, executor, user_message, answers)
 
         context = executor.get_context()
-        logger.info(f"Сценарий завершен, last_step={last_step}, контекст длиной {len(context)}")
+        logger.debug(f"Сценарий завершен, last_step={last_step}, контекст длиной {len(context)}")
         return context, last_step
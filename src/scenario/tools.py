@@ -10,3 +10,9 @@ def get_user_data() -> dict[str, Any]:
     """
     return {"name": "Антон", "age": "25"}
 
+
+
+# Реестр tools, доступных в сценариях
+TOOLS = {
+    "get_user_data": get_user_data,
+}
@@ -0,0 +1,101 @@
+"""
+Многопроцессный запуск API: один сервер эмбеддингов и несколько воркеров uvicorn.
+
+Модель эмбеддингов загружается один раз в процессе src.rag.embedding_server,
+воркеры получают векторы по Unix-сокету и не держат свою копию модели.
+База знаний синхронизируется с хранилищем один раз до старта воркеров.
+BM25 индекс воркеры открывают с диска через memory-map, поэтому его страницы
+общие через page cache.
+
+Запуск:
+    uv run python -m src.serve --workers 4 --port 8000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ENV_PREFIX = "ONLINESHOPRAG__"
+
+
+def wait_for_embedding_server(socket_path: str, process: subprocess.Popen, timeout: float) -> None:
+    """
+    Ждёт, пока сервер эмбеддингов начнёт отвечать.
+
+    Args:
+        socket_path: Путь к Unix-сокету
+        process: Процесс сервера
+        timeout: Максимальное время ожидания в секундах
+
+    Raises:
+        RuntimeError: Если сервер завершился или не ответил за timeout
+    """
+    from src.rag.embedding_server import RemoteEmbeddings
+
+    client = RemoteEmbeddings(socket_path, timeout=5.0)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Сервер эмбеддингов завершился с кодом {process.returncode}")
+        try:
+            client.ping()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"Сервер эмбеддингов не ответил за {timeout} с")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket", default=None, help="Unix-сокет сервера эмбеддингов (по умолчанию из настроек или data/embeddings.sock)")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    # Настройки читаются при импорте src.settings, поэтому переменные окружения задаются до него;
+    # воркеры uvicorn и сервер эмбеддингов наследуют их
+    socket_path = args.socket or os.environ.get(f"{ENV_PREFIX}EMBEDDING_SERVER_SOCKET") or "data/embeddings.sock"
+    os.environ[f"{ENV_PREFIX}EMBEDDING_SERVER_SOCKET"] = socket_path
+
+    import uvicorn
+
+    from src.core.logging_config import get_logger, setup_logging
+    from src.settings import PROJECT_ROOT, settings
+
+    setup_logging()
+    logger = get_logger(__name__)
+    if args.workers > 1 and settings.conversation_store == "memory":
+        # Память диалогов в режиме memory своя у каждого воркера: сообщения одного диалога попадали бы
+        # в разные процессы, и история и проверка первого сообщения работали бы неверно
+        os.environ[f"{ENV_PREFIX}CONVERSATION_STORE"] = "sqlite"
+        logger.warning(
+            f"Память диалогов в режиме memory не общая для воркеров, переключаемся на sqlite "
+            f"({PROJECT_ROOT / settings.conversation_sqlite_path}). Для нескольких хостов используйте "
+            "ONLINESHOPRAG__CONVERSATION_STORE=redis"
+        )
+
+    embedding_server = subprocess.Popen([sys.executable, "-m", "src.rag.embedding_server"])
+    try:
+        wait_for_embedding_server(socket_path, embedding_server, args.startup_timeout)
+        logger.info(f"Сервер эмбеддингов готов: {socket_path}")
+
+        if settings.index_on_startup:
+            # В отдельном процессе, чтобы память ретривера не оставалась в процессе-супервизоре
+            subprocess.run([sys.executable, "-m", "src.core.startup"], check=True)
+        os.environ[f"{ENV_PREFIX}INDEX_ON_STARTUP"] = "false"
+
+        logger.info(f"Запуск {args.workers} воркеров на {args.host}:{args.port}")
+        uvicorn.run("src.main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        embedding_server.terminate()
+        try:
+            embedding_server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            embedding_server.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
+from pathlib import Path
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Относительные пути к файлам данных в настройках считаются от корня проекта, а не от текущей директории
+PROJECT_ROOT = Path(__file__).parent.parent
+
 
 class Settings(BaseSettings):
     """Настройки приложения из переменных окружения."""
@@ -8,20 +14,89 @@ class Settings(BaseSettings):
     llm_api_key: str
     llm_model: str = "openai/gpt-oss-20b:free"
     llm_api_base: str = "https://openrouter.ai/api/v1"
+    # Шлюз LLM: одновременные запросы, повторы при 429/5xx, таймаут вызова, keep-alive соединений
+    llm_max_in_flight: int = 16
+    llm_max_retries: int = 3
+    llm_timeout_seconds: float = 60.0
+    llm_retry_backoff_seconds: float = 0.5
+    llm_retry_backoff_max_seconds: float = 10.0
+    llm_keepalive_seconds: float = 60.0
 
     # Qdrant
     qdrant_host: str = "qdrant"
     qdrant_port: int = 6333
     qdrant_collection_name: str = "kb_chunks"
+    # Хранение векторов: квантизация (none, scalar - int8, binary - 1 бит), исходные векторы на диске, HNSW
+    qdrant_quantization: Literal["none", "scalar", "binary"] = "none"
+    qdrant_quantization_always_ram: bool = True
+    qdrant_on_disk_vectors: bool = False
+    qdrant_hnsw_m: int = 16
+    qdrant_hnsw_ef_construct: int = 100
+    # Параметры запроса: ef HNSW и оверсэмплинг (0 - по умолчанию Qdrant), пересчёт по исходным векторам
+    qdrant_search_ef: int = 0
+    qdrant_oversampling: float = 0.0
+    qdrant_rescore: bool = True
+
+    # Хранилище векторов: qdrant или встроенный NumPy-индекс на диске (float32 или int8)
+    vector_backend: Literal["qdrant", "numpy"] = "qdrant"
+    numpy_index_path: str = "data/vector_index"
+    numpy_index_dtype: Literal["float32", "int8"] = "float32"
 
     # RAG параметры
     chunk_size: int = 500
     chunk_overlap: int = 50
     top_k: int = 5
     min_score: float = 0.5
+    bm25_index_path: str = "data/bm25_index"
+    # client - BM25 в процессе и RRF в Python, server - sparse-векторы в Qdrant и fusion на стороне Qdrant
+    hybrid_search_mode: Literal["client", "server"] = "client"
+    # Переранжирование CPU cross-encoder'ом: кандидатов берётся rerank_candidates, при оценке
+    # задержки выше rerank_budget_ms (например, под нагрузкой) остаётся порядок fusion
+    rerank_enabled: bool = False
+    rerank_model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    rerank_candidates: int = 20
+    rerank_budget_ms: float = 150.0
+    rerank_max_length: int = 256
+
+    # Кэш решений по условиям сценария (условие, нормализованное сообщение); 0 - без кэша
+    condition_cache_size: int = 4096
+    # Локальная проверка условий сценария по эмбеддингам; неуверенные случаи уходят в LLM.
+    # Выключена, пока пороги не откалиброваны на размеченных сообщениях (benchmarks.condition_classifier)
+    condition_classifier_enabled: bool = False
+    condition_classifier_margin: float = 0.1
+    condition_classifier_yes_threshold: float = 0.8
+    condition_classifier_no_threshold: float = 0.3
+
+    # Таймауты параллельных веток первого сообщения: сценарий и поиск по базе знаний
+    scenario_timeout_seconds: float = 15.0
+    retrieval_timeout_seconds: float = 10.0
+
+    # Индексация: размер батча эмбеддинга и число потоков
+    ingest_batch_size: int = 64
+    ingest_workers: int = 2
+
+    # Бюджет токенов промпта ответа (системный промпт, сценарий, чанки, история и вопрос)
+    # и кодировка tiktoken для подсчёта (o200k_base у gpt-oss и gpt-4o)
+    prompt_max_tokens: int = 3000
+    prompt_tokenizer_encoding: str = "o200k_base"
 
     # Память диалога
     max_history_messages: int = 20
+    # Хранилище диалогов: memory (в процессе), sqlite (WAL-файл) или redis (нужен пакет redis)
+    conversation_store: Literal["memory", "sqlite", "redis"] = "memory"
+    conversation_sqlite_path: str = "data/conversations.db"
+    conversation_redis_url: str = "redis://localhost:6379/0"
+    # Вытеснение: максимум диалогов (LRU), время бездействия (0 - без TTL),
+    # объём текста в памяти процесса и число хранимых сообщений диалога
+    conversation_max_count: int = 10000
+    conversation_ttl_seconds: float = 86400.0
+    conversation_max_memory_mb: float = 256.0
+    conversation_max_messages: int = 100
+    # Фоновая суммаризация: когда сырых сообщений больше max_history_messages, старые
+    # сворачиваются в резюме (остаётся summary_keep_messages последних) после паузы debounce
+    summary_enabled: bool = True
+    summary_debounce_seconds: float = 2.0
+    summary_keep_messages: int = 10
 
     # API URL для Streamlit
     api_url: str = "http://app:8000"
@@ -29,9 +104,39 @@ class Settings(BaseSettings):
     # MLflow
     mlflow_tracking_uri: str = "http://mlflow:5000"
     mlflow_experiment_name: str = "onlineshoprag"
+    # Трассировка запросов: доля обычных запросов; ошибки и запросы дольше tracing_slow_ms
+    # записываются всегда. Трассы отправляет фоновый поток, при заполненной очереди они отбрасываются
+    tracing_enabled: bool = True
+    tracing_sample_rate: float = 0.05
+    tracing_slow_ms: float = 5000.0
+    tracing_queue_size: int = 1000
 
     # Embedding модель
     embedding_model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    # Бэкенд инференса на CPU: torch, torch_int8, onnx или onnx_int8
+    embedding_backend: Literal["torch", "torch_int8", "onnx", "onnx_int8"] = "torch"
+    # Потоки внутри операции (0 - по умолчанию), ONNX-файл в репозитории модели (пусто - по умолчанию)
+    embedding_threads: int = 0
+    embedding_onnx_file: str = ""
+    # Unix-сокет сервера эмбеддингов (src.rag.embedding_server): если задан, модель не загружается
+    # в процессе, а векторы считает общий для воркеров сервер с батчированием запросов
+    embedding_server_socket: str = ""
+    embedding_server_max_batch: int = 64
+    embedding_server_batch_wait_ms: float = 2.0
+
+    # Кэш эмбеддингов запросов (0 - кэш выключен)
+    embedding_cache_size: int = 1024
+    embedding_cache_ttl_seconds: float = 3600.0
+
+    # Семантический кэш ответов на первые вопросы диалога
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_size: int = 512
+    semantic_cache_ttl_seconds: float = 3600.0
+
+    # Синхронизировать базу знаний с хранилищем при старте (при запуске через src.serve
+    # синхронизация выполняется один раз до старта воркеров)
+    index_on_startup: bool = True
 
     # Файлы данных
     context_html_file: str = "Context.html"
@@ -1,3 +1,6 @@
+import json
+from collections.abc import Iterator
+
 import streamlit as st
 import requests
 from src.settings import settings
@@ -9,6 +12,28 @@ st.title("💬 OnlineShopRAG - Чат поддержки")
 
 API_URL = st.sidebar.text_input("API URL", value=settings.api_url)
 
+
+def iter_sse_events(response: requests.Response) -> Iterator[tuple[str, dict]]:
+    """
+    Разбирает поток server-sent events из ответа /chat/stream.
+
+    Args:
+        response: Потоковый HTTP-ответ
+
+    Yields:
+        tuple: (имя события, данные события)
+    """
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "conversation_id" not in st.session_state:
@@ -43,39 +68,56 @@ if prompt := st.chat_input("Введите ваше сообщение..."):
         st.markdown(prompt)
     
     with st.chat_message("assistant"):
-        with st.spinner("Думаю..."):
-            try:
-                response = requests.post(
-                    f"{API_URL}/chat",
-                    json={
-                        "conversation_id": st.session_state.conversation_id,
-                        "message": prompt,
-                    },
-                    timeout=60,
-                )
-                response.raise_for_status()
-                data = response.json()
-                
-                answer = data.get("answer", "Ошибка: ответ не получен")
-                chunks = data.get("chunks", [])
-                
-                st.markdown(answer)
-                
-                if chunks:
-                    with st.expander(f"📄 Найдено {len(chunks)} релевантных чанков"):
-                        for i, chunk in enumerate(chunks, 1):
-                            st.markdown(f"**Чанк {i}** (score: {chunk.get('score', 0):.3f})")
-                            st.text(chunk.get("text", "")[:200] + "...")
-                
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": answer,
-                })
-            except requests.exceptions.RequestException as e:
-                error_msg = f"Ошибка при обращении к API: {str(e)}"
-                st.error(error_msg)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_msg,
-                })
+        try:
+            response = requests.post(
+                f"{API_URL}/chat/stream",
+                json={
+                    "conversation_id": st.session_state.conversation_id,
+                    "message": prompt,
+                },
+                stream=True,
+                timeout=60,
+            )
+            response.raise_for_status()
+            response.encoding = "utf-8"
+
+            stream_state = {"chunks": []}
+
+            def answer_tokens() -> Iterator[str]:
+                """Отдаёт токены ответа по мере их поступления."""
+                for event, data in iter_sse_events(response):
+                    if event == "context":
+                        stream_state["chunks"] = data.get("chunks", [])
+                    elif event == "token":
+                        yield data.get("text", "")
+                    elif event == "error":
+                        raise requests.exceptions.RequestException(data.get("detail", "ошибка сервера"))
+
+            with st.spinner("Думаю..."):
+                events = answer_tokens()
+                first_token = next(events, "")
+
+            def all_tokens() -> Iterator[str]:
+                yield first_token
+                yield from events
+
+            answer = st.write_stream(all_tokens()) or "Ошибка: ответ не получен"
+            chunks = stream_state["chunks"]
+
+            if chunks:
+                with st.expander(f"📄 Найдено {len(chunks)} релевантных чанков"):
+                    for i, chunk in enumerate(chunks, 1):
+                        st.markdown(f"**Чанк {i}** (score: {chunk.get('score', 0):.3f})")
+                        st.text(chunk.get("text", "")[:200] + "...")
 
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": answer,
+            })
+        except requests.exceptions.RequestException as e:
+            error_msg = f"Ошибка при обращении к API: {str(e)}"
+            st.error(error_msg)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": error_msg,
+            })
@@ -0,0 +1,4 @@
+import os
+
+# Настройки читаются при импорте src.settings, а ключ LLM обязателен
+os.environ.setdefault("ONLINESHOPRAG__LLM_API_KEY", "test")
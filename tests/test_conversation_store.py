@@ -0,0 +1,235 @@
+"""
+Тесты хранилищ диалогов: общий контракт для memory, sqlite и redis (через fakeredis),
+вытеснение по LRU, TTL и объёму и compare-and-set резюме.
+
+Запуск:
+    uv run python -m unittest discover -s tests -t .
+"""
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from src.core.conversation_store import (
+    ASSISTANT,
+    USER,
+    MemoryConversationStore,
+    RedisConversationStore,
+    SQLiteConversationStore,
+)
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class StoreContract:
+    """Поведение, общее для всех хранилищ; create_store задаёт конкретный бэкенд."""
+
+    max_messages = 5
+
+    async def create_store(self):
+        raise NotImplementedError
+
+    async def asyncSetUp(self) -> None:
+        self.store = await self.create_store()
+
+    async def asyncTearDown(self) -> None:
+        await self.store.close()
+
+    async def test_missing_conversation(self) -> None:
+        self.assertIsNone(await self.store.get("missing"))
+
+    async def test_append_and_get(self) -> None:
+        await self.store.append("c1", USER, "Привет")
+        await self.store.append("c1", ASSISTANT, "Здравствуйте")
+        conversation = await self.store.get("c1")
+        self.assertEqual(conversation.messages, [(USER, "Привет"), (ASSISTANT, "Здравствуйте")])
+        self.assertEqual(conversation.summary, "")
+
+    async def test_keeps_last_messages(self) -> None:
+        for i in range(self.max_messages + 3):
+            await self.store.append("c1", USER, f"m{i}")
+        conversation = await self.store.get("c1")
+        self.assertEqual([content for _, content in conversation.messages], [f"m{i}" for i in range(3, 8)])
+
+    async def test_set_summary_applies_once(self) -> None:
+        for i in range(4):
+            await self.store.append("c1", USER, f"m{i}")
+        self.assertTrue(await self.store.set_summary("c1", "резюме", covered=2, expected_summary=""))
+        conversation = await self.store.get("c1")
+        self.assertEqual(conversation.summary, "резюме")
+        self.assertEqual([content for _, content in conversation.messages], ["m2", "m3"])
+
+        # Параллельная суммаризация от того же исходного резюме не применяется и не удаляет сообщения
+        self.assertFalse(await self.store.set_summary("c1", "другое", covered=2, expected_summary=""))
+        conversation = await self.store.get("c1")
+        self.assertEqual(conversation.summary, "резюме")
+        self.assertEqual(len(conversation.messages), 2)
+
+    async def test_set_summary_keeps_messages_appended_meanwhile(self) -> None:
+        for i in range(3):
+            await self.store.append("c1", USER, f"m{i}")
+        await self.store.append("c1", ASSISTANT, "новое")
+        self.assertTrue(await self.store.set_summary("c1", "резюме", covered=3, expected_summary=""))
+        conversation = await self.store.get("c1")
+        self.assertEqual(conversation.messages, [(ASSISTANT, "новое")])
+
+    async def test_count(self) -> None:
+        self.assertEqual(await self.store.count(), 0)
+        await self.store.append("c1", USER, "a")
+        await self.store.append("c2", USER, "b")
+        await self.store.append("c1", ASSISTANT, "c")
+        self.assertEqual(await self.store.count(), 2)
+
+
+class MemoryConversationStoreTest(StoreContract, unittest.IsolatedAsyncioTestCase):
+    async def create_store(self):
+        return MemoryConversationStore(max_conversations=3, ttl_seconds=60, max_bytes=10_000, max_messages=self.max_messages)
+
+    async def test_evicts_least_recently_used(self) -> None:
+        for conversation_id in ("c1", "c2", "c3"):
+            await self.store.append(conversation_id, USER, "текст")
+        await self.store.get("c1")
+        await self.store.append("c4", USER, "текст")
+        self.assertIsNone(await self.store.get("c2"))
+        self.assertIsNotNone(await self.store.get("c1"))
+        self.assertEqual(await self.store.count(), 3)
+        self.assertEqual(self.store.evictions, 1)
+
+    async def test_evicts_by_total_size(self) -> None:
+        store = MemoryConversationStore(max_conversations=100, ttl_seconds=0, max_bytes=100, max_messages=10)
+        await store.append("c1", USER, "x" * 60)
+        await store.append("c2", USER, "y" * 60)
+        self.assertIsNone(await store.get("c1"))
+        self.assertIsNotNone(await store.get("c2"))
+        self.assertLessEqual(store._total_bytes, 100)
+
+    async def test_expires_idle_conversations(self) -> None:
+        now = time.time()
+        with patch("src.core.conversation_store.time.time", return_value=now):
+            await self.store.append("c1", USER, "a")
+        with patch("src.core.conversation_store.time.time", return_value=now + 61):
+            self.assertIsNone(await self.store.get("c1"))
+            # Запись в устаревший диалог начинает новый
+            await self.store.append("c1", USER, "b")
+            self.assertEqual((await self.store.get("c1")).messages, [(USER, "b")])
+
+    async def test_summary_updates_size(self) -> None:
+        await self.store.append("c1", USER, "x" * 100)
+        await self.store.set_summary("c1", "s", covered=1, expected_summary="")
+        self.assertEqual(self.store._total_bytes, len("s"))
+
+
+class SQLiteConversationStoreTest(StoreContract, unittest.IsolatedAsyncioTestCase):
+    async def create_store(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "conversations.db")
+        return SQLiteConversationStore(self.path, max_conversations=3, ttl_seconds=60, max_messages=self.max_messages)
+
+    async def asyncTearDown(self) -> None:
+        await super().asyncTearDown()
+        self.tmp.cleanup()
+
+    async def test_persists_across_instances(self) -> None:
+        await self.store.append("c1", USER, "Привет")
+        await self.store.set_summary("c1", "резюме", covered=0, expected_summary="")
+        other = SQLiteConversationStore(self.path, max_conversations=3, ttl_seconds=60, max_messages=self.max_messages)
+        try:
+            conversation = await other.get("c1")
+            self.assertEqual(conversation.messages, [(USER, "Привет")])
+            self.assertEqual(conversation.summary, "резюме")
+        finally:
+            await other.close()
+
+    async def test_expires_idle_conversations(self) -> None:
+        now = time.time()
+        with patch("src.core.conversation_store.time.time", return_value=now):
+            await self.store.append("c1", USER, "a")
+        with patch("src.core.conversation_store.time.time", return_value=now + 61):
+            self.assertIsNone(await self.store.get("c1"))
+
+    async def test_sweep_removes_oldest_over_limit(self) -> None:
+        self.store.SWEEP_EVERY = 1
+        now = time.time()
+        for i, conversation_id in enumerate(("c1", "c2", "c3", "c4")):
+            with patch("src.core.conversation_store.time.time", return_value=now + i):
+                await self.store.append(conversation_id, USER, "текст")
+        self.assertEqual(await self.store.count(), 3)
+        self.assertIsNone(await self.store.get("c1"))
+
+    async def test_count_does_not_block_event_loop(self) -> None:
+        # Запись другого потока держит блокировку (например, ждёт BEGIN IMMEDIATE другого процесса)
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock() -> None:
+            with self.store._lock:
+                locked.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        locked.wait(5)
+        try:
+            count_task = asyncio.create_task(self.store.count())
+            ticks = 0
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            self.assertEqual(ticks, 5)
+            self.assertFalse(count_task.done())
+        finally:
+            release.set()
+        self.assertEqual(await count_task, 0)
+        holder.join()
+
+
+@unittest.skipIf(fakeredis is None, "нужен пакет fakeredis")
+class RedisConversationStoreTest(StoreContract, unittest.IsolatedAsyncioTestCase):
+    async def create_store(self):
+        store = RedisConversationStore("redis://localhost:6379/0", ttl_seconds=60, max_messages=self.max_messages)
+        await store.client.aclose()
+        store.client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        return store
+
+    async def test_sets_idle_ttl(self) -> None:
+        await self.store.append("c1", USER, "a")
+        await self.store.set_summary("c1", "резюме", covered=0, expected_summary="")
+        messages_key, summary_key = self.store._keys("c1")
+        self.assertTrue(0 < await self.store.client.ttl(messages_key) <= 60)
+        self.assertTrue(0 < await self.store.client.ttl(summary_key) <= 60)
+
+    async def test_summary_only_conversation_exists(self) -> None:
+        await self.store.append("c1", USER, "a")
+        await self.store.set_summary("c1", "резюме", covered=1, expected_summary="")
+        conversation = await self.store.get("c1")
+        self.assertEqual(conversation.messages, [])
+        self.assertEqual(conversation.summary, "резюме")
+
+    async def test_ignores_other_keys(self) -> None:
+        await self.store.client.set("unrelated", "1")
+        await self.store.append("c1", USER, "a")
+        self.assertEqual(await self.store.count(), 1)
+
+    async def test_count_does_not_scan_keys(self) -> None:
+        await self.store.append("c1", USER, "a")
+        with patch.object(self.store.client, "scan_iter", side_effect=AssertionError("SCAN при подсчёте")):
+            self.assertEqual(await self.store.count(), 1)
+
+    async def test_count_drops_expired_conversations(self) -> None:
+        now = time.time()
+        with patch("src.core.conversation_store.time.time", return_value=now):
+            await self.store.append("c1", USER, "a")
+        with patch("src.core.conversation_store.time.time", return_value=now + 30):
+            await self.store.append("c2", USER, "b")
+        with patch("src.core.conversation_store.time.time", return_value=now + 61):
+            self.assertEqual(await self.store.count(), 1)
+        self.assertIsNone(await self.store.client.zscore(self.store.index_key, "c1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
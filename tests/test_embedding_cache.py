@@ -0,0 +1,69 @@
+"""
+Тесты кэша эмбеддингов запросов: нормализованный ключ, исходный текст на промахе, LRU и TTL.
+
+Запуск:
+    uv run python -m unittest discover -s tests -t .
+"""
+import time
+import unittest
+from unittest.mock import patch
+
+from langchain_core.embeddings import Embeddings
+
+from src.rag.embeddings import CachedEmbeddings, EmbeddingCache, normalize_query
+
+
+class RecordingEmbeddings(Embeddings):
+    """Модель, запоминающая тексты, которые ей передали."""
+
+    def __init__(self) -> None:
+        self.queries: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.queries.append(text)
+        return [float(len(text))]
+
+
+class CachedEmbeddingsTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.model = RecordingEmbeddings()
+        self.embeddings = CachedEmbeddings(self.model, "model", EmbeddingCache(max_size=2))
+
+    def test_normalize_query(self) -> None:
+        self.assertEqual(normalize_query("  Ёлка,  ЗЕЛЁНАЯ!? "), "елка зеленая")
+
+    def test_miss_embeds_original_text(self) -> None:
+        self.assertEqual(self.embeddings.embed_query("Как вывести деньги?"), [19.0])
+        self.assertEqual(self.model.queries, ["Как вывести деньги?"])
+
+    async def test_async_miss_embeds_original_text(self) -> None:
+        await self.embeddings.aembed_query("Привет!")
+        self.assertEqual(self.model.queries, ["Привет!"])
+
+    def test_spelling_variants_share_entry(self) -> None:
+        first = self.embeddings.embed_query("Как вывести деньги?")
+        self.assertEqual(self.embeddings.embed_query("как вывести  деньги"), first)
+        self.assertEqual(len(self.model.queries), 1)
+        self.assertEqual(self.embeddings.cache.stats()["hits"], 1)
+
+    def test_evicts_least_recently_used(self) -> None:
+        for text in ("a", "b", "a", "c"):
+            self.embeddings.embed_query(text)
+        self.embeddings.embed_query("b")
+        self.assertEqual(self.model.queries, ["a", "b", "c", "b"])
+
+    def test_expires_entries(self) -> None:
+        embeddings = CachedEmbeddings(self.model, "model", EmbeddingCache(max_size=10, ttl_seconds=60))
+        now = time.monotonic()
+        with patch("src.rag.embeddings.time.monotonic", return_value=now):
+            embeddings.embed_query("a")
+        with patch("src.rag.embeddings.time.monotonic", return_value=now + 61):
+            embeddings.embed_query("a")
+        self.assertEqual(self.model.queries, ["a", "a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
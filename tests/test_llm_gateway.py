@@ -0,0 +1,154 @@
+"""
+Тесты шлюза LLM: Retry-After, исчерпание повторов и учёт ошибок в метриках, в том числе при стриминге.
+
+Запуск:
+    uv run python -m unittest discover -s tests -t .
+"""
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Any
+
+import httpx
+import openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.llm.gateway import LLMGateway, _retry_after
+
+
+def status_error(status: int, headers: dict[str, str] | None = None) -> openai.APIStatusError:
+    response = httpx.Response(status, headers=headers or {}, request=httpx.Request("POST", "http://llm/v1/chat/completions"))
+    error_class = openai.RateLimitError if status == 429 else openai.InternalServerError if status >= 500 else openai.BadRequestError
+    return error_class(f"HTTP {status}", response=response, body=None)
+
+
+class FlakyChatModel(BaseChatModel):
+    """Модель, которая сначала выбрасывает ошибки из списка, потом отвечает; может оборвать стрим."""
+
+    errors: list[Any] = []
+    stream_error: Any = None
+    attempts: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "flaky"
+
+    def _next_error(self) -> Exception | None:
+        self.attempts += 1
+        return self.errors.pop(0) if self.errors else None
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        error = self._next_error()
+        if error is not None:
+            raise error
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self._generate(messages, stop)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        error = self._next_error()
+        if error is not None:
+            raise error
+        yield ChatGenerationChunk(message=AIMessageChunk(content="o"))
+        if self.stream_error is not None:
+            raise self.stream_error
+        yield ChatGenerationChunk(message=AIMessageChunk(content="k"))
+
+
+def gateway(llm: FlakyChatModel, **kwargs: Any) -> LLMGateway:
+    options = {"max_retries": 2, "timeout": 5.0, "backoff_base": 0.0, "backoff_max": 10.0} | kwargs
+    return LLMGateway(llm=llm, **options)
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_seconds(self) -> None:
+        self.assertEqual(_retry_after(status_error(429, {"retry-after": "2"})), 2.0)
+
+    def test_milliseconds_take_precedence(self) -> None:
+        self.assertEqual(_retry_after(status_error(429, {"retry-after-ms": "250", "retry-after": "2"})), 0.25)
+
+    def test_http_date(self) -> None:
+        value = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertAlmostEqual(_retry_after(status_error(503, {"retry-after": value})), 30, delta=2)
+
+    def test_missing_or_invalid(self) -> None:
+        self.assertIsNone(_retry_after(status_error(429)))
+        self.assertIsNone(_retry_after(status_error(429, {"retry-after": "soon"})))
+        self.assertIsNone(_retry_after(TimeoutError()))
+
+    def test_backoff_uses_retry_after_capped_by_max(self) -> None:
+        llm_gateway = gateway(FlakyChatModel(), backoff_base=0.1, backoff_max=1.0)
+        delay = llm_gateway._backoff(0, status_error(429, {"retry-after": "0.5"}))
+        self.assertTrue(0.5 <= delay <= 0.6)
+        self.assertLessEqual(llm_gateway._backoff(0, status_error(429, {"retry-after": "60"})), 1.1)
+
+
+class LLMGatewayTest(unittest.IsolatedAsyncioTestCase):
+    async def test_retries_until_success_waiting_retry_after(self) -> None:
+        llm = FlakyChatModel(errors=[status_error(429, {"retry-after": "0.1"})])
+        llm_gateway = gateway(llm)
+        started = time.perf_counter()
+        result = await llm_gateway.ainvoke("вопрос")
+        self.assertEqual(result.content, "ok")
+        self.assertGreaterEqual(time.perf_counter() - started, 0.1)
+        stats = llm_gateway.metrics.stats()
+        self.assertEqual((llm.attempts, stats["retries"], stats["failures"]), (2, 1, 0))
+
+    async def test_gives_up_when_retries_run_out(self) -> None:
+        llm = FlakyChatModel(errors=[status_error(503) for _ in range(5)])
+        llm_gateway = gateway(llm)
+        with self.assertRaises(openai.InternalServerError):
+            await llm_gateway.ainvoke("вопрос")
+        stats = llm_gateway.metrics.stats()
+        self.assertEqual((llm.attempts, stats["calls"], stats["retries"], stats["failures"]), (3, 1, 2, 1))
+        self.assertEqual(stats["in_flight"], 0)
+
+    async def test_does_not_retry_client_errors(self) -> None:
+        llm = FlakyChatModel(errors=[status_error(400)])
+        llm_gateway = gateway(llm)
+        with self.assertRaises(openai.BadRequestError):
+            await llm_gateway.ainvoke("вопрос")
+        self.assertEqual((llm.attempts, llm_gateway.metrics.stats()["failures"]), (1, 1))
+
+    async def test_stream_retries_before_first_chunk(self) -> None:
+        llm = FlakyChatModel(errors=[status_error(429)])
+        llm_gateway = gateway(llm)
+        chunks = [chunk.content async for chunk in llm_gateway.astream("вопрос")]
+        self.assertEqual("".join(chunks), "ok")
+        self.assertEqual(llm_gateway.metrics.stats()["retries"], 1)
+
+    async def test_stream_gives_up_when_retries_run_out(self) -> None:
+        llm = FlakyChatModel(errors=[status_error(429) for _ in range(5)])
+        llm_gateway = gateway(llm)
+        with self.assertRaises(openai.RateLimitError):
+            async for _ in llm_gateway.astream("вопрос"):
+                pass
+        stats = llm_gateway.metrics.stats()
+        self.assertEqual((llm.attempts, stats["retries"], stats["failures"]), (3, 2, 1))
+
+    async def test_counts_mid_stream_error_as_failure(self) -> None:
+        llm = FlakyChatModel(stream_error=openai.APIConnectionError(request=httpx.Request("POST", "http://llm")))
+        llm_gateway = gateway(llm)
+        with self.assertRaises(openai.APIConnectionError):
+            async for _ in llm_gateway.astream("вопрос"):
+                pass
+        stats = llm_gateway.metrics.stats()
+        # После первого фрагмента запрос не повторяется
+        self.assertEqual((llm.attempts, stats["retries"], stats["failures"], stats["timeouts"]), (1, 0, 1, 0))
+
+    async def test_counts_mid_stream_timeout(self) -> None:
+        llm = FlakyChatModel(stream_error=TimeoutError())
+        llm_gateway = gateway(llm)
+        with self.assertRaises(TimeoutError):
+            async for _ in llm_gateway.astream("вопрос"):
+                pass
+        stats = llm_gateway.metrics.stats()
+        self.assertEqual((stats["failures"], stats["timeouts"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
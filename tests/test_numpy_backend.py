@@ -0,0 +1,85 @@
+"""
+Тесты встроенного NumPy-хранилища: upsert, поиск и согласованность снимка при конкурентных обновлениях.
+
+Запуск:
+    uv run python -m unittest discover -s tests -t .
+"""
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import numpy as np
+from langchain.schema import Document
+
+from src.rag.vector_store import NumpyBackend
+
+DIM = 256
+
+
+def unit_vector(axis: int) -> list[float]:
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[axis] = 1.0
+    return vector.tolist()
+
+
+class NumpyBackendTest(unittest.TestCase):
+    dtype = "float32"
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.backend = NumpyBackend(Path(self.tmp.name) / "index", dtype=self.dtype)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_upsert_updates_existing_point(self) -> None:
+        self.backend.upsert(["p1", "p2"], [Document(page_content="a"), Document(page_content="b")], [unit_vector(0), unit_vector(1)])
+        self.backend.upsert(["p1"], [Document(page_content="c")], [unit_vector(2)])
+        self.assertEqual(len(self.backend), 2)
+        top = self.backend._search_sync(unit_vector(2), 1)[0]
+        self.assertEqual(top.page_content, "c")
+        self.assertAlmostEqual(top.metadata["score"], 1.0, places=2)
+
+    def test_upsert_keeps_rows_after_flush(self) -> None:
+        self.backend.upsert(["p1"], [Document(page_content="a")], [unit_vector(0)])
+        self.backend.flush()
+        self.backend.upsert(["p1", "p2"], [Document(page_content="c"), Document(page_content="b")], [unit_vector(2), unit_vector(1)])
+        self.backend.flush()
+        reopened = NumpyBackend(Path(self.tmp.name) / "index", dtype=self.dtype)
+        self.assertEqual(reopened._search_sync(unit_vector(2), 1)[0].page_content, "c")
+        self.assertEqual(reopened._search_sync(unit_vector(1), 1)[0].page_content, "b")
+
+    def test_search_during_reupsert_sees_consistent_rows(self) -> None:
+        # Точка попеременно получает вектор оси 0 с текстом "x" и вектор оси 1 с текстом "y":
+        # поиск не должен видеть недописанный вектор или payload от другой версии
+        documents = {"x": Document(page_content="x"), "y": Document(page_content="y")}
+        self.backend.upsert(["p1"], [documents["x"]], [unit_vector(0)])
+        stop = threading.Event()
+
+        def writer() -> None:
+            versions = [("x", unit_vector(0)), ("y", unit_vector(1))]
+            i = 0
+            while not stop.is_set():
+                text, vector = versions[i % 2]
+                self.backend.upsert(["p1"], [documents[text]], [vector])
+                i += 1
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            for _ in range(3000):
+                doc = self.backend._search_sync(unit_vector(0), 1)[0]
+                expected = 1.0 if doc.page_content == "x" else 0.0
+                self.assertAlmostEqual(doc.metadata["score"], expected, places=2)
+        finally:
+            stop.set()
+            thread.join()
+
+
+class Int8NumpyBackendTest(NumpyBackendTest):
+    dtype = "int8"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Тесты сборки промпта: бюджет токенов по приоритету, склейка частей чанков и запасной подсчёт токенов.
+
+Запуск:
+    uv run python -m unittest discover -s tests -t .
+"""
+import sys
+import unittest
+from unittest.mock import patch
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.llm.prompt_builder import CHARS_PER_TOKEN, PromptBuilder, TokenCounter, merge_sibling_chunks
+
+PROMPT = ChatPromptTemplate.from_messages([("system", "{context}"), ("human", "{history}\n{question}")])
+
+
+def fallback_counter() -> TokenCounter:
+    """Счётчик без tiktoken: токены = ceil(символы / 3)."""
+    counter = TokenCounter("o200k_base")
+    with patch.dict(sys.modules, {"tiktoken": None}):
+        counter._get_encoding()
+    return counter
+
+
+def chunk(chunk_id: str, text: str, score: float = 0.5) -> dict:
+    return {"chunk_id": chunk_id, "text": text, "score": score, "source": "kb"}
+
+
+class TokenCounterTest(unittest.TestCase):
+    def test_falls_back_to_chars_per_token_without_tiktoken(self) -> None:
+        counter = fallback_counter()
+        self.assertIsNone(counter._encoding)
+        self.assertEqual(counter.count(""), 0)
+        self.assertEqual(counter.count("a" * CHARS_PER_TOKEN), 1)
+        self.assertEqual(counter.count("a" * (CHARS_PER_TOKEN + 1)), 2)
+
+    def test_falls_back_for_unknown_encoding(self) -> None:
+        counter = TokenCounter("missing_encoding")
+        self.assertEqual(counter.count("abcdef"), 2)
+
+    def test_uses_tiktoken(self) -> None:
+        try:
+            import tiktoken
+
+            encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            self.skipTest("нужен пакет tiktoken с кодировкой o200k_base")
+        text = "Как вывести деньги на карту?"
+        expected = len(encoding.encode(text))
+        self.assertEqual(TokenCounter("o200k_base").count(text), expected)
+
+
+class MergeSiblingChunksTest(unittest.TestCase):
+    def test_merges_adjacent_parts_without_overlap(self) -> None:
+        merged = merge_sibling_chunks(
+            [chunk("12_1", "world foo bar", 0.9), chunk("5_0", "other", 0.7), chunk("12_0", "hello world", 0.4)],
+            max_overlap=10,
+        )
+        self.assertEqual([item["chunk_id"] for item in merged], ["12_0+12_1", "5_0"])
+        self.assertEqual(merged[0]["text"], "hello world foo bar")
+        self.assertEqual(merged[0]["score"], 0.9)
+
+    def test_joins_non_adjacent_parts_in_order(self) -> None:
+        merged = merge_sibling_chunks([chunk("7_2", "third"), chunk("7_0", "first")], max_overlap=10)
+        self.assertEqual(merged, [chunk("7_2", "first third") | {"chunk_id": "7_0+7_2"}])
+
+    def test_drops_duplicate_texts(self) -> None:
+        merged = merge_sibling_chunks([chunk("1_0", "Один  текст"), chunk("2_0", "Один текст")], max_overlap=10)
+        self.assertEqual([item["chunk_id"] for item in merged], ["1_0"])
+
+    def test_keeps_single_parts(self) -> None:
+        chunks = [chunk("a", "без номера"), chunk("3_0", "часть")]
+        self.assertEqual(merge_sibling_chunks(chunks, max_overlap=10), chunks)
+
+
+class PromptBuilderTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.counter = fallback_counter()
+        # Тексты по 30 символов: 10 токенов + 2 на разделители
+        self.chunks = [chunk(f"{i}_0", f"{i}" * 30, score=1 - i / 10) for i in range(1, 4)]
+        self.history = [f"Пользователь: {'с' * 15}{age}" for age in range(4, 0, -1)]
+        self.question = "вопрос"
+        self.scenario = "контекст сценария"
+
+    def builder(self, extra_tokens: int) -> PromptBuilder:
+        """Бюджет: обязательная часть промпта плюс extra_tokens."""
+        builder = PromptBuilder(PROMPT, self.counter, max_tokens=0, max_overlap=10)
+        required = builder.base_tokens + self.counter.count(self.question) + self.counter.count(self.scenario)
+        builder.max_tokens = required + extra_tokens
+        return builder
+
+    def build(self, extra_tokens: int, summary: str = ""):
+        return self.builder(extra_tokens).build(self.question, self.scenario, self.chunks, summary, self.history)
+
+    def test_everything_fits(self) -> None:
+        built = self.build(1000)
+        self.assertEqual((built.dropped_chunks, built.dropped_history), (0, 0))
+        self.assertIn("[3] " + "3" * 30, built.inputs["context"])
+        self.assertEqual(built.inputs["history"], "\n".join(self.history))
+
+    def test_drops_lowest_priority_first(self) -> None:
+        # Лучший чанк (12), две последние реплики (по 12) и ещё один чанк (12)
+        built = self.build(48)
+        self.assertEqual(built.dropped_chunks, 1)
+        self.assertEqual(built.dropped_history, 2)
+        self.assertIn("[1] " + "1" * 30 + "\n\n[2] " + "2" * 30, built.inputs["context"])
+        self.assertNotIn("3" * 30, built.inputs["context"])
+        self.assertEqual(built.inputs["history"], "\n".join(self.history[-2:]))
+        self.assertLessEqual(built.tokens, self.builder(48).max_tokens)
+
+    def test_recent_history_before_other_chunks(self) -> None:
+        built = self.build(36)
+        self.assertEqual(built.dropped_chunks, 2)
+        self.assertEqual(built.inputs["history"], "\n".join(self.history[-2:]))
+
+    def test_required_parts_kept_without_budget(self) -> None:
+        built = self.build(0)
+        self.assertEqual((built.dropped_chunks, built.dropped_history), (3, 4))
+        self.assertTrue(built.inputs["context"].startswith(self.scenario))
+        self.assertEqual(built.inputs["question"], self.question)
+        self.assertEqual(built.inputs["history"], "Истории диалога нет.")
+
+    def test_history_is_not_interrupted(self) -> None:
+        # Самая старая реплика (8 токенов) поместилась бы в остаток 10, но предыдущая (12) не влезла
+        self.history[0] = "Пользователь: да"
+        built = self.build(36 + 24 + 10)
+        self.assertEqual(built.dropped_history, 2)
+        self.assertNotIn("Пользователь: да", built.inputs["history"])
+
+    def test_summary_has_recent_history_priority(self) -> None:
+        built = self.build(12 + 24 + self.counter.count("Резюме предыдущей части диалога: " + "р" * 20) + 2, summary="р" * 20)
+        self.assertEqual(built.dropped_chunks, 2)
+        self.assertTrue(built.inputs["history"].startswith("Резюме предыдущей части диалога: "))
@@ -0,0 +1,239 @@
+"""
+Тесты сценариев: компиляция плана, разбор ответов LLM на батч условий и выполнение веток.
+
+Запуск:
+    uv run python -m unittest discover -s tests -t .
+"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src.scenario.classifier import ConditionDecisionCache
+from src.scenario.nodes import NodeExecutor, parse_condition_answers
+from src.scenario.plan import EndStep, IfStep, ScenarioValidationError, TextStep, ToolStep, compile_scenario, iter_if_steps
+from src.scenario.runner import ScenarioRunner
+from src.settings import settings
+
+NESTED_SCENARIO = {
+    "name": "Вложенный",
+    "code": [
+        {"id": "1", "type": "text", "text": "Начало"},
+        {"id": "2", "type": "tool", "tool": "get_user_data"},
+        {
+            "id": "3",
+            "type": "if",
+            "condition": "Пользователь спрашивает о бонусах.",
+            "children": [
+                {
+                    "id": "3.1",
+                    "type": "if",
+                    "condition": "Пользователя зовут {=@get_user_data.name=}.",
+                    "children": [{"id": "3.1.1", "type": "text", "text": "Привет, {=@get_user_data.name=}!"}],
+                    "else_children": [{"id": "3.1.2", "type": "end"}],
+                },
+                {"id": "3.2", "type": "text", "text": "Бонусы"},
+                {"id": "3.3", "type": "end"},
+            ],
+            "else_children": [{"id": "3.4", "type": "text", "text": "Не про бонусы"}],
+        },
+        {"id": "4", "type": "text", "text": "Конец"},
+    ],
+}
+
+
+class ScriptedChatModel(FakeListChatModel):
+    """LLM, отвечающая заданными ответами по порядку и считающая вызовы."""
+
+    calls: int = 0
+
+    def _call(self, *args, **kwargs) -> str:
+        self.calls += 1
+        return super()._call(*args, **kwargs)
+
+
+def llm_answering(*responses: str) -> ScriptedChatModel:
+    return ScriptedChatModel(responses=list(responses))
+
+
+class CompileScenarioTest(unittest.TestCase):
+    def test_compiles_nested_if_and_end(self) -> None:
+        plan = compile_scenario(NESTED_SCENARIO)
+        self.assertEqual(plan.name, "Вложенный")
+        self.assertEqual([type(step) for step in plan.steps], [TextStep, ToolStep, IfStep, TextStep])
+
+        outer = plan.steps[2]
+        self.assertEqual([step.id for step in outer.then_steps], ["3.1", "3.2", "3.3"])
+        self.assertIsInstance(outer.then_steps[2], EndStep)
+        inner = outer.then_steps[0]
+        self.assertEqual(inner.else_steps, (EndStep("3.1.2"),))
+        self.assertEqual(inner.then_steps[0].template.render({"get_user_data": {"name": "Антон"}}), "Привет, Антон!")
+        self.assertEqual([step.id for step in iter_if_steps(plan.steps)], ["3", "3.1"])
+
+    def test_batches_only_message_conditions(self) -> None:
+        plan = compile_scenario(NESTED_SCENARIO)
+        # Условие 3.1 ссылается на результат tool и проверяется по месту
+        self.assertEqual(plan.message_conditions, {"3": "Пользователь спрашивает о бонусах."})
+        self.assertEqual(plan.eager_tools, ("get_user_data",))
+
+    def test_eager_tools_stop_at_possible_end(self) -> None:
+        plan = compile_scenario(
+            {
+                "code": [
+                    {"id": "1", "type": "if", "condition": "Условие", "children": [{"id": "1.1", "type": "end"}]},
+                    {"id": "2", "type": "tool", "tool": "get_user_data"},
+                ]
+            }
+        )
+        self.assertEqual(plan.eager_tools, ())
+
+    def assertInvalid(self, code: list, message: str) -> None:
+        with self.assertRaisesRegex(ScenarioValidationError, message):
+            compile_scenario({"code": code})
+
+    def test_rejects_unknown_tool(self) -> None:
+        self.assertInvalid([{"id": "1", "type": "tool", "tool": "missing"}], "неизвестный tool")
+
+    def test_rejects_duplicate_id(self) -> None:
+        self.assertInvalid(
+            [
+                {"id": "1", "type": "text", "text": "a"},
+                {"id": "2", "type": "if", "condition": "c", "children": [{"id": "1", "type": "end"}]},
+            ],
+            "повторяющийся id",
+        )
+
+    def test_rejects_variable_before_tool(self) -> None:
+        self.assertInvalid(
+            [
+                {"id": "1", "type": "text", "text": "{=@get_user_data.name=}"},
+                {"id": "2", "type": "tool", "tool": "get_user_data"},
+            ],
+            "до их выполнения",
+        )
+
+    def test_rejects_variable_from_one_branch(self) -> None:
+        self.assertInvalid(
+            [
+                {"id": "1", "type": "if", "condition": "c", "children": [{"id": "1.1", "type": "tool", "tool": "get_user_data"}]},
+                {"id": "2", "type": "text", "text": "{=@get_user_data.name=}"},
+            ],
+            "до их выполнения",
+        )
+
+    def test_rejects_malformed_nodes(self) -> None:
+        self.assertInvalid([{"type": "text", "text": "a"}], "нет id")
+        self.assertInvalid([{"id": "1", "type": "loop"}], "неизвестный тип")
+        self.assertInvalid([{"id": "1", "type": "if"}], "нет условия")
+        self.assertInvalid([{"id": "1", "type": "if", "condition": "c", "children": {}}], "ожидается список")
+        self.assertInvalid([{"id": "1", "type": "if", "condition": "c", "examples": {"yes": "да"}}], "examples")
+
+
+class ParseConditionAnswersTest(unittest.TestCase):
+    def test_parses_answers_in_order(self) -> None:
+        self.assertEqual(parse_condition_answers('{"1": "да", "2": "Нет", "3": true}', 3), [True, False, True])
+
+    def test_ignores_text_around_json(self) -> None:
+        self.assertEqual(parse_condition_answers('Ответ:\n{"2": "no", "1": "yes"}\nГотово', 2), [True, False])
+
+    def test_rejects_partial_answers(self) -> None:
+        self.assertIsNone(parse_condition_answers('{"1": "да"}', 2))
+        self.assertIsNone(parse_condition_answers('{"1": "да", "2": "возможно"}', 2))
+
+    def test_rejects_malformed_json(self) -> None:
+        self.assertIsNone(parse_condition_answers("да, нет", 2))
+        self.assertIsNone(parse_condition_answers('{"1": "да", "2": }', 2))
+        self.assertIsNone(parse_condition_answers('{"1": ["да"]}', 1))
+
+
+class CheckConditionsTest(unittest.IsolatedAsyncioTestCase):
+    conditions = {"a": "Условие А", "b": "Условие Б"}
+
+    async def check(self, llm: ScriptedChatModel) -> dict[str, bool]:
+        with patch("src.scenario.nodes.get_llm", return_value=llm):
+            executor = NodeExecutor()
+        return await executor.check_conditions(self.conditions, "сообщение")
+
+    async def test_batch_answer(self) -> None:
+        llm = llm_answering('{"1": "нет", "2": "да"}')
+        self.assertEqual(await self.check(llm), {"a": False, "b": True})
+        self.assertEqual(llm.calls, 1)
+
+    async def test_falls_back_to_single_checks_on_partial_answer(self) -> None:
+        llm = llm_answering('{"1": "да"}', "да", "нет")
+        self.assertEqual(await self.check(llm), {"a": True, "b": False})
+        self.assertEqual(llm.calls, 3)
+
+    async def test_falls_back_to_single_checks_on_malformed_answer(self) -> None:
+        llm = llm_answering("Не могу ответить", "нет", "да")
+        self.assertEqual(await self.check(llm), {"a": False, "b": True})
+        self.assertEqual(llm.calls, 3)
+
+
+class DecisionCacheTest(unittest.IsolatedAsyncioTestCase):
+    conditions = {"a": "Условие А", "b": "Условие Б"}
+
+    async def check(self, cache: ConditionDecisionCache, message: str, *responses: str) -> tuple[dict[str, bool], int]:
+        llm = llm_answering(*responses)
+        with patch("src.scenario.nodes.get_llm", return_value=llm):
+            executor = NodeExecutor(decision_cache=cache)
+        return await executor.check_conditions(self.conditions, message), llm.calls
+
+    async def test_llm_decisions_are_cached_by_normalized_message(self) -> None:
+        cache = ConditionDecisionCache(max_size=10)
+        self.assertEqual(await self.check(cache, "Сегодня мой день рождения!", '{"1": "да", "2": "нет"}'), ({"a": True, "b": False}, 1))
+        self.assertEqual(await self.check(cache, "сегодня мой день рождения", "не вызывается"), ({"a": True, "b": False}, 0))
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    async def test_only_missing_conditions_go_to_llm(self) -> None:
+        cache = ConditionDecisionCache(max_size=10)
+        cache.put("Условие А", "привет", False)
+        self.assertEqual(await self.check(cache, "Привет", "да"), ({"a": False, "b": True}, 1))
+        self.assertTrue(cache.get("Условие Б", "привет"))
+
+    def test_evicts_least_recently_used(self) -> None:
+        cache = ConditionDecisionCache(max_size=2)
+        cache.put("А", "1", True)
+        cache.put("А", "2", True)
+        cache.get("А", "1")
+        cache.put("А", "3", False)
+        self.assertIsNone(cache.get("А", "2"))
+        self.assertTrue(cache.get("А", "1"))
+
+
+class ScenarioRunnerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        path = Path(self.tmp.name) / "scenario.json"
+        path.write_text(json.dumps(NESTED_SCENARIO, ensure_ascii=False), encoding="utf-8")
+        with patch.object(settings, "scenario_json_file", str(path)):
+            self.runner = ScenarioRunner()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    async def run_with(self, *responses: str) -> tuple[str, str]:
+        with patch("src.scenario.nodes.get_llm", return_value=llm_answering(*responses)):
+            return await self.runner.run("сообщение")
+
+    async def test_branch_ends_early(self) -> None:
+        context, last_step = await self.run_with("да", "да")
+        self.assertEqual(context, "Начало\nПривет, Антон!\nБонусы")
+        self.assertEqual(last_step, "3.3")
+
+    async def test_nested_end_stops_scenario(self) -> None:
+        context, last_step = await self.run_with("да", "нет")
+        self.assertEqual(context, "Начало")
+        self.assertEqual(last_step, "3.1.2")
+
+    async def test_else_branch_continues(self) -> None:
+        context, last_step = await self.run_with("нет")
+        self.assertEqual(context, "Начало\nНе про бонусы\nКонец")
+        self.assertEqual(last_step, "4")
+
+
+if __name__ == "__main__":
+    unittest.main()